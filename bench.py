@@ -0,0 +1,826 @@
+"""
+Benchmarks do interpretador Ruspy.
+
+Uso:
+    python bench.py startup [--runs N]
+    python bench.py parsers [--runs N]
+    python bench.py reload [--runs N]
+    python bench.py stream [--runs N]
+    python bench.py lexer [--runs N]
+    python bench.py adversarial [--runs N]
+    python bench.py ast [--runs N]
+    python bench.py flat [--runs N]
+    python bench.py engines [--runs N]
+    python bench.py vm [--runs N]
+    python bench.py env [--runs N]
+    python bench.py dce [--runs N]
+    python bench.py tail [--runs N]
+    python bench.py memo [--runs N]
+    python bench.py stack [--runs N]
+    python bench.py range [--runs N]
+    python bench.py jumps [--runs N]
+    python bench.py calls [--runs N]
+    python bench.py quicken [--runs N]
+    python bench.py cons [--runs N]
+
+O módulo avaliado é o mesmo escolhido pelos testes: ruspy.py ou
+ruspy-<RUSPY>.py, caindo para ruspy-tmp.py caso não exista.
+"""
+import contextlib
+import gc
+import io
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+from statistics import median
+from types import SimpleNamespace
+
+PATH = Path(__file__).parent
+
+
+def ruspy_path() -> Path:
+    """
+    Localiza o arquivo do interpretador da mesma forma que conftest.py.
+    """
+    mod = os.environ.get("RUSPY", "")
+    if mod:
+        mod = "-" + mod
+    path = PATH / ("ruspy" + mod + ".py")
+    if not mod and not path.exists():
+        path = PATH / "ruspy-tmp.py"
+    return path
+
+
+def load_ruspy():
+    """
+    Carrega o interpretador como um namespace.
+    """
+    with open(ruspy_path(), "rb") as fd:
+        src = fd.read()
+    ns = {}
+    exec(compile(src, "ruspy.py", "exec"), ns)
+    return SimpleNamespace(**ns)
+
+
+def timeit(fn, runs):
+    """
+    Executa fn() runs vezes e retorna a mediana dos tempos em segundos.
+    """
+    times = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return median(times)
+
+
+def report(title, rows):
+    print(title)
+    width = max(len(name) for name, _ in rows)
+    for name, value in rows:
+        print(f"  {name:<{width}}  {value}")
+    print()
+
+
+# Benchmarks ------------------------------------------------------------------
+
+
+def bench_startup(runs=5):
+    """
+    Tempo para importar o interpretador em um processo novo, com o cache de
+    tabelas LALR vazio (cold) e populado (warm).
+    """
+    code = (
+        "import sys; sys.argv = ['ruspy.py'];"
+        f"exec(compile(open({str(ruspy_path())!r}, 'rb').read(), 'ruspy.py', 'exec'), {{}})"
+    )
+    cache_dir = tempfile.mkdtemp(prefix="ruspy-bench-")
+    env = {**os.environ, "RUSPY_CACHE_DIR": cache_dir}
+
+    def spawn():
+        subprocess.run([sys.executable, "-c", code], env=env, check=True)
+
+    def cold():
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        spawn()
+
+    try:
+        t_cold = timeit(cold, runs)
+        t_warm = timeit(spawn, runs)
+    finally:
+        shutil.rmtree(cache_dir, ignore_errors=True)
+
+    report(
+        f"startup (mediana de {runs} processos)",
+        [
+            ("cold", f"{t_cold * 1000:8.1f} ms"),
+            ("warm", f"{t_warm * 1000:8.1f} ms"),
+            ("speedup", f"{t_cold / t_warm:8.2f}x"),
+        ],
+    )
+
+
+def retained(fn):
+    """
+    Executa fn() e retorna (resultado, bytes alocados que continuam vivos).
+    """
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        result = fn()
+        after = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return result, after - before
+
+
+def bench_parsers(runs=3):
+    """
+    Custo de construção e memória residente de um parser por símbolo inicial
+    versus um único parser com vários símbolos iniciais (sem cache em disco).
+    """
+    ruspy = load_ruspy()
+    starts = ruspy.START
+
+    def separate():
+        return [ruspy.make_parser(s, cache_dir=False) for s in starts]
+
+    def shared():
+        return ruspy.make_parser(starts, cache_dir=False)
+
+    _, mem_sep = retained(separate)
+    _, mem_shared = retained(shared)
+    t_sep = timeit(separate, runs)
+    t_shared = timeit(shared, runs)
+
+    report(
+        f"parsers para {', '.join(starts)} (mediana de {runs} construções)",
+        [
+            ("separados", f"{t_sep * 1000:8.1f} ms  {mem_sep / 1024:8.0f} KiB"),
+            ("compartilhado", f"{t_shared * 1000:8.1f} ms  {mem_shared / 1024:8.0f} KiB"),
+        ],
+    )
+
+
+def bench_reload(runs=5):
+    """
+    Latência para alterar uma única função em módulos de tamanhos crescentes:
+    recarga completa com module() versus LiveModule.update()/edit().
+    """
+    ruspy = load_ruspy()
+    rows = []
+    for n in [100, 1000, 5000]:
+        src = "\n".join(f"fn f{i}(x) {{ x + {i} }}" for i in range(n))
+        target = f"fn f{n // 2}(x) {{ x + {n // 2} }}"
+        edited = src.replace(target, f"fn f{n // 2}(x) {{ x * 2 }}")
+        pos = src.index(target)
+        live = ruspy.LiveModule(src)
+
+        def full():
+            tree = ruspy.grammar_mod.parse(edited)
+            ruspy.RuspyTransformer().transform(tree)
+
+        def update():
+            live.update(edited)
+            live.update(src)
+
+        replacement = f"fn f{n // 2}(x) {{ x * 2 }}"
+
+        def edit():
+            live.edit(pos, pos + len(target), replacement)
+            live.edit(pos, pos + len(replacement), target)
+
+        rows.append(
+            (
+                f"{n} fns",
+                f"module() {timeit(full, runs) * 1000:8.2f} ms   "
+                f"update() {timeit(update, runs) / 2 * 1000:6.2f} ms   "
+                f"edit() {timeit(edit, runs) / 2 * 1000:6.2f} ms",
+            )
+        )
+    report(f"recarga de uma função (mediana de {runs})", rows)
+
+
+def peak(fn):
+    """
+    Executa fn() e retorna (resultado, pico de memória alocada em bytes).
+    """
+    tracemalloc.start()
+    try:
+        result = fn()
+        _, top = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return result, top
+
+
+def bench_stream(runs=1):
+    """
+    Pico de memória e tempo ao executar scripts longos de comandos no nível
+    superior, lendo o arquivo inteiro (eval) ou em fluxo (exec_stream).
+    """
+    ruspy = load_ruspy()
+    rows = []
+    for lines in [10_000, 50_000]:
+        with tempfile.NamedTemporaryFile("w", suffix=".rpy", delete=False) as fd:
+            fd.write("x = 0;\n")
+            for i in range(lines):
+                fd.write(f"x = x + {i} * 2;\n")
+            fd.write("x\n")
+        size = os.path.getsize(fd.name)
+
+        def whole():
+            with open(fd.name) as f:
+                return ruspy.eval(f.read())
+
+        def stream():
+            with open(fd.name) as f:
+                return ruspy.exec_stream(f, chunk_size=64 * 1024)
+
+        try:
+            for name, fn in [("eval", whole), ("exec_stream", stream)]:
+                ruspy.PARSE_CACHE.clear()
+                _, mem = peak(fn)
+                ruspy.PARSE_CACHE.clear()
+                t = timeit(fn, runs)
+                rows.append(
+                    (
+                        f"{size / 1024:6.0f} KiB {name}",
+                        f"pico {mem / 1024 / 1024:7.1f} MiB   {t:6.2f} s",
+                    )
+                )
+        finally:
+            os.unlink(fd.name)
+    report("execução de scripts longos", rows)
+
+
+def bench_lexer(runs=5):
+    """
+    Tokens por segundo do DfaLexer (tabelas de um DFA mínimo) comparado ao
+    lexer padrão do Lark (alternativas de expressões regulares), sobre os
+    exemplos repetidos até formar uma entrada grande.
+    """
+    ruspy = load_ruspy()
+    sources = [p.read_text() for p in sorted((PATH / "exemplos").glob("*.rpy"))]
+    text = "\n".join(sources * 200)
+    dfa = ruspy.parser.parser.lexer
+    n = sum(1 for _ in dfa.tokenize(text))
+
+    def lark_lexer():
+        for _ in ruspy.parser.lex(text):
+            pass
+
+    def dfa_lexer():
+        for _ in dfa.tokenize(text):
+            pass
+
+    t_lark = timeit(lark_lexer, runs)
+    t_dfa = timeit(dfa_lexer, runs)
+    build = timeit(lambda: ruspy.DfaLexer(ruspy.parser.lexer_conf, cache_dir=False), 1)
+    report(
+        f"lexer: {n} tokens, {len(text) / 1024:.0f} KiB (mediana de {runs})",
+        [
+            ("lark", f"{n / t_lark / 1000:8.0f} mil tokens/s"),
+            ("dfa", f"{n / t_dfa / 1000:8.0f} mil tokens/s"),
+            ("dfa (estados)", f"{dfa.dfa.size:8d} x {dfa.dfa.width} classes"),
+            ("dfa (construção)", f"{build * 1000:8.1f} ms"),
+        ],
+    )
+
+
+ADVERSARIAL = {
+    "string longa": lambda n: '"' + "a" * n + '"',
+    "string aberta": lambda n: '"' + "a" * n,
+    "escapes": lambda n: '"' + "\\n" * n + '"',
+    "escape inválido": lambda n: '"' + "\\n" * n + "\\q",
+    "comentário longo": lambda n: "/*" + " *" * n + "*/",
+    "comentários abertos": lambda n: "/* " * n,
+    "asteriscos": lambda n: "/*" + "*" * n,
+}
+
+
+def bench_adversarial(runs=3):
+    """
+    Custo por byte para rejeitar ou aceitar entradas adversárias (strings e
+    comentários longos, não terminados ou com escapes inválidos). O DfaLexer
+    deve manter o custo constante à medida que a entrada cresce.
+    """
+    ruspy = load_ruspy()
+    dfa = ruspy.parser.parser.lexer
+    sizes = [1_000, 4_000, 16_000]
+
+    def consume(tokens):
+        try:
+            for _ in tokens:
+                pass
+        except ruspy.LarkError:
+            pass
+
+    rows = []
+    for name, make in ADVERSARIAL.items():
+        for lexer, lex in [("dfa", dfa.tokenize), ("lark", ruspy.parser.lex)]:
+            costs = []
+            for n in sizes:
+                text = make(n)
+                t = timeit(lambda: consume(lex(text)), runs)
+                costs.append(f"{t / len(text) * 1e9:9.0f}")
+            rows.append((f"{name} ({lexer})", " ".join(costs)))
+    report(f"ns/byte para entradas de {sizes} repetições (mediana de {runs})", rows)
+
+
+def bench_ast(runs=5):
+    """
+    Tempo e pico de memória para analisar e carregar módulos: árvore do Lark
+    seguida do transformer versus nós Node construídos durante a análise.
+    """
+    ruspy = load_ruspy()
+    pair = (PATH / "exemplos" / "pair.rpy").read_text()
+    big = "\n".join(
+        f"fn f{i}(x, y) {{ let z = x * {i} + y; if z > {i} {{ z - 1 }} else {{ z + 1.5 }} }}"
+        for i in range(5_000)
+    )
+
+    def lark_tree(src):
+        return ruspy.grammar_mod.parse(src)
+
+    def ast(src):
+        return ruspy.ast_mod.parse(src)
+
+    rows = []
+    for label, src in [("pair.rpy", pair), ("5000 fns", big)]:
+        for name, parse in [("lark Tree", lark_tree), ("Node", ast)]:
+            t_parse = timeit(lambda: parse(src), runs)
+            t_load = timeit(lambda: ruspy.RuspyTransformer().transform(parse(src)), runs)
+            tree, mem = retained(lambda: parse(src))
+            _, top = peak(lambda: ruspy.RuspyTransformer().transform(parse(src)))
+            rows.append(
+                (
+                    f"{label} {name}",
+                    f"parse {t_parse * 1000:8.2f} ms   parse+carga {t_load * 1000:8.2f} ms   "
+                    f"árvore {mem / 1024:8.0f} KiB   pico {top / 1024:8.0f} KiB",
+                )
+            )
+            del tree
+    report(f"construção da árvore (mediana de {runs})", rows)
+
+
+def bench_flat(runs=5):
+    """
+    Memória, tamanho serializado e tempo de serialização da árvore do Lark,
+    da árvore de nós Node e da FlatAst para um módulo grande.
+    """
+    import pickle
+
+    ruspy = load_ruspy()
+    src = "\n".join(
+        f"fn f{i}(x, y) {{ let z = x * {i} + y; if z > {i} {{ z - 1 }} else {{ z + 1.5 }} }}"
+        for i in range(2_000)
+    )
+    tree = ruspy.grammar_mod.parse(src)
+    _, mem_tree = retained(lambda: ruspy.grammar_mod.parse(src))
+    _, mem_node = retained(lambda: ruspy.ast_mod.parse(src))
+    flat, mem_flat = retained(lambda: ruspy.FlatAst.from_tree(tree))
+
+    sys.setrecursionlimit(100_000)
+    data_tree = pickle.dumps(tree)
+    data_flat = flat.tobytes()
+    t_dump_tree = timeit(lambda: pickle.dumps(tree), runs)
+    t_load_tree = timeit(lambda: pickle.loads(data_tree), runs)
+    t_dump_flat = timeit(flat.tobytes, runs)
+
+    with tempfile.TemporaryDirectory() as folder:
+        path = os.path.join(folder, "mod.ast")
+        flat.save(path)
+        t_load_flat = timeit(lambda: ruspy.FlatAst.load(path), runs)
+        loaded = ruspy.FlatAst.load(path)
+        t_walk = timeit(lambda: sum(loaded.kind[i] for i in range(len(loaded))), runs)
+        del loaded
+
+    report(
+        f"árvore de {len(flat)} nós (mediana de {runs})",
+        [
+            ("memória lark Tree", f"{mem_tree / 1024:8.0f} KiB"),
+            ("memória Node", f"{mem_node / 1024:8.0f} KiB"),
+            ("memória FlatAst", f"{mem_flat / 1024:8.0f} KiB"),
+            (
+                "pickle Tree",
+                f"{len(data_tree) / 1024:8.0f} KiB  "
+                f"dump {t_dump_tree * 1000:7.1f} ms  load {t_load_tree * 1000:7.1f} ms",
+            ),
+            (
+                "FlatAst",
+                f"{len(data_flat) / 1024:8.0f} KiB  "
+                f"dump {t_dump_flat * 1000:7.1f} ms  mmap {t_load_flat * 1000:7.3f} ms",
+            ),
+            ("percorrer (mmap)", f"{t_walk * 1000:8.1f} ms"),
+        ],
+    )
+
+
+def bench_engines(runs=3):
+    """
+    Tempo de execução de exemplos/fib.rpy e pair.rpy (carga do módulo e
+    main()) em cada mecanismo de execução. A análise sintática fica fora da
+    medida e a saída de println é descartada.
+    """
+    ruspy = load_ruspy()
+    rows = []
+    for name in ["fib", "pair"]:
+        src = (PATH / "exemplos" / f"{name}.rpy").read_text()
+        tree = ruspy.ast_mod.parse(src)
+        times = {}
+        for engine, execute in ruspy.ENGINES.items():
+
+            def run():
+                with contextlib.redirect_stdout(io.StringIO()):
+                    execute(tree)["main"]()
+
+            times[engine] = timeit(run, runs)
+        base = times["tree"]
+        for engine, t in times.items():
+            rows.append((f"{name}.rpy {engine}", f"{t * 1000:9.2f} ms  ({base / t:5.1f}x)"))
+    report(f"mecanismos de execução (mediana de {runs})", rows)
+
+
+def bench_vm(runs=3):
+    """
+    Instruções por segundo da máquina virtual em exemplos/fib.rpy e
+    pair.rpy, e tamanho/tempo da serialização dos objetos de código.
+    """
+    ruspy = load_ruspy()
+    rows = []
+    for name in ["fib", "pair"]:
+        src = (PATH / "exemplos" / f"{name}.rpy").read_text()
+        code = ruspy.BytecodeCompiler().compile(ruspy.ast_mod.parse(src))
+        vm = ruspy.VirtualMachine()
+
+        def run():
+            with contextlib.redirect_stdout(io.StringIO()):
+                vm.run(code, ruspy.new_env())["main"]()
+
+        run()
+        count, vm.instructions = vm.instructions, 0
+        t = timeit(run, runs)
+        data = code.tobytes()
+        t_load = timeit(lambda: ruspy.CodeObject.frombytes(data), runs)
+        rows.append(
+            (
+                f"{name}.rpy",
+                f"{count:9d} instruções  {t * 1000:8.2f} ms  {count / t / 1e6:6.2f} M instr/s  "
+                f"código {len(data):6d} bytes  carga {t_load * 1e6:7.1f} µs",
+            )
+        )
+    report(f"máquina virtual (mediana de {runs})", rows)
+
+
+def bench_env(runs=5, calls=10_000):
+    """
+    Custo de criar o ambiente global (new_env()) e de avaliar uma expressão
+    pequena, com a tabela de nomes pré-definidos normal e 10x maior. A cópia
+    da tabela, usada antes das camadas, aparece como referência.
+    """
+    ruspy = load_ruspy()
+    tree = ruspy.ast_expr.parse("x = 1; x + 1")
+    rows = []
+    for scale in [1, 10]:
+        names = {f"{k}_{i}": v for i in range(scale) for k, v in ruspy.BUILTINS.items()}
+        base = ruspy.MappingProxyType(names)
+
+        def copy():
+            for _ in range(calls):
+                ruspy.ChainMap({}, names.copy())
+
+        def layer():
+            for _ in range(calls):
+                ruspy.Namespace(base=base)
+
+        def run():
+            for _ in range(calls):
+                ruspy.run_closure(tree, ruspy.Namespace(base=base))
+
+        for label, fn in [("cópia", copy), ("camadas", layer), ("camadas + eval", run)]:
+            t = timeit(fn, runs)
+            rows.append((f"{len(names):5d} nomes {label}", f"{t / calls * 1e6:8.2f} µs/chamada"))
+    report(f"ambiente global (mediana de {runs})", rows)
+
+
+def generated_module(n) -> str:
+    """
+    Módulo com n funções no estilo de código gerado: ramos desativados,
+    comandos depois de return e definições sem uso.
+    """
+    fns = []
+    for i in range(n):
+        fns.append(
+            f"fn f{i}(x) {{\n"
+            f"    let debug = false;\n"
+            f"    let unused = |y| y * {i};\n"
+            f"    if false {{ println(\"f{i}\", x, x * 2, x + {i}) }};\n"
+            f"    while false {{ x = x + 1 }};\n"
+            f"    return x + {i};\n"
+            f"    println(x);\n"
+            f"    x\n"
+            f"}}\n"
+        )
+    return "".join(fns)
+
+
+def bench_dce(runs=3, n=2000):
+    """
+    Efeito da remoção de código morto num módulo gerado grande: nós
+    removidos, memória da árvore e tempo de carga (compilação para closures
+    e definição das funções).
+    """
+    ruspy = load_ruspy()
+    tree = ruspy.ast_mod.parse(generated_module(n))
+    dce = ruspy.DeadCodeEliminator()
+    optimized = dce.eliminate(ruspy.ConstantFolder().fold(tree))
+    t_opt = timeit(lambda: ruspy.optimize(tree), runs)
+    rows = [("nós removidos", f"{dce.removed} de {ruspy.count_nodes(tree)}"), ("otimização", f"{t_opt * 1000:8.2f} ms")]
+    for label, t in [("original", tree), ("otimizada", optimized)]:
+        t_load = timeit(lambda: ruspy.run_closure(t), runs)
+        rows.append((f"árvore {label}", f"{ruspy.tree_size(t) / 2**20:6.2f} MiB  carga {t_load * 1000:8.2f} ms"))
+    report(f"código morto, {n} funções (mediana de {runs})", rows)
+
+
+TAIL_SRC = """
+fn build(n, acc) { if n == 0 { acc } else { build(n - 1, cons(n, acc)) } }
+fn len(lst, n) { if lst == null { return n }; return len(tail(lst), n + 1) }
+fn even(n) { if n == 0 { true } else { odd(n - 1) } }
+fn odd(n) { n != 0 && even(n - 1) }
+"""
+
+
+def bench_tail(runs=1):
+    """
+    Recursão em cauda com listas longas no estilo de exemplos/pair.rpy:
+    constrói a lista, inverte com rjoin e mede o comprimento; even/odd testa
+    a recursão mútua.
+    """
+    ruspy = load_ruspy()
+    src = (PATH / "exemplos" / "pair.rpy").read_text() + TAIL_SRC
+    rows = []
+    for engine in ["tree", "closure", "vm", "python"]:
+        mod = ruspy._eval_or_exec(src, True, engine)
+        for n in [1_000, 10_000, 100_000]:
+
+            def run():
+                lst = mod["reverse"](mod["build"](n, None))
+                assert mod["len"](lst, 0) == n and mod["even"](n)
+
+            try:
+                t = timeit(run, runs)
+            except RecursionError:
+                rows.append((f"{engine} n={n}", "RecursionError"))
+            else:
+                rows.append((f"{engine} n={n}", f"{t * 1000:9.2f} ms  {t / n * 1e6:6.2f} µs/elemento"))
+    report(f"chamadas em cauda (mediana de {runs})", rows)
+
+
+def bench_memo(runs=3):
+    """
+    exemplos/fib.rpy com e sem a memorização automática de funções puras
+    (mecanismo closure), e a taxa de acerto do cache de fib.
+    """
+    ruspy = load_ruspy()
+    src = (PATH / "exemplos" / "fib.rpy").read_text()
+    rows = []
+    for label, extra in [("memo", ""), ("nomemo", "nomemo(fib);")]:
+        tree = ruspy.ast_mod.parse(src + extra)
+        stats = {}
+
+        def run():
+            with contextlib.redirect_stdout(io.StringIO()):
+                mod = ruspy.run_closure(tree)
+                mod["main"]()
+            stats.update(ruspy.memo_stats(mod))
+
+        t = timeit(run, runs)
+        info = f"  acertos {stats['fib']['hit_rate']:6.1%}" if stats else ""
+        rows.append((f"fib.rpy {label}", f"{t * 1000:9.2f} ms{info}"))
+    report(f"memorização (mediana de {runs})", rows)
+
+
+def bench_stack(runs=1):
+    """
+    Cadeias a + a + ... + a geradas com 1 mil a 100 mil termos: análise
+    sintática, otimização e execução em cada mecanismo. As árvores têm a
+    mesma profundidade que o número de termos.
+    """
+    ruspy = load_ruspy()
+    rows = []
+    for n in [1_000, 10_000, 100_000]:
+        src = "a = 1; " + " + ".join(["a"] * n)
+        tree = ruspy.ast_expr.parse(src)
+        times = [("análise", timeit(lambda: ruspy.ast_expr.parse(src), runs))]
+        times.append(("otimização", timeit(lambda: ruspy.optimize(tree), runs)))
+        for engine, execute in ruspy.ENGINES.items():
+            times.append((engine, timeit(lambda: execute(tree), runs)))
+        rows.append((f"n={n}", "  ".join(f"{label} {t * 1000:8.2f} ms" for label, t in times)))
+    report(f"árvores profundas (mediana de {runs})", rows)
+
+
+RANGE_LOOPS = {
+    "laço dedicado": "f = |n| ({ s = 0; for i in 0..n { s = s + i }; s }); f",
+    "laço genérico": "f = |n| ({ s = 0; r = 0..n; for i in r { s = s + i }; s }); f",
+}
+
+
+def bench_range(runs=1, max_exp=8):
+    """
+    Laços for de 10^3 a 10^8 iterações no mecanismo closure, com o laço
+    dedicado a intervalos de inteiros e com o laço genérico (o intervalo
+    guardado numa variável antes do laço).
+    """
+    ruspy = load_ruspy()
+    rows = []
+    fns = {label: ruspy._eval_or_exec(src, engine="closure") for label, src in RANGE_LOOPS.items()}
+    for exp in range(3, max_exp + 1):
+        n = 10**exp
+        for label, fn in fns.items():
+            t = timeit(lambda: fn(n), runs)
+            rows.append((f"10^{exp} {label}", f"{t * 1000:10.2f} ms  {t / n * 1e9:6.1f} ns/iteração"))
+    report(f"laços for sobre intervalos (mediana de {runs})", rows)
+
+
+JUMP_PROGRAMS = {
+    "break/continue": "f = |n| ({ s = 0; for i in 0..n { if i % 3 == 0 { continue }; if i > n { break }; s = s + i }; s }); f",
+    "while + break": "f = |n| ({ s = 0; i = 0; while true { i = i + 1; if i > n { break }; s = s + i }; s }); f",
+    "return em if": (
+        "g = |x| ({ if x > 5 { return 1 }; if x > 2 { return 2 }; 3 }); "
+        "f = |n| ({ s = 0; for i in 0..n { s = s + g(i % 10) }; s }); f"
+    ),
+    "return em laço": (
+        "g = |n| ({ for i in 0..n { if i == 5 { return i } }; 0 }); "
+        "f = |n| ({ s = 0; for j in 0..n { s = s + g(10) }; s }); f"
+    ),
+}
+
+
+def bench_jumps(runs=3, n=100_000):
+    """
+    Laços com break/continue frequentes e funções com return antecipado em
+    ramos de if, em cada mecanismo de execução.
+    """
+    ruspy = load_ruspy()
+    rows = []
+    for label, src in JUMP_PROGRAMS.items():
+        for engine in ruspy.ENGINES:
+            fn = ruspy._eval_or_exec(src, engine=engine)
+            t = timeit(lambda: fn(n), runs)
+            rows.append((f"{label} {engine}", f"{t * 1000:9.2f} ms  {t / n * 1e9:7.1f} ns/iteração"))
+    report(f"return, break e continue, n={n} (mediana de {runs})", rows)
+
+
+CALL_PROGRAMS = {
+    "pair.rpy sort/map": (
+        (PATH / "exemplos" / "pair.rpy").read_text()
+        + "fn lista(n, acc) { if n == 0 { acc } else { lista(n - 1, cons((n * 7919) % 1000, acc)) } } "
+        + "fn bench(n) { let l = lista(n, null); sort(l); map(|x| x + 1, l); 0 }",
+        120,
+    ),
+    "builtins": ("fn bench(n) { s = 0; for i in 0..n { s = s + max(i, 3) + abs(-i) + min(1, 2, 3) }; s } nomemo(bench);", 100_000),
+    "funções Ruspy": (
+        "fn add3(a, b, c) { a + b + c } fn um(x) { x } "
+        "fn bench(n) { s = 0; for i in 0..n { s = s + add3(i, 1, 2) + um(i) }; s } "
+        "nomemo(add3); nomemo(um); nomemo(bench);",
+        100_000,
+    ),
+}
+
+
+def bench_calls(runs=3):
+    """
+    Programas dominados por chamadas de função (mecanismo closure): a
+    ordenação de listas de exemplos/pair.rpy, laços que chamam builtins e
+    laços que chamam funções Ruspy com vários argumentos.
+    """
+    ruspy = load_ruspy()
+    rows = []
+    for label, (src, n) in CALL_PROGRAMS.items():
+        mod = ruspy._eval_or_exec(src, True, "closure")
+        t = timeit(lambda: mod["bench"](n), runs)
+        rows.append((f"{label} n={n}", f"{t * 1000:9.2f} ms"))
+    report(f"chamadas de função (mediana de {runs})", rows)
+
+
+QUICKEN_PROGRAMS = {
+    "dígitos (int)": "fn bench(n) { s = 0; for i in 0..n { x = i; while x > 0 { s = s + x % 10; x = x / 10 } }; s }",
+    "collatz (int)": (
+        "fn bench(n) { s = 0; for i in 1..n / 10 { x = i; while x != 1 { "
+        "if x % 2 == 0 { x = x / 2 } else { x = 3 * x + 1 }; s = s + 1 } }; s }"
+    ),
+    "float": "fn bench(n) { s = 0.0; for i in 0..n { x = i * 1.5; s = s + x / 2.5 + x % 3.0 }; s }",
+}
+
+
+def bench_quicken(runs=3, n=30_000):
+    """
+    Laços dominados por / e % (mecanismo closure), com a especialização por
+    tipos ligada e desligada, e os contadores de quicken_stats().
+    """
+    ruspy = load_ruspy()
+    rows = []
+    for label, src in QUICKEN_PROGRAMS.items():
+        for quicken in [True, False]:
+            # Sem QUICKEN_OPERATORS, / e % usam o operador do RuspyTransformer
+            namespace = ruspy._eval_or_exec.__globals__
+            operators = namespace["QUICKEN_OPERATORS"]
+            if not quicken:
+                namespace["QUICKEN_OPERATORS"] = {}
+            try:
+                ruspy.quicken_stats(clear=True)
+                mod = ruspy._eval_or_exec(src + " nomemo(bench);", True, "closure")
+                t = timeit(lambda: mod["bench"](n), runs)
+            finally:
+                namespace["QUICKEN_OPERATORS"] = operators
+            stats = ruspy.quicken_stats()
+            info = f"  {stats['specialized']}/{stats['sites']} pontos especializados"
+            rows.append((f"{label} {'quicken' if quicken else 'genérico'}", f"{t * 1000:9.2f} ms{info}"))
+    report(f"especialização de / e %, n={n} (mediana de {runs})", rows)
+
+
+def bench_cons(runs=1, n=1_000_000):
+    """
+    Listas de n células criadas com cons de exemplos/pair.rpy (mecanismo
+    closure): tempo, coletas do gc durante a construção e memória por célula.
+    """
+    ruspy = load_ruspy()
+    src = (PATH / "exemplos" / "pair.rpy").read_text()
+    src += " fn lista(n) { l = null; for i in 0..n { l = cons(i, l) }; l }"
+    mod = ruspy._eval_or_exec(src, True, "closure")
+
+    collections = []
+
+    def callback(phase, info):
+        if phase == "start":
+            collections.append(time.perf_counter())
+        else:
+            collections[-1] = time.perf_counter() - collections[-1]
+
+    rows = []
+    gc.collect()
+    gc.callbacks.append(callback)
+    try:
+        t = timeit(lambda: mod["lista"](n), runs)
+    finally:
+        gc.callbacks.remove(callback)
+    rows.append(("construção", f"{t * 1000:9.2f} ms"))
+    rows.append(("coletas do gc", f"{len(collections) // runs:9d}    {sum(collections) / runs * 1000:9.2f} ms"))
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        cells = mod["lista"](n // 10)
+        size, _ = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del cells
+    rows.append(("memória por célula", f"{size / (n // 10):9.1f} bytes"))
+    report(f"cons, n={n} (mediana de {runs})", rows)
+
+
+BENCHMARKS = {
+    "startup": bench_startup,
+    "parsers": bench_parsers,
+    "reload": bench_reload,
+    "stream": bench_stream,
+    "lexer": bench_lexer,
+    "adversarial": bench_adversarial,
+    "ast": bench_ast,
+    "flat": bench_flat,
+    "engines": bench_engines,
+    "vm": bench_vm,
+    "env": bench_env,
+    "dce": bench_dce,
+    "tail": bench_tail,
+    "memo": bench_memo,
+    "stack": bench_stack,
+    "range": bench_range,
+    "jumps": bench_jumps,
+    "calls": bench_calls,
+    "quicken": bench_quicken,
+    "cons": bench_cons,
+}
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    if not args or "--help" in args:
+        print(__doc__)
+        print("Benchmarks disponíveis:", ", ".join(BENCHMARKS))
+        exit()
+
+    runs = {}
+    if "--runs" in args:
+        i = args.index("--runs")
+        runs = {"runs": int(args[i + 1])}
+        del args[i : i + 2]
+
+    for name in args:
+        BENCHMARKS[name](**runs)
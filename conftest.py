@@ -17,6 +17,9 @@ from hypothesis import settings
 settings.register_profile("fast", max_examples=25)
 PATH = Path(__file__).parent
 EXTRA_SRC = r'''
+from itertools import islice as _islice
+
+
 class _fn:
     def __init__(self, fn):
         self.fn = fn
@@ -28,9 +31,37 @@ class _fn:
         return self.fn(src)
         
 
-grammar_seq = Lark(GRAMMAR, parser="lalr", start="seq")
-grammar_expr = Lark(GRAMMAR, parser="lalr", start="expr")
-grammar_mod = Lark(GRAMMAR, parser="lalr", start="mod")
+class _entry:
+    def __init__(self, parser, start):
+        self.parser = parser
+        self.start = start
+
+    def __repr__(self):
+        return f"grammar_{self.start}"
+
+    def parse(self, src):
+        return self.parser.parse(src, start=self.start)
+
+    def lex(self, src):
+        # Usa o lexer instalado no parser (ex.: DfaLexer), se oferecer tokenize()
+        lexer = self.parser.parser.lexer
+        if hasattr(lexer, "tokenize"):
+            return lexer.tokenize(src)
+        return self.parser.lex(src)
+
+
+# Um único parser com vários símbolos iniciais. Reaproveita o parser do módulo
+# (ou o seu cache de tabelas LALR), quando existir.
+_starts = ["seq", "expr", "mod"]
+_parser = globals().get("parser")
+if not (isinstance(_parser, Lark) and set(_starts) <= set(_parser.options.start)):
+    _make_parser = globals().get("make_parser") or (
+        lambda start: Lark(GRAMMAR, parser="lalr", start=start)
+    )
+    _parser = _make_parser(_starts)
+grammar_seq = _entry(_parser, "seq")
+grammar_expr = _entry(_parser, "expr")
+grammar_mod = _entry(_parser, "mod")
 
 @_fn
 def eval(src):
@@ -56,11 +87,15 @@ def _eval_or_exec(src: str, grammar) -> Any:
     try:
         tree = grammar.parse(src)
     except LarkError as ex:
+        # Diagnóstico limitado a uma janela em volta do erro, quando o módulo
+        # oferece syntax_error(); senão, lista apenas os primeiros tokens.
+        if "syntax_error" in globals():
+            raise syntax_error(src, ex, grammar) from ex
         lines = [
-            f"Erro avaliando a expressão: \n{src}",
+            f"Erro avaliando a expressão: \n{src[:2000]}",
             "",
             "Imprimindo tokens",
-            *(f" - {i}) {tk} ({tk.type})" for i, tk in enumerate(grammar.lex(src), start=1)),
+            *(f" - {i}) {tk} ({tk.type})" for i, tk in enumerate(_islice(grammar.lex(src), 50), start=1)),
         ]
         prefix = '\n'.join(lines)
         raise lark.LarkError(f'{prefix}\n\n{type(ex).__name__}: {ex}')
@@ -87,8 +122,7 @@ acrescentando um operador de ? antes do nome da regra.
 '''
 
 
-@pytest.fixture(scope="session")
-def mod():
+def load_ruspy() -> dict:
     mod = os.environ.get("RUSPY", "")
     if mod:
         mod = "-" + mod
@@ -100,6 +134,21 @@ def mod():
         src = fd.read()
     ns = {}
     exec(compile(src, "ruspy.py", "exec"), ns)
+    return ns
+
+
+@pytest.fixture(scope="session")
+def ruspy():
+    """
+    Módulo do interpretador exatamente como declarado, sem as substituições
+    feitas por EXTRA_SRC.
+    """
+    return SimpleNamespace(**load_ruspy(), PATH=PATH)
+
+
+@pytest.fixture(scope="session")
+def mod():
+    ns = load_ruspy()
     ns_orig = ns.copy()
 
     if "GRAMMAR" not in ns:
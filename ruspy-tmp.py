@@ -1,9 +1,27 @@
+from array import array
+import ast
+from bisect import bisect_left, bisect_right
 import builtins
+from collections import ChainMap, OrderedDict
+from copy import copy, deepcopy
+import hashlib
+import marshal
 import math
-from operator import truediv
+import mmap
+import os
+import pickle
+import re
+from operator import itemgetter, truediv
+import struct
 import sys
+import tempfile
+from types import GeneratorType, MappingProxyType
 from typing import Any
+import lark
 from lark import Lark, InlineTransformer, LarkError, Token, Tree
+from lark.exceptions import UnexpectedCharacters
+from lark.lexer import Lexer, _regexp_has_newline
+from lark.parsers.lalr_parser import _Parser
 
 # Constantes (algumas tarefas pedem para incluir variáveis específicas nesta
 # parte do arquivo)
@@ -161,8 +179,10 @@ FLOAT_SUFFIX : "f32" | "f64"
 BEGIN     : /^/ 
 END       : /$/ 
 
-// Strings
-STRING    : /"(\w|\W|\d|\\n|\\r|\\t|\\'|\\"|\\\\|\\0|\\x[0-9a-fA-F]|\\u\{([0-9a-fA-F]_*){1,6}\})*"/
+// Strings: cada caractere é um escape válido ou qualquer coisa exceto " e \.
+// As alternativas começam por caracteres distintos, o que garante uma
+// varredura linear mesmo em strings longas ou não terminadas.
+STRING    : /"([^"\\]|\\([nrt'"\\0]|x[0-9a-fA-F]{2}|u\{([0-9a-fA-F]_*){1,6}\}))*"/
 
 // Nomes de variáveis, valores especiais
 ID           : /[a-zA-Z][a-zA-Z0-9_]*|_[a-zA-Z0-9_]+/
@@ -171,13 +191,1018 @@ RESERVED     : /true|false|null/
 // Comentários
 COMMENT      : LINE_COMMENT | BLOCK_COMMENT
 LINE_COMMENT : /\/\/.*/
-BLOCK_COMMENT: /\/\*.*\*\//
+BLOCK_COMMENT: /\/\*([^*]|\*+[^*\/])*\*+\//
 
 %ignore COMMENT
 %ignore /\s+/
 """
-grammar_expr = Lark(GRAMMAR, parser="lalr", start="seq")
-grammar_mod = Lark(GRAMMAR, parser="lalr", start="mod")
+
+
+# Cache das tabelas LALR ------------------------------------------------------
+
+# A análise da gramática e a construção das tabelas LALR dominam o tempo de
+# inicialização do interpretador. Salvamos o parser já analisado em disco,
+# indexado por uma hash da gramática e do símbolo inicial, e o recarregamos nas
+# próximas execuções. Uma gramática diferente produz outra hash e, portanto,
+# outro arquivo: o cache antigo simplesmente deixa de ser usado.
+#
+# O diretório pode ser escolhido pela variável de ambiente RUSPY_CACHE_DIR.
+# Atribua CACHE_DIR = None (ou passe cache_dir=False) para desabilitar o cache.
+#
+# Os arquivos do cache são lidos com pickle, que pode executar código: o
+# diretório padrão é do próprio usuário (nunca o diretório temporário
+# compartilhado) e é criado com permissão 0700. Arquivos ou diretórios de
+# outro usuário, ou que outros usuários podem alterar, são ignorados.
+
+
+def default_cache_dir() -> str:
+    """
+    Diretório de cache do usuário atual: $XDG_CACHE_HOME/ruspy, ~/.cache/ruspy
+    ou, sem um diretório pessoal, ruspy-<uid> no diretório temporário.
+    """
+    xdg = os.environ.get("XDG_CACHE_HOME")
+    if xdg and os.path.isabs(xdg):
+        return os.path.join(xdg, "ruspy")
+    home = os.path.expanduser("~")
+    if home != "~" and os.path.isdir(home):
+        return os.path.join(home, ".cache", "ruspy")
+    user = os.getuid() if hasattr(os, "getuid") else os.environ.get("USERNAME", "user")
+    return os.path.join(tempfile.gettempdir(), f"ruspy-{user}")
+
+
+CACHE_DIR = os.environ.get("RUSPY_CACHE_DIR") or default_cache_dir()
+
+
+def open_cache(path):
+    """
+    Abre um arquivo do cache para leitura. Levanta PermissionError se o
+    arquivo ou o diretório pertencem a outro usuário ou podem ser alterados
+    pelo grupo ou por outros usuários.
+    """
+    fd = open(path, "rb")
+    try:
+        if hasattr(os, "getuid"):
+            folder = os.stat(os.path.dirname(os.path.abspath(path)))
+            for info in (folder, os.fstat(fd.fileno())):
+                if info.st_uid != os.getuid() or info.st_mode & 0o022:
+                    raise PermissionError(f"arquivo de cache inseguro: {path}")
+    except BaseException:
+        fd.close()
+        raise
+    return fd
+
+
+def cache_path(start, grammar=GRAMMAR, cache_dir=None, **options) -> str:
+    """
+    Caminho do arquivo de cache para a gramática e símbolo inicial dados.
+    """
+    opts = sorted(
+        (k, repr(v)) for k, v in options.items() if k not in ("transformer", "tree_class")
+    )
+    key = repr((grammar, start, opts, lark.__version__, sys.version_info[:2]))
+    digest = hashlib.sha256(key.encode("utf8")).hexdigest()[:32]
+    name = start if isinstance(start, str) else "+".join(start)
+    return os.path.join(cache_dir or CACHE_DIR, f"lalr-{name}-{digest}.pickle")
+
+
+def make_parser(start, grammar=GRAMMAR, cache_dir=None, **options) -> Lark:
+    """
+    Cria um parser LALR para o símbolo inicial start (ou lista de símbolos),
+    reaproveitando as tabelas salvas em disco sempre que possível.
+
+    A escrita é feita em um arquivo temporário no mesmo diretório e depois
+    renomeada com os.replace(), que é atômico. Vários processos podem popular o
+    cache ao mesmo tempo sem que nenhum leia um arquivo incompleto.
+    """
+    if cache_dir is None:
+        cache_dir = CACHE_DIR
+    if not cache_dir:
+        return Lark(grammar, parser="lalr", start=start, **options)
+
+    path = cache_path(start, grammar, cache_dir, **options)
+    try:
+        with open_cache(path) as fd:
+            # Lark.load() não repassa opções; _load() aceita as que não alteram
+            # as tabelas (transformer, lexer_callbacks etc).
+            return Lark.__new__(Lark)._load(fd, **options)
+    except Exception:
+        # Arquivo inexistente, inseguro, corrompido ou de outra versão do lark.
+        pass
+
+    parser = Lark(grammar, parser="lalr", start=start, **options)
+    atomic_dump(path, lambda fd: save_tables(parser, fd))
+    return parser
+
+
+def atomic_dump(path, dump):
+    """
+    Escreve um arquivo de cache chamando dump(f) e o publica atomicamente.
+
+    Falhas de escrita são ignoradas: o cache é só uma otimização. O diretório
+    é criado com permissão 0700.
+    """
+    try:
+        os.makedirs(os.path.dirname(os.path.abspath(path)), mode=0o700, exist_ok=True)
+        atomic_write(path, dump)
+    except (OSError, pickle.PicklingError):
+        pass
+
+
+def atomic_write(path, dump):
+    """
+    Escreve path chamando dump(f) num arquivo temporário no mesmo diretório,
+    que depois substitui path com os.replace().
+
+    Leitores (inclusive quem mapeou o arquivo antigo com mmap) nunca veem um
+    arquivo incompleto.
+    """
+    folder = os.path.dirname(os.path.abspath(path))
+    os.makedirs(folder, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=folder, prefix=".tmp-", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            dump(f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def save_tables(parser: Lark, fd):
+    """
+    Salva o parser sem o transformer e a classe de árvore, que não fazem parte
+    das tabelas e nem sempre podem ser serializados.
+    """
+    options = parser.options.options
+    saved = {k: options.pop(k) for k in ("transformer", "tree_class") if k in options}
+    try:
+        parser.save(fd)
+    finally:
+        options.update(saved)
+
+
+# Autômatos e scanner DFA -----------------------------------------------------
+
+# Os terminais da gramática são convertidos num único autômato finito
+# determinístico mínimo, seguindo as etapas de test_automatos.py:
+#
+#   regex --Thompson--> NFA-ε --eliminação de ε--> NFA --subconjuntos--> DFA
+#         --Hopcroft--> DFA mínimo --> tabelas de transição
+#
+# O alfabeto é particionado em classes de caracteres equivalentes (todos os
+# dígitos decimais, por exemplo, costumam cair na mesma classe), o que mantém as
+# tabelas pequenas. Caracteres fora do ASCII são classificados pelas
+# propriedades usadas nas expressões regulares (\w, \d, \s).
+
+ASCII_CHARS = [chr(i) for i in range(128)]
+ASCII_FULL = (1 << 128) - 1
+
+# Propriedades de um caractere não-ASCII: (\w, \d, \s)
+UNI_FEATURES = frozenset(
+    (w, d, sp) for w in (0, 1) for d in (0, 1) for sp in (0, 1) if w or not d
+)
+
+
+def uni_features(ch) -> tuple:
+    return (int(ch.isalnum() or ch == "_"), int(ch.isdecimal()), int(ch.isspace()))
+
+
+class CharSet:
+    """
+    Conjunto de caracteres: uma máscara de bits para o ASCII e o conjunto de
+    combinações de propriedades aceitas para os demais caracteres.
+    """
+
+    __slots__ = ("mask", "uni")
+
+    def __init__(self, mask=0, uni=frozenset()):
+        self.mask = mask
+        self.uni = frozenset(uni)
+
+    @classmethod
+    def chars(cls, chars):
+        mask = 0
+        for ch in chars:
+            if ord(ch) >= 128:
+                raise RegexNotSupported(f"caractere não-ASCII {ch!r}")
+            mask |= 1 << ord(ch)
+        return cls(mask)
+
+    @classmethod
+    def escape(cls, name):
+        # \w, \d, \s e seus complementos, com o mesmo significado do módulo re
+        regex = re.compile("\\" + name.lower())
+        mask = sum(1 << i for i, ch in enumerate(ASCII_CHARS) if regex.match(ch))
+        feature = "wds".index(name.lower())
+        result = cls(mask, {f for f in UNI_FEATURES if f[feature]})
+        return ~result if name.isupper() else result
+
+    def __or__(self, other):
+        return CharSet(self.mask | other.mask, self.uni | other.uni)
+
+    def __invert__(self):
+        return CharSet(ASCII_FULL & ~self.mask, UNI_FEATURES - self.uni)
+
+    def __contains__(self, ch):
+        o = ord(ch)
+        if o < 128:
+            return bool(self.mask >> o & 1)
+        return uni_features(ch) in self.uni
+
+
+ANY_BUT_NEWLINE = ~CharSet.chars("\n")
+
+
+class RegexNotSupported(ValueError):
+    """
+    Expressão regular usa recursos que não podem ser representados num DFA
+    (retrovisores, lookahead, modificadores etc).
+    """
+
+
+class RegexParser:
+    """
+    Analisador descendente recursivo para o subconjunto de expressões regulares
+    do Python usado pelos terminais do Lark.
+
+    Produz tuplas: ("set", CharSet), ("cat", [...]), ("alt", [...]),
+    ("rep", x, min, max), ("bol",) e ("eol",). max=None indica repetição
+    ilimitada.
+    """
+
+    SIMPLE_ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "f": "\f", "v": "\v", "a": "\a", "0": "\0"}
+
+    def __init__(self, pattern):
+        self.src = pattern
+        self.pos = 0
+
+    def parse(self):
+        node = self.alt()
+        if self.pos != len(self.src):
+            raise RegexNotSupported(f"{self.src!r}: erro na posição {self.pos}")
+        return node
+
+    def peek(self):
+        return self.src[self.pos : self.pos + 1]
+
+    def take(self):
+        ch = self.src[self.pos]
+        self.pos += 1
+        return ch
+
+    def alt(self):
+        options = [self.cat()]
+        while self.peek() == "|":
+            self.pos += 1
+            options.append(self.cat())
+        return options[0] if len(options) == 1 else ("alt", options)
+
+    def cat(self):
+        items = []
+        while self.peek() not in ("", "|", ")"):
+            items.append(self.repeat())
+        return items[0] if len(items) == 1 else ("cat", items)
+
+    def repeat(self):
+        node = self.atom()
+        while True:
+            ch = self.peek()
+            if ch == "*":
+                lo, hi = 0, None
+            elif ch == "+":
+                lo, hi = 1, None
+            elif ch == "?":
+                lo, hi = 0, 1
+            elif ch == "{" and re.match(r"\{\d*(,\d*)?\}", self.src[self.pos :]):
+                m = re.match(r"\{(\d*)(,(\d*))?\}", self.src[self.pos :])
+                lo = int(m.group(1) or 0)
+                hi = lo if m.group(2) is None else (int(m.group(3)) if m.group(3) else None)
+                self.pos += m.end() - 1
+            else:
+                return node
+            self.pos += 1
+            if self.peek() in ("?", "+"):
+                raise RegexNotSupported(f"{self.src!r}: quantificador preguiçoso/possessivo")
+            node = ("rep", node, lo, hi)
+
+    def atom(self):
+        ch = self.take()
+        if ch == "(":
+            if self.peek() == "?":
+                if self.src.startswith("?:", self.pos):
+                    self.pos += 2
+                elif self.src.startswith("?P<", self.pos):
+                    self.pos = self.src.index(">", self.pos) + 1
+                else:
+                    raise RegexNotSupported(f"{self.src!r}: grupo especial")
+            node = self.alt()
+            if self.peek() != ")":
+                raise RegexNotSupported(f"{self.src!r}: parênteses desbalanceados")
+            self.pos += 1
+            return node
+        if ch == "[":
+            return ("set", self.char_class())
+        if ch == ".":
+            return ("set", ANY_BUT_NEWLINE)
+        if ch == "^":
+            return ("bol",)
+        if ch == "$":
+            return ("eol",)
+        if ch == "\\":
+            return ("set", self.escape())
+        if ch in "*+?)":
+            raise RegexNotSupported(f"{self.src!r}: {ch!r} inesperado")
+        return ("set", CharSet.chars(ch))
+
+    def escape(self, in_class=False):
+        ch = self.take()
+        if ch in "wWdDsS":
+            return CharSet.escape(ch)
+        if ch in self.SIMPLE_ESCAPES:
+            return CharSet.chars(self.SIMPLE_ESCAPES[ch])
+        if ch == "x":
+            code, self.pos = self.src[self.pos : self.pos + 2], self.pos + 2
+            return CharSet.chars(chr(int(code, 16)))
+        if ch == "b" and in_class:
+            return CharSet.chars("\b")
+        if ch.isalnum():
+            raise RegexNotSupported(f"{self.src!r}: escape \\{ch}")
+        return CharSet.chars(ch)
+
+    def char_class(self):
+        negate = self.peek() == "^"
+        if negate:
+            self.pos += 1
+        result = CharSet()
+        first = True
+        while True:
+            if self.pos >= len(self.src):
+                raise RegexNotSupported(f"{self.src!r}: classe não terminada")
+            ch = self.take()
+            if ch == "]" and not first:
+                break
+            first = False
+            if ch == "\\":
+                item = self.escape(in_class=True)
+            else:
+                item = CharSet.chars(ch)
+            if self.peek() == "-" and self.src[self.pos + 1 : self.pos + 2] not in ("]", ""):
+                self.pos += 1
+                end = self.take()
+                end = self.escape(in_class=True) if end == "\\" else CharSet.chars(end)
+                lo, hi = item.mask.bit_length() - 1, end.mask.bit_length() - 1
+                item = CharSet(sum(1 << i for i in range(lo, hi + 1)))
+            result = result | item
+        return ~result if negate else result
+
+
+class NFA:
+    """
+    Autômato finito não-determinístico.
+
+    As transições são rotuladas por conjuntos de símbolos (frozenset de classes
+    de caracteres); eps guarda as transições vazias. accept mapeia estados de
+    aceite para o índice do terminal reconhecido.
+    """
+
+    def __init__(self):
+        self.edges = []
+        self.eps = []
+        self.accept = {}
+
+    def state(self):
+        self.edges.append([])
+        self.eps.append([])
+        return len(self.edges) - 1
+
+    # Construção de Thompson. Cada fragmento tem um único estado inicial e um
+    # único estado final, ligados aos vizinhos por transições vazias.
+    def thompson(self, node, symbols):
+        kind = node[0]
+        start, end = self.state(), self.state()
+        if kind == "set":
+            self.edges[start].append((symbols(node[1]), end))
+        elif kind in ("bol", "eol"):
+            self.edges[start].append((frozenset([kind]), end))
+        elif kind == "cat":
+            prev = start
+            for item in node[1]:
+                a, b = self.thompson(item, symbols)
+                self.eps[prev].append(a)
+                prev = b
+            self.eps[prev].append(end)
+        elif kind == "alt":
+            for item in node[1]:
+                a, b = self.thompson(item, symbols)
+                self.eps[start].append(a)
+                self.eps[b].append(end)
+        elif kind == "rep":
+            _, item, lo, hi = node
+            prev = start
+            for _ in range(lo):
+                a, b = self.thompson(item, symbols)
+                self.eps[prev].append(a)
+                prev = b
+            if hi is None:
+                a, b = self.thompson(item, symbols)
+                self.eps[prev].extend([a, end])
+                self.eps[b].extend([a, end])
+            else:
+                for _ in range(hi - lo):
+                    a, b = self.thompson(item, symbols)
+                    self.eps[prev].extend([a, end])
+                    prev = b
+            self.eps[prev].append(end)
+        return start, end
+
+    def closure(self, states) -> frozenset:
+        seen = set(states)
+        stack = list(states)
+        while stack:
+            for nxt in self.eps[stack.pop()]:
+                if nxt not in seen:
+                    seen.add(nxt)
+                    stack.append(nxt)
+        return frozenset(seen)
+
+    def without_epsilon(self, start, rank):
+        """
+        Elimina as transições vazias. Cada estado passa a ter as transições e
+        o aceite de todos os estados do seu fecho-ε. Somente estados
+        alcançáveis a partir de start são mantidos.
+        """
+        nfa = NFA()
+        index = {}
+        todo = [start]
+        index[start] = nfa.state()
+        while todo:
+            q = todo.pop()
+            new = index[q]
+            closure = self.closure([q])
+            accepted = [self.accept[p] for p in closure if p in self.accept]
+            if accepted:
+                nfa.accept[new] = min(accepted, key=rank)
+            for p in closure:
+                for symbols, target in self.edges[p]:
+                    if target not in index:
+                        index[target] = nfa.state()
+                        todo.append(target)
+                    nfa.edges[new].append((symbols, index[target]))
+        return nfa, index[start]
+
+
+class DFA:
+    """
+    Autômato finito determinístico representado por tabelas compactas.
+
+    O estado 0 é o estado morto. table[estado * width + classe] dá o próximo
+    estado e accept[estado] o índice do terminal aceito (ou -1).
+    """
+
+    def __init__(self, table, width, accept, start, start_bol, ascii_class, uni_class):
+        self.table = table
+        self.width = width
+        self.accept = accept
+        self.start = start
+        self.start_bol = start_bol
+        self.ascii_class = ascii_class
+        self.uni_class = uni_class
+
+    @property
+    def size(self):
+        return len(self.accept)
+
+    def serialize(self) -> dict:
+        return {
+            "table": self.table.tobytes(),
+            "typecode": self.table.typecode,
+            "width": self.width,
+            "accept": list(self.accept),
+            "start": self.start,
+            "start_bol": self.start_bol,
+            "ascii_class": list(self.ascii_class),
+            "uni_class": dict(self.uni_class),
+        }
+
+    @classmethod
+    def deserialize(cls, data):
+        table = array(data["typecode"])
+        table.frombytes(data["table"])
+        return cls(
+            table,
+            data["width"],
+            data["accept"],
+            data["start"],
+            data["start_bol"],
+            data["ascii_class"],
+            data["uni_class"],
+        )
+
+    @classmethod
+    def from_regexes(cls, patterns, rank=None):
+        """
+        Constrói o DFA mínimo que reconhece a união das expressões regulares
+        dadas. rank(i) ordena os terminais quando vários aceitam a mesma
+        entrada (o menor vence).
+        """
+        rank = rank or (lambda i: i)
+        trees = [RegexParser(p).parse() for p in patterns]
+
+        # Classes de caracteres: caracteres que pertencem exatamente aos mesmos
+        # conjuntos são indistinguíveis para o autômato.
+        sets = []
+        collect = [*trees]
+        while collect:
+            node = collect.pop()
+            if node[0] == "set":
+                sets.append(node[1])
+            elif node[0] in ("cat", "alt"):
+                collect.extend(node[1])
+            elif node[0] == "rep":
+                collect.append(node[1])
+        signatures = {}
+        ascii_class = []
+        for i in range(128):
+            sig = tuple(s.mask >> i & 1 for s in sets)
+            ascii_class.append(signatures.setdefault(sig, len(signatures)))
+        uni_class = {}
+        for f in sorted(UNI_FEATURES):
+            sig = tuple(int(f in s.uni) for s in sets)
+            uni_class[f] = signatures.setdefault(sig, len(signatures))
+        n_classes = len(signatures)
+        bol, eol = n_classes, n_classes + 1
+        width = n_classes + 2
+
+        def symbols(charset):
+            result = set()
+            for i, c in enumerate(ascii_class):
+                if charset.mask >> i & 1:
+                    result.add(c)
+            for f, c in uni_class.items():
+                if f in charset.uni:
+                    result.add(c)
+            return frozenset(result)
+
+        def symbol_ids(syms):
+            return [bol if s == "bol" else eol if s == "eol" else s for s in syms]
+
+        # Thompson: um NFA-ε com um ramo para cada terminal
+        nfa = NFA()
+        start = nfa.state()
+        for i, tree in enumerate(trees):
+            a, b = nfa.thompson(tree, symbols)
+            nfa.eps[start].append(a)
+            nfa.accept[b] = i
+
+        # Eliminação de transições vazias
+        nfa, start = nfa.without_epsilon(start, rank)
+        moves = [
+            [(symbol_ids(syms), target) for syms, target in edges] for edges in nfa.edges
+        ]
+
+        # Construção dos subconjuntos. O estado morto (conjunto vazio) é o 0.
+        dead = frozenset()
+        states = {dead: 0}
+        order = [dead]
+        trans = [[0] * width]
+        accept = [-1]
+
+        def add(subset):
+            try:
+                return states[subset]
+            except KeyError:
+                states[subset] = len(order)
+                order.append(subset)
+                accepted = [nfa.accept[q] for q in subset if q in nfa.accept]
+                accept.append(min(accepted, key=rank) if accepted else -1)
+                trans.append(None)
+                return states[subset]
+
+        def explore(i):
+            # Calcula as transições de todos os subconjuntos a partir do i-ésimo
+            while i < len(order):
+                targets = [set() for _ in range(width)]
+                for q in order[i]:
+                    for syms, target in moves[q]:
+                        for sym in syms:
+                            targets[sym].add(target)
+                trans[i] = [add(frozenset(t)) for t in targets]
+                i += 1
+            return i
+
+        s0 = frozenset([start])
+        add(s0)
+        done = explore(1)
+        # Na posição 0, as transições com ^ podem ser usadas sem consumir nada.
+        s0_bol = add(s0 | order[trans[1][bol]])
+        explore(done)
+
+        return cls.minimize(trans, accept, width, 1, s0_bol, ascii_class, uni_class)
+
+    @classmethod
+    def minimize(cls, trans, accept, width, start, start_bol, ascii_class, uni_class):
+        """
+        Minimização de Hopcroft: refina a partição inicial (estados agrupados
+        pelo terminal aceito) até que estados do mesmo bloco sejam
+        indistinguíveis.
+        """
+        n = len(trans)
+        inverse = [[[] for _ in range(n)] for _ in range(width)]
+        for q, row in enumerate(trans):
+            for c, target in enumerate(row):
+                inverse[c][target].append(q)
+
+        groups = {}
+        for q, label in enumerate(accept):
+            groups.setdefault(label, set()).add(q)
+        partition = [frozenset(g) for g in groups.values()]
+        block_of = [0] * n
+        for b, block in enumerate(partition):
+            for q in block:
+                block_of[q] = b
+        work = set(range(len(partition)))
+
+        while work:
+            splitter = partition[work.pop()]
+            for c in range(width):
+                preds = set()
+                for q in splitter:
+                    preds.update(inverse[c][q])
+                if not preds:
+                    continue
+                touched = {}
+                for q in preds:
+                    touched.setdefault(block_of[q], set()).add(q)
+                for b, inside in touched.items():
+                    block = partition[b]
+                    if len(inside) == len(block):
+                        continue
+                    outside = block - inside
+                    partition[b] = frozenset(inside)
+                    partition.append(frozenset(outside))
+                    nb = len(partition) - 1
+                    for q in outside:
+                        block_of[q] = nb
+                    if b in work or len(inside) > len(outside):
+                        work.add(nb)
+                    else:
+                        work.add(b)
+
+        # Renumera os blocos mantendo o estado morto como 0.
+        renum = {block_of[0]: 0}
+        for q in range(n):
+            renum.setdefault(block_of[q], len(renum))
+        size = len(renum)
+        table = array("H" if size < 1 << 16 else "I", bytes(0))
+        table.extend([0] * (size * width))
+        new_accept = [-1] * size
+        for q in range(n):
+            s = renum[block_of[q]]
+            new_accept[s] = accept[q]
+            for c, target in enumerate(trans[q]):
+                table[s * width + c] = renum[block_of[target]]
+        return cls(
+            table,
+            width,
+            new_accept,
+            renum[block_of[start]],
+            renum[block_of[start_bol]],
+            ascii_class,
+            uni_class,
+        )
+
+
+class DfaLexer(Lexer):
+    """
+    Lexer do Lark guiado pelas tabelas de um DFA mínimo construído a partir
+    dos terminais da gramática.
+
+    Sempre produz o token mais longo. Em caso de empate, vence o terminal de
+    maior prioridade e, depois, strings literais (palavras reservadas) sobre
+    expressões regulares, como no lexer padrão do Lark.
+    """
+
+    def __init__(self, conf, cache_dir=None):
+        terminals = list(conf.terminals)
+        self.names = [t.name for t in terminals]
+        self.priority = [t.priority for t in terminals]
+        self.ignore_types = frozenset(conf.ignore)
+        self.callback = dict(conf.callbacks or {})
+        self.terminals_by_name = conf.terminals_by_name
+        self.newline_types = frozenset(
+            t.name for t in terminals if _regexp_has_newline(t.pattern.to_regexp())
+        )
+        if conf.g_regex_flags:
+            raise RegexNotSupported("modificadores globais de regex")
+
+        # Ordem de preferência entre terminais que aceitam o mesmo lexema
+        order = {
+            i: (-t.priority, t.pattern.type != "str", -t.pattern.max_width, -len(t.pattern.value), t.name)
+            for i, t in enumerate(terminals)
+        }
+        patterns = [t.pattern.to_regexp() for t in terminals]
+        self.dfa = load_dfa(patterns, [order[i] for i in range(len(terminals))], cache_dir)
+        self.rows = [
+            self.dfa.table[s * self.dfa.width : (s + 1) * self.dfa.width]
+            for s in range(self.dfa.size)
+        ]
+        self.translation = dict(enumerate(self.dfa.ascii_class))
+        self.known_chars = set(ASCII_CHARS)
+        self.accel = self.accelerators()
+
+    def accelerators(self):
+        # Estados com laço em quase todo o alfabeto (corpo de identificadores,
+        # strings, comentários...) consomem as repetições com uma única busca
+        # de expressão regular, em vez de caractere a caractere.
+        dfa = self.dfa
+        accel = [None] * dfa.size
+        for s in range(1, dfa.size):
+            row = dfa.table[s * dfa.width : (s + 1) * dfa.width]
+            loop = {c for c, target in enumerate(row) if target == s}
+            if not loop:
+                continue
+            # A quebra de linha nunca é acelerada, pois pode preceder um $.
+            ascii_in = "".join(
+                ch for ch, c in zip(ASCII_CHARS, dfa.ascii_class) if c in loop and ch != "\n"
+            )
+            ascii_out = "".join(
+                ch for ch, c in zip(ASCII_CHARS, dfa.ascii_class) if c not in loop or ch == "\n"
+            )
+            uni = {c in loop for c in dfa.uni_class.values()}
+            if uni == {False} and ascii_in:
+                accel[s] = re.compile(f"[{re.escape(ascii_in)}]*").match
+            elif uni == {True}:
+                accel[s] = re.compile(f"[^{re.escape(ascii_out)}]*").match
+        return accel
+
+    def classify(self, text) -> bytes:
+        """
+        Converte text na sequência das classes de cada caractere (um byte por
+        caractere), feita de uma só vez com str.translate().
+        """
+        dfa = self.dfa
+        table = self.translation
+        for ch in set(text) - self.known_chars:
+            table[ord(ch)] = dfa.uni_class[uni_features(ch)]
+            self.known_chars.add(ch)
+        return text.translate(table).encode("latin-1")
+
+    def match(self, text, pos, classes=None, dead=None, bol=True):
+        """
+        Retorna (lexema, tipo) do token mais longo a partir de pos, ou None.
+        Com bol=False, text continua um texto anterior e ^ não casa na
+        posição 0.
+
+        dead é um conjunto de pares (estado, posição) dos quais se sabe que
+        nenhum token pode ser aceito. Ele é atualizado a cada varredura que
+        avança além do último aceite, de modo que nenhum par é percorrido
+        mais de uma vez sem sucesso: a tokenização inteira fica linear no
+        tamanho do texto, mesmo com comentários ou strings não terminados.
+        """
+        if classes is None:
+            classes = self.classify(text)
+        rows, accept, eol = self.rows, self.dfa.accept, self.dfa.width - 1
+        priority, accel = self.priority, self.accel
+        n = len(text)
+        stride = n + 1
+
+        state = self.dfa.start_bol if pos == 0 and bol else self.dfa.start
+        best = accept[state]
+        best_end = pos
+        best_prio = priority[best] if best >= 0 else -1 << 30
+        i = pos
+        while True:
+            if i >= n - 1 and (i == n or text[i] == "\n"):
+                # $ casa no fim do texto ou antes de uma quebra de linha final.
+                tk = accept[rows[state][eol]]
+                if tk >= 0 and priority[tk] >= best_prio:
+                    best, best_end, best_prio = tk, i, priority[tk]
+                if i == n:
+                    break
+            state = rows[state][classes[i]]
+            if not state:
+                break
+            i += 1
+            skip = accel[state]
+            if skip is not None:
+                i = skip(text, i).end()
+            if dead and state * stride + i in dead:
+                break
+            tk = accept[state]
+            if tk >= 0 and priority[tk] >= best_prio:
+                best, best_end, best_prio = tk, i, priority[tk]
+        if dead is not None and i > best_end:
+            self.mark_dead(text, pos, i, classes, dead, bol)
+        if best < 0 or best_end == pos:
+            return None
+        return text[pos:best_end], self.names[best]
+
+    def mark_dead(self, text, pos, stop, classes, dead, bol=True):
+        # Refaz a varredura de pos até stop e marca como mortos os pares
+        # visitados depois do último estado que aceitava algum token.
+        rows, accept, eol, accel = self.rows, self.dfa.accept, self.dfa.width - 1, self.accel
+        n = len(text)
+        stride = n + 1
+        state = self.dfa.start_bol if pos == 0 and bol else self.dfa.start
+        i = pos
+        trail = []
+        while i < stop:
+            state = rows[state][classes[i]]
+            i += 1
+            skip = accel[state]
+            if skip is not None:
+                i = skip(text, i).end()
+            key = state * stride + i
+            alive = accept[state] >= 0 or (
+                i >= n - 1 and (i == n or text[i] == "\n") and accept[rows[state][eol]] >= 0
+            )
+            if alive:
+                trail.clear()
+            else:
+                trail.append(key)
+        dead.update(trail)
+
+    def lex(self, lexer_state, parser_state, bol=True):
+        text = lexer_state.text
+        line_ctr = lexer_state.line_ctr
+        ignore, callback, newline_types = self.ignore_types, self.callback, self.newline_types
+        match = self.match
+        classes = self.classify(text)
+        dead = set()
+        n = len(text)
+        while line_ctr.char_pos < n:
+            res = match(text, line_ctr.char_pos, classes, dead, bol)
+            if not res:
+                allowed = set(self.names) - ignore
+                raise UnexpectedCharacters(
+                    text,
+                    line_ctr.char_pos,
+                    line_ctr.line,
+                    line_ctr.column,
+                    allowed=allowed,
+                    token_history=lexer_state.last_token and [lexer_state.last_token],
+                    state=parser_state,
+                    terminals_by_name=self.terminals_by_name,
+                )
+            value, type_ = res
+            if type_ in ignore:
+                if type_ in callback:
+                    callback[type_](Token(type_, value, line_ctr.char_pos, line_ctr.line, line_ctr.column))
+                line_ctr.feed(value, type_ in newline_types)
+                continue
+            tk = Token(type_, value, line_ctr.char_pos, line_ctr.line, line_ctr.column)
+            line_ctr.feed(value, type_ in newline_types)
+            tk.end_line = line_ctr.line
+            tk.end_column = line_ctr.column
+            tk.end_pos = line_ctr.char_pos
+            if type_ in callback:
+                tk = callback[type_](tk)
+            lexer_state.last_token = tk
+            yield tk
+
+    def tokenize(self, text, bol=True):
+        """
+        Produz os tokens de text, como Lark.lex().
+        """
+        return self.lex(self.make_lexer_state(text), None, bol)
+
+
+def load_dfa(patterns, order, cache_dir=None) -> DFA:
+    """
+    Constrói (ou recupera do cache em disco) o DFA para os padrões dados.
+    """
+    if cache_dir is None:
+        cache_dir = CACHE_DIR
+    rank = dict(zip(range(len(order)), order)).__getitem__
+    if not cache_dir:
+        return DFA.from_regexes(patterns, rank)
+
+    key = repr((patterns, order, sys.version_info[:2]))
+    digest = hashlib.sha256(key.encode("utf8")).hexdigest()[:32]
+    path = os.path.join(cache_dir, f"dfa-{digest}.pickle")
+    try:
+        with open_cache(path) as fd:
+            return DFA.deserialize(pickle.load(fd))
+    except Exception:
+        pass
+    dfa = DFA.from_regexes(patterns, rank)
+    atomic_dump(path, lambda f: pickle.dump(dfa.serialize(), f))
+    return dfa
+
+
+def install_dfa_lexer(parser: Lark) -> bool:
+    """
+    Substitui o lexer baseado em expressões regulares do parser pelo DfaLexer.
+
+    Se algum terminal usar recursos de regex sem equivalente em autômatos
+    finitos, mantém o lexer original e retorna False.
+    """
+    try:
+        lexer = DfaLexer(parser.lexer_conf)
+    except RegexNotSupported:
+        return False
+    parser.parser.lexer = lexer
+    return True
+
+
+def share_tables(parser: Lark, **options) -> Lark:
+    """
+    Cria um parser com as mesmas tabelas LALR e o mesmo lexer de parser, mas
+    com outros callbacks de redução (opções transformer e tree_class).
+
+    Nada é recalculado nem copiado além dos objetos que guardam os callbacks:
+    os dois parsers ocupam praticamente a memória de um só.
+    """
+    new = copy(parser)
+    new.options = copy(parser.options)
+    new.options.__dict__["options"] = {**parser.options.options, **options}
+    new._prepare_callbacks()
+    frontend = new.parser = copy(parser.parser)
+    lalr = frontend.parser = copy(parser.parser.parser)
+    lalr.parser = _Parser(lalr.parser.parse_table, new._callbacks, lalr.parser.debug)
+    return new
+
+
+class EntryPoint:
+    """
+    Visão de um parser compartilhado com o símbolo inicial fixo.
+
+    Oferece a mesma interface de parse()/lex() de um objeto Lark criado
+    com start=<símbolo>.
+    """
+
+    __slots__ = ("parser", "start")
+
+    def __init__(self, parser: Lark, start: str):
+        self.parser = parser
+        self.start = start
+
+    def __repr__(self):
+        return f"EntryPoint({self.start!r})"
+
+    def parse(self, src):
+        return self.parser.parse(src, start=self.start)
+
+    def lex(self, src):
+        lexer = self.parser.parser.lexer
+        if isinstance(lexer, DfaLexer):
+            return lexer.tokenize(src)
+        return self.parser.lex(src)
+
+
+# Um único parser atende todos os pontos de entrada: a gramática é analisada
+# uma vez e o lexer e as tabelas são compartilhados entre eval/expr/module/run.
+# O lexer de expressões regulares do Lark é trocado pelo scanner DFA.
+START = ["seq", "expr", "mod"]
+parser = make_parser(START)
+install_dfa_lexer(parser)
+grammar_expr = EntryPoint(parser, "seq")
+grammar_mod = EntryPoint(parser, "mod")
+
+
+STRING_ESCAPES = {"n": "\n", "r": "\r", "t": "\t", "'": "'", '"': '"', "\\": "\\", "0": "\0"}
+ESCAPE_REGEX = re.compile(r"\\(x[0-9a-fA-F]{2}|u\{[0-9a-fA-F_]+\}|.)")
+
+
+def decode_string(data: str) -> str:
+    """
+    Interpreta as sequências de escape do conteúdo de uma string ruspy.
+    """
+    if "\\" not in data:
+        return data
+
+    def escape(m):
+        code = m.group(1)
+        if code[0] == "x":
+            return chr(int(code[1:], 16))
+        if code[0] == "u":
+            return chr(int(code[2:-1].replace("_", ""), 16))
+        return STRING_ESCAPES[code]
+
+    return ESCAPE_REGEX.sub(escape, data)
+
+
+def memo(fn, maxsize=None):
+    """
+    Liga a memorização de uma função compilada (memo(f); em ruspy), com no
+    máximo maxsize resultados (MEMO_SIZE por padrão). Ao contrário da
+    memorização automática, o cache não é esvaziado quando as funções
+    chamadas são redefinidas.
+
+    memo e nomemo são pré-definidos em todos os mecanismos de execução, mas
+    só o compilador de closures memoriza: para os demais valores, não fazem
+    nada.
+    """
+    if isinstance(fn, CompiledFunction):
+        fn.memo = MemoCache(MEMO_SIZE if maxsize is None else maxsize)
+
+
+def nomemo(fn):
+    """
+    Desliga a memorização de uma função compilada (nomemo(f); em ruspy).
+    """
+    if isinstance(fn, CompiledFunction):
+        fn.memo = None
 
 
 # (não modifique o nome desta classe, fique livre para alterar as implementações!)
@@ -194,17 +1219,22 @@ class RuspyTransformer(InlineTransformer):
         "true": True,
         "false": False,
         "null": None,
+        "memo": memo,
+        "nomemo": nomemo,
     }
 
     # Estas declarações de tipo existem somente para deixar o VSCode feliz.
     _transform_children: Any
     _call_userfunc: Any
-    transform: Any
 
     # Construtor
-    def __init__(self):
+    #
+    # O ambiente global é um Namespace (veja new_env()), com as definições do
+    # usuário sobre os nomes pré-definidos. Chamadas de função criam um novo
+    # escopo (ChainMap) encadeado ao ambiente em que a função foi definida.
+    def __init__(self, env=None):
         super().__init__()
-        self.env = self.global_names.copy()
+        self.env = new_env() if env is None else env
 
     # Trata símbolos terminais -------------------------------------------------
     def INT(self, tk):
@@ -226,10 +1256,13 @@ class RuspyTransformer(InlineTransformer):
         return str(tk)
 
     def FLOAT(self, tk):
-        return float(tk.replace('_', ''))
+        data = tk.replace('_', '')
+        if data.endswith(('f32', 'f64')):
+            data = data[:-3]
+        return float(data)
 
     def STRING(self, tk):
-        return str(tk[1:-1])
+        return decode_string(tk[1:-1])
 
     # Trata símbolos não-terminais ---------------------------------------------
     def lit(self, tk):
@@ -253,7 +1286,7 @@ class RuspyTransformer(InlineTransformer):
         return None;
     
     def xargs(self, *tk):
-        return self.eval(tk);
+        return tk
 
     def func(self, name, arg):
         fn = self.name(name);
@@ -266,8 +1299,18 @@ class RuspyTransformer(InlineTransformer):
         fn = self.name(name);
 
         if callable(fn):
-            return fn(args)
+            return fn(*args)
         raise ValueError(f'{fn} não é uma função!')
+
+    def ret(self, value):
+        raise ReturnValue(value)
+
+    def let(self, *tk):
+        return None
+
+    def mod(self, *fns):
+        # Dicionário com as definições do módulo
+        return self.env.maps[0]
     
     def seq(self, *tk):
         return tk[-1]
@@ -309,11 +1352,93 @@ class RuspyTransformer(InlineTransformer):
             children = list(self._transform_children(tree.children))
         return self._call_userfunc(tree, children)
 
+    # Árvores executáveis (Node) são avaliadas diretamente, sem passar pela
+    # maquinaria de visitação do Lark.
+    def transform(self, tree):
+        if isinstance(tree, Node):
+            return self.eval_node(tree)
+        if isinstance(tree, Tree):
+            return super().transform(tree)
+        return tree  # literal decodificado durante a análise
+
+    def eval_node(self, node):
+        # Os nós são avaliados em pós-ordem com uma pilha explícita: cadeias
+        # longas de operadores e blocos, ifs e laços muito aninhados não
+        # esbarram no limite de recursão. Nós comuns ocupam um quadro (nó,
+        # filhos restantes, valores dos filhos). As formas especiais de steps
+        # são geradores que produzem os filhos a avaliar e recebem os valores
+        # (como em trampoline); exceções (return, break, continue e erros)
+        # chegam a eles por throw(). fn e lambd não avaliam os filhos e são
+        # chamadas diretamente.
+        special, steps = self.special, self.steps
+        stack = []
+        error = None
+        while True:
+            # Começa a avaliar node; value (ou error) é entregue ao topo
+            data = node.data
+            if data in steps:
+                stack.append(steps[data](self, *node.children))
+                value = None
+            elif data in special:
+                try:
+                    value = self.call_rule(data, node.children)
+                except Exception as ex:
+                    error = ex
+            else:
+                stack.append((node, iter(node.children), []))
+                value = UNSET
+            node = None
+
+            while node is None:
+                if not stack:
+                    if error is not None:
+                        raise error
+                    return value
+                frame = stack[-1]
+                if type(frame) is tuple:
+                    if error is not None:
+                        stack.pop()
+                        continue
+                    parent, children, values = frame
+                    if value is not UNSET:
+                        values.append(value)
+                    for child in children:
+                        if isinstance(child, Node):
+                            node = child
+                            break
+                        values.append(child)
+                    else:
+                        stack.pop()
+                        try:
+                            value = self.call_rule(parent.data, values)
+                        except Exception as ex:
+                            error = ex
+                    continue
+                try:
+                    node = frame.send(value) if error is None else frame.throw(error)
+                    error = None
+                except StopIteration as stop:
+                    stack.pop()
+                    value, error = stop.value, None
+                except Exception as ex:
+                    stack.pop()
+                    error = ex
+                if node is not None and not isinstance(node, Node):
+                    value, node = node, None
+
+    def call_rule(self, data, children):
+        method = getattr(self, data, None)
+        if method is None:
+            raise missing_rule(data)
+        return method(*children)
+
     # A avaliação é feita pelo método eval.
     def eval(self, obj):
         """
         Força a avaliação de um nó da árvore sintática em uma forma especial.
         """
+        if isinstance(obj, Node):
+            return self.eval_node(obj)
         if isinstance(obj, Tree):
             return self.transform(obj)
         elif isinstance(obj, Token):
@@ -334,9 +1459,6 @@ class RuspyTransformer(InlineTransformer):
     def or_e(self, x, y):
         return self.eval(x) or self.eval(y);
 
-    def xargs(self, *tk):
-        self.eval(tk);
-
     def if_(self, cond, then, elif_cond=None, elif_then=None, else_=None):
         # print("ARGS: ", self.eval(cond), self.eval(then), self.eval(elif_cond), self.eval(elif_then), self.eval(else_))
         if(elif_cond == None and elif_then == None and else_ == None):
@@ -367,93 +1489,4355 @@ class RuspyTransformer(InlineTransformer):
             else:
                 return self.eval(else_)
 
+    # Laços retornam None. break e continue são implementados com exceções
+    # que interrompem a avaliação do corpo.
     def while_(self, cond, block):
-        raise NotImplementedError("while")
+        while self.eval(cond):
+            try:
+                self.eval(block)
+            except LoopContinue:
+                continue
+            except LoopBreak:
+                break
 
     def for_(self, id, expr, block):
-        raise NotImplementedError("for")
+        name = str(id)
+        for value in self.eval(expr):
+            self.env[name] = value
+            try:
+                self.eval(block)
+            except LoopContinue:
+                continue
+            except LoopBreak:
+                break
 
-    def fn(self, name, args, block):
-        # Dica: reaproveite a implementação de lambd
-        raise NotImplementedError("fn")
+    # Versões das formas especiais usadas por eval_node, com a mesma
+    # semântica dos métodos acima: cada "yield nó" avalia o nó.
+    def step_and_e(self, x, y):
+        return (yield x) and (yield y)
 
-    def lambd(self, args, block):
-        raise NotImplementedError("fn")
+    def step_or_e(self, x, y):
+        return (yield x) or (yield y)
 
+    def step_if_(self, cond, then, *rest):
+        if (yield cond):
+            return (yield then)
+        if len(rest) == 1:
+            return (yield rest[0])  # else
+        if rest and (yield rest[0]):
+            return (yield rest[1])  # else if
+        if len(rest) == 3:
+            return (yield rest[2])
+        return None
 
-def eval(src):
+    def step_while_(self, cond, block):
+        while (yield cond):
+            try:
+                yield block
+            except LoopContinue:
+                continue
+            except LoopBreak:
+                break
+
+    def step_for_(self, id, expr, block):
+        name = str(id)
+        for value in (yield expr):
+            self.env[name] = value
+            try:
+                yield block
+            except LoopContinue:
+                continue
+            except LoopBreak:
+                break
+
+    steps = {"and_e": step_and_e, "or_e": step_or_e, "if_": step_if_, "while_": step_while_, "for_": step_for_}
+
+    def loop_break(self, *tk):
+        raise LoopBreak()
+
+    def loop_continue(self, *tk):
+        raise LoopContinue()
+
+    def fn(self, name, *args):
+        block = args[-1] if args else None
+        if not (isinstance(block, (Tree, Node)) and block.data in ("seq", "null")):
+            # Chamada de função no nível do módulo: fn : ID "(" xargs? ")" ";"
+            xargs = self.eval(block) if args else ()
+            return self.name(str(name))(*xargs)
+
+        func = self.lambd(*args)
+        func.name = str(name)
+        self.env[func.name] = func
+        return func
+
+    def lambd(self, *args):
+        *args, block = args
+        names = [str(arg.children[0]) for arg in args[0].children] if args else []
+        return RuspyFunction("<lambda>", names, block, self.env)
+
+
+def missing_rule(data) -> NotImplementedError:
     """
-    Avalia uma expressão ruspy.
+    Erro para nós da árvore sem regra correspondente no transformer.
+    """
+    return NotImplementedError(
+        f"não implementou regra para lidar com: {data!r}. "
+        f"Crie um método def {data}(self, ...): ... no transformer"
+    )
 
-    >>> eval("1 + 1")
-    2
+
+class ReturnValue(Exception):
+    """
+    Interrompe a execução de uma função ruspy com o comando return.
     """
-    return _eval_or_exec(src, is_exec=False)
 
+    def __init__(self, value):
+        super().__init__(value)
+        self.value = value
 
-def module(src) -> dict:
+
+class LoopBreak(Exception):
+    """
+    Interrompe o laço mais interno (comando break).
     """
-    Avalia um módulo ruspy e retorna um dicionário com as funções definidas
-    no módulo.
 
-    Você pode utilizar estas funções a partir de código Python.
 
-    >>> dic = module("fn incr(n: int) { n + 1 }")
-    >>> f = dic["incr"]
-    >>> f(1)
-    2
+class LoopContinue(Exception):
+    """
+    Passa para a próxima iteração do laço mais interno (comando continue).
     """
-    return _eval_or_exec(src, is_exec=True)
 
 
-def run(src):
+class TailCall:
     """
-    Avalia um módulo ruspy e executa automaticamente a função main.
+    Chamada em posição de cauda de uma função compilada.
 
-    >>> src = '''
-    ... fn main() {
-    ...     print("hello world!")
-    ... }
-    ... '''
-    hello world!
+    Em vez de chamar fn, o corpo da função retorna TailCall e a chamada é
+    feita pelo laço em __call__ da função que o executou: recursões em cauda
+    (inclusive mútuas) usam uma quantidade constante da pilha do Python.
     """
-    mod = module(src)
+
+    __slots__ = ("fn", "args")
+
+    def __init__(self, fn, args):
+        self.fn = fn
+        self.args = args
+
+
+class RuspyFunction:
+    """
+    Função declarada em ruspy com fn ou |args| expr.
+
+    O corpo é avaliado num novo escopo encadeado ao ambiente em que a função
+    foi definida. Nomes globais são resolvidos no momento da chamada, portanto
+    redefinições no módulo são vistas por todos os chamadores.
+    """
+
+    __slots__ = ("name", "args", "body", "env")
+
+    def __init__(self, name, args, body, env):
+        self.name = name
+        self.args = args
+        self.body = body
+        self.env = env
+
+    def __repr__(self):
+        return f"<fn {self.name}>"
+
+    def __call__(self, *args):
+        if len(args) != len(self.args):
+            raise TypeError(
+                f"{self.name}() espera {len(self.args)} argumento(s), recebeu {len(args)}"
+            )
+        env = self.env.new_child(dict(zip(self.args, args)))
+        try:
+            return RuspyTransformer(env).eval(self.body)
+        except ReturnValue as ret:
+            return ret.value
+
+
+# Árvore sintática executável -------------------------------------------------
+
+# O parser LALR pode executar callbacks a cada redução. Em vez de montar a
+# árvore do Lark (Tree e Token) e depois percorrê-la de novo com o transformer,
+# ast_parser constrói diretamente nós Node: cada nó é alocado uma única vez, os
+# literais já chegam decodificados e os identificadores viram str simples.
+
+
+class Node:
+    """
+    Nó da árvore sintática executável.
+
+    Tem a mesma interface básica de lark.Tree (data, children e pretty()),
+    mas ocupa bem menos memória.
+    """
+
+    __slots__ = ("data", "children")
+
+    def __init__(self, data, children):
+        self.data = data
+        self.children = children
+
+    def __repr__(self):
+        return f"Node({self.data!r}, {self.children!r})"
+
+    def __eq__(self, other):
+        if not isinstance(other, Node):
+            return NotImplemented
+        return self.data == other.data and self.children == other.children
+
+    __hash__ = None
+
+    def pretty(self, indent="  ") -> str:
+        """
+        Representação indentada, no mesmo formato de lark.Tree.pretty().
+        """
+        out = []
+        stack = [(self, 0)]
+        while stack:
+            node, level = stack.pop()
+            if not isinstance(node, Node):
+                out.append(f"{indent * level}{node}\n")
+            elif len(node.children) == 1 and not isinstance(node.children[0], Node):
+                out.append(f"{indent * level}{node.data}\t{node.children[0]}\n")
+            else:
+                out.append(f"{indent * level}{node.data}\n")
+                stack.extend((child, level + 1) for child in reversed(node.children))
+        return "".join(out)
+
+
+def trampoline(visit, node):
+    """
+    Percorre uma árvore sem recursão no Python.
+
+    visit(node) retorna o resultado do nó ou um gerador. O gerador produz
+    (yield) cada filho que precisa ser visitado e recebe de volta o resultado
+    da visita. Os geradores pendentes ficam numa pilha explícita, então
+    árvores com centenas de milhares de níveis (ex.: a + b + c + ... gerado
+    por programas) não esbarram no limite de recursão.
+
+    >>> def size(node):
+    ...     total = 1
+    ...     for child in node.children:
+    ...         if isinstance(child, Node):
+    ...             total += yield child
+    ...     return total
+    >>> trampoline(size, ast_expr.parse(" + ".join(["x"] * 100_000)))
+    199999
+    """
+    result = visit(node)
+    if not isinstance(result, GeneratorType):
+        return result
+    stack = [result]
+    result = None
+    while stack:
+        try:
+            child = stack[-1].send(result)
+        except StopIteration as stop:
+            stack.pop()
+            result = stop.value
+            continue
+        result = visit(child)
+        if isinstance(result, GeneratorType):
+            stack.append(result)
+            result = None
+    return result
+
+
+class AstBuilder(InlineTransformer):
+    """
+    Callbacks executados pelo parser LALR durante as reduções.
+
+    As regras sem método próprio viram Node diretamente (tree_class=Node);
+    aqui tratamos apenas as regras que recebem tokens.
+    """
+
+    def lit(self, tk):
+        if not isinstance(tk, Token):
+            return tk  # "(" expr ")"
+        try:
+            decode = getattr(RuspyTransformer, tk.type)
+        except AttributeError:
+            raise NotImplementedError(f"Implemente a regra def {tk.type}(self, tk): ... no transformer")
+        return decode(self, tk)
+
+    def name(self, tk):
+        return Node("name", [str(tk)])
+
+    def _plain(data):
+        # Converte os tokens de identificadores em str
+        def build(self, *children):
+            return Node(data, [str(c) if isinstance(c, Token) else c for c in children])
+
+        build.__name__ = data
+        return build
+
+    fn = _plain("fn")
+    arg = _plain("arg")
+    assign = _plain("assign")
+    for_ = _plain("for_")
+    call = _plain("call")
+    func = _plain("func")
+    attr = _plain("attr")
+    del _plain
+
+
+# Mesmas tabelas e lexer de parser, com reduções que constroem Node
+ast_parser = share_tables(parser, transformer=AstBuilder(), tree_class=Node)
+ast_expr = EntryPoint(ast_parser, "seq")
+ast_mod = EntryPoint(ast_parser, "mod")
+
+
+# Árvore sintática plana ------------------------------------------------------
+
+# FlatAst guarda a árvore em vetores paralelos (struct of arrays), um elemento
+# por nó: tipo do nó, primeiro filho, número de filhos, índice na tabela de
+# constantes e intervalo do código fonte. Os nós são numerados em largura, de
+# modo que os filhos de cada nó ocupam índices consecutivos.
+#
+# O formato em disco é o próprio conteúdo dos vetores, alinhado em 8 bytes:
+# FlatAst.load() mapeia o arquivo com mmap e percorre os vetores diretamente,
+# sem desserializar nada além da lista de tipos de nó. As constantes são
+# decodificadas somente quando acessadas.
+
+FLAT_MAGIC = b"RUSPYAST"
+FLAT_VERSION = 1
+FLAT_HEADER = "<8sIIIII"  # magic, versão, nós, constantes, tipos, ordem dos bytes
+FLAT_ARRAYS = (("kind", "H"), ("first", "I"), ("count", "I"), ("const", "i"), ("start", "I"), ("end", "I"))
+CONST_NONE, CONST_BOOL, CONST_INT, CONST_FLOAT, CONST_STR, CONST_BIGINT = range(6)
+VALUE = "value"  # tipo das folhas que guardam valores Python (ex.: vindas de Node)
+
+
+class FlatAst:
+    """
+    Árvore sintática representada por vetores tipados.
+
+    O nó 0 é a raiz. Folhas têm count[i] == 0 e const[i] >= 0; seu tipo é o
+    tipo do token original (INT, ID...) ou VALUE para valores já decodificados.
+
+    >>> ast = FlatAst.from_tree(grammar_expr.parse("1 + x"))
+    >>> print(ast.pretty(), end="")
+    add
+      lit	1
+      name	x
+    """
+
+    def __init__(self, kinds, arrays, consts, buffer=None):
+        self.kinds = kinds
+        for (name, _), values in zip(FLAT_ARRAYS, arrays):
+            setattr(self, name, values)
+        self.consts = consts
+        self._buffer = buffer
+
+    def __len__(self):
+        return len(self.kind)
+
+    def __repr__(self):
+        return f"<FlatAst com {len(self)} nós>"
+
+    def __reduce__(self):
+        return (FlatAst.frombytes, (self.tobytes(),))
+
+    # Construção ---------------------------------------------------------------
+    @classmethod
+    def from_tree(cls, tree) -> "FlatAst":
+        """
+        Converte uma árvore do Lark (ou de nós Node) para a forma plana.
+
+        Os intervalos do código fonte vêm das posições dos tokens; nós sem
+        tokens recebem o intervalo vazio (0, 0).
+        """
+        kinds, kind_ids = [], {}
+        consts, const_ids = [], {}
+        arrays = [array(code) for _, code in FLAT_ARRAYS]
+        kind, first, count, const, start, end = arrays
+
+        def kind_id(name):
+            try:
+                return kind_ids[name]
+            except KeyError:
+                kinds.append(name)
+                return kind_ids.setdefault(name, len(kinds) - 1)
+
+        def const_id(value):
+            key = (type(value), value)
+            try:
+                return const_ids[key]
+            except KeyError:
+                consts.append(value)
+                return const_ids.setdefault(key, len(consts) - 1)
+
+        # Numeração em largura: os filhos de cada nó são adicionados juntos
+        order = [tree]
+        i = 0
+        while i < len(order):
+            node = order[i]
+            if isinstance(node, (Tree, Node)):
+                kind.append(kind_id(node.data))
+                first.append(len(order))
+                count.append(len(node.children))
+                const.append(-1)
+                order.extend(node.children)
+            else:
+                is_token = isinstance(node, Token)
+                kind.append(kind_id(node.type if is_token else VALUE))
+                first.append(0)
+                count.append(0)
+                const.append(const_id(str(node) if is_token else node))
+            if isinstance(node, Token) and node.end_pos is not None:
+                start.append(node.start_pos)
+                end.append(node.end_pos)
+            else:
+                start.append(0)
+                end.append(0)
+            i += 1
+
+        # Intervalos dos nós internos, dos mais profundos para a raiz
+        for i in range(len(order) - 1, -1, -1):
+            n = count[i]
+            if n:
+                spans = [
+                    (start[j], end[j]) for j in range(first[i], first[i] + n) if end[j]
+                ]
+                if spans:
+                    start[i] = spans[0][0]
+                    end[i] = spans[-1][1]
+        return cls(kinds, arrays, consts)
+
+    # Consulta -----------------------------------------------------------------
+    def data(self, i) -> str:
+        return self.kinds[self.kind[i]]
+
+    def is_leaf(self, i) -> bool:
+        return self.const[i] >= 0
+
+    def value(self, i):
+        return self.consts[self.const[i]]
+
+    def children(self, i) -> range:
+        first = self.first[i]
+        return range(first, first + self.count[i])
+
+    def span(self, i) -> tuple:
+        return self.start[i], self.end[i]
+
+    def pretty(self, indent="  ") -> str:
+        """
+        Representação indentada, no mesmo formato de lark.Tree.pretty().
+        """
+        out = []
+        stack = [(0, 0)]
+        while stack:
+            i, level = stack.pop()
+            if self.is_leaf(i):
+                out.append(f"{indent * level}{self.value(i)}\n")
+                continue
+            children = self.children(i)
+            if len(children) == 1 and self.is_leaf(children[0]):
+                out.append(f"{indent * level}{self.data(i)}\t{self.value(children[0])}\n")
+            else:
+                out.append(f"{indent * level}{self.data(i)}\n")
+                stack.extend((j, level + 1) for j in reversed(children))
+        return "".join(out)
+
+    def to_tree(self, i=0):
+        """
+        Reconstrói a árvore do Lark (ou o valor, para folhas VALUE).
+        """
+        built = {}
+        for j in range(len(self) - 1, i - 1, -1):
+            if self.is_leaf(j):
+                kind = self.data(j)
+                value = self.value(j)
+                built[j] = value if kind == VALUE else Token(kind, value, self.start[j], end_pos=self.end[j])
+            else:
+                built[j] = Tree(self.data(j), [built.pop(k) for k in self.children(j)])
+        return built[i]
+
+    # Serialização -------------------------------------------------------------
+    def tobytes(self) -> bytes:
+        """
+        Conteúdo do arquivo do formato plano.
+        """
+        parts = [bytes(values) for values in self._arrays()]
+        tags = bytearray()
+        offsets = array("I", [0])
+        data = bytearray()
+        for k in range(len(self.consts)):
+            tag, payload = encode_const(self.consts[k])
+            tags.append(tag)
+            data += payload
+            offsets.append(len(data))
+        names = "\0".join(self.kinds).encode("utf8")
+        parts += [bytes(tags), offsets.tobytes(), bytes(data), names]
+
+        little = sys.byteorder == "little"
+        out = bytearray(
+            struct.pack(FLAT_HEADER, FLAT_MAGIC, FLAT_VERSION, len(self), len(self.consts), len(self.kinds), little)
+        )
+        out += struct.pack(f"<{len(parts)}Q", *map(len, parts))
+        for part in parts:
+            out += bytes(-len(out) % 8)
+            out += part
+        return bytes(out)
+
+    def save(self, path):
+        """
+        Escreve a árvore em path (atomicamente).
+        """
+        data = self.tobytes()
+        atomic_write(path, lambda fd: fd.write(data))
+
+    @classmethod
+    def frombytes(cls, data) -> "FlatAst":
+        """
+        Interpreta o formato plano sem copiar os vetores.
+        """
+        view = memoryview(data)
+        header = struct.calcsize(FLAT_HEADER)
+        magic, version, n, n_consts, n_kinds, little = struct.unpack_from(FLAT_HEADER, view)
+        if magic != FLAT_MAGIC or version != FLAT_VERSION:
+            raise ValueError("arquivo não está no formato FlatAst")
+        if little != (sys.byteorder == "little"):
+            raise ValueError("FlatAst gravada com outra ordem de bytes")
+        n_parts = len(FLAT_ARRAYS) + 4
+        sizes = struct.unpack_from(f"<{n_parts}Q", view, header)
+        pos = header + 8 * n_parts
+        parts = []
+        for size in sizes:
+            pos += -pos % 8
+            parts.append(view[pos : pos + size])
+            pos += size
+        arrays = [part.cast(code) for part, (_, code) in zip(parts, FLAT_ARRAYS)]
+        tags, offsets, consts_data, names = parts[len(FLAT_ARRAYS) :]
+        kinds = bytes(names).decode("utf8").split("\0") if n_kinds else []
+        consts = ConstTable(tags, offsets.cast("I"), consts_data)
+        return cls(kinds, arrays, consts, buffer=data)
+
+    @classmethod
+    def load(cls, path) -> "FlatAst":
+        """
+        Mapeia o arquivo em memória. Os vetores são lidos sob demanda pelo
+        sistema operacional; nada é copiado para objetos Python.
+        """
+        with open(path, "rb") as fd:
+            mm = mmap.mmap(fd.fileno(), 0, access=mmap.ACCESS_READ)
+        return cls.frombytes(mm)
+
+    def _arrays(self):
+        return [getattr(self, name) for name, _ in FLAT_ARRAYS]
+
+
+class ConstTable:
+    """
+    Tabela de constantes de uma FlatAst carregada de um arquivo; decodifica
+    cada constante somente quando acessada.
+    """
+
+    def __init__(self, tags, offsets, data):
+        self.tags = tags
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.tags)
+
+    def __getitem__(self, i):
+        payload = self.data[self.offsets[i] : self.offsets[i + 1]]
+        return decode_const(self.tags[i], payload)
+
+
+def encode_const(value) -> tuple:
+    """
+    Codifica uma constante como (tag, bytes).
+    """
+    if value is None:
+        return CONST_NONE, b""
+    if isinstance(value, bool):
+        return CONST_BOOL, bytes([value])
+    if isinstance(value, int):
+        if -(1 << 63) <= value < 1 << 63:
+            return CONST_INT, struct.pack("<q", value)
+        return CONST_BIGINT, str(value).encode("ascii")
+    if isinstance(value, float):
+        return CONST_FLOAT, struct.pack("<d", value)
+    if isinstance(value, str):
+        return CONST_STR, value.encode("utf8", "surrogatepass")
+    raise TypeError(f"constante não suportada: {value!r}")
+
+
+def decode_const(tag, payload):
+    if tag == CONST_NONE:
+        return None
+    if tag == CONST_BOOL:
+        return bool(payload[0])
+    if tag == CONST_INT:
+        return struct.unpack("<q", payload)[0]
+    if tag == CONST_FLOAT:
+        return struct.unpack("<d", payload)[0]
+    if tag == CONST_STR:
+        return bytes(payload).decode("utf8", "surrogatepass")
+    if tag == CONST_BIGINT:
+        return int(bytes(payload))
+    raise ValueError(f"constante inválida: {tag}")
+
+
+# Otimização de árvores -------------------------------------------------------
+
+# Passo opcional entre a análise sintática e a execução (veja OPTIMIZE em
+# _eval_or_exec). Trechos cujo valor já é conhecido durante a compilação são
+# avaliados uma única vez e substituídos pelo literal correspondente, para
+# todos os mecanismos de execução.
+#
+# A árvore otimizada precisa se comportar exatamente como a original: trechos
+# que geram erros (ex.: 1 / 0) são mantidos e o erro acontece na execução.
+
+FOLD_OPERATORS = {
+    "add", "sub", "mul", "div_", "rest", "rshift", "lshift", "or_", "and_", "xor",
+    "eq", "ne", "lt", "gt", "le", "ge", "neg",
+}
+FOLD_TYPES = (int, float, str, bool, type(None))
+FOLD_MAX_SIZE = 4096  # bits de inteiros e caracteres de strings dobrados
+PURE_FUNCTIONS = {
+    "sqrt", "exp", "log", "log2", "log10", "pow", "hypot", "sin", "cos", "tan",
+    "asin", "acos", "atan", "atan2", "sinh", "cosh", "tanh", "degrees", "radians",
+    "floor", "ceil", "trunc", "fabs", "gcd", "isqrt", "abs", "min", "max", "round",
+}
+PURE_CONSTANTS = {"true", "false", "null", "answer", "pi", "e", "tau", "inf", "nan"}
+NOT_CONSTANT = object()
+FORMAT_WIDTH_REGEX = re.compile(r"%[-+ #0]*(\d*)(?:\.(\d*))?")
+
+
+def result_size(name, args) -> int:
+    """
+    Limite superior do tamanho do resultado de name(*args), nas unidades de
+    FOLD_MAX_SIZE, para as operações cujo resultado pode ser muito maior que
+    os argumentos (potências, deslocamentos, repetição e formatação de
+    strings). Retorna 0 nos demais casos.
+
+    O limite é calculado sem executar a operação: pow(7, 30000000) levaria
+    vários segundos só para ser descartado depois.
+
+    >>> result_size("pow", [7, 3_000_000])
+    9000000
+    >>> result_size("mul", ["ab", 100])
+    200
+    """
+    if len(args) != 2:
+        return 0  # pow(x, y, m) é limitado por m
+    x, y = args
+    if name == "mul" and isinstance(x, int) and isinstance(y, str):
+        x, y = y, x
+    if name == "mul" and isinstance(x, str) and isinstance(y, int):
+        return len(x) * y
+    if name == "rest" and isinstance(x, str):
+        widths = FORMAT_WIDTH_REGEX.findall(x)
+        return len(x) + sum(int(n or 0) for spec in widths for n in spec)
+    if not (isinstance(x, int) and isinstance(y, int)):
+        return 0
+    if name == "mul":
+        return x.bit_length() + y.bit_length()
+    if name == "lshift":
+        return x.bit_length() + y
+    if name == "pow":
+        return x.bit_length() * y
+    return 0
+
+
+class ConstantFolder:
+    """
+    Dobra expressões constantes e propaga constantes em árvores Node.
+
+    * Operadores aritméticos, bit a bit e comparações sobre literais viram o
+      literal resultante.
+    * Chamadas a funções puras de math/builtins (PURE_FUNCTIONS) com
+      argumentos literais são avaliadas, desde que o nome não seja redefinido.
+    * Nomes atribuídos uma única vez no programa inteiro a um literal são
+      substituídos pelo valor nos comandos seguintes da mesma sequência.
+
+    Com partial=True, a árvore é só uma parte do programa (ex.: um comando de
+    exec_stream) e as outras partes podem redefinir qualquer nome: somente os
+    operadores sobre literais são dobrados.
+
+    A árvore original não é alterada.
+
+    >>> ConstantFolder().fold(ast_expr.parse("let x = 2 * 3; x + sqrt(4)"))
+    Node('seq', [Node('let', [Node('assign', ['x', 6])]), 8.0])
+    """
+
+    def __init__(self, partial=False):
+        self.operators = RuspyTransformer(ChainMap())
+        self.partial = partial
+        self.assigned = {}  # nome -> número de definições no programa
+        self.consts = {}  # nomes propagados na sequência atual
+
+    def fold(self, tree):
+        """
+        Retorna a árvore otimizada.
+        """
+        self.assigned = count_definitions(tree)
+        return trampoline(self.visit, tree)
+
+    def visit(self, node):
+        # As regras são geradores: produzem os filhos a visitar e recebem a
+        # versão otimizada de cada um (veja trampoline)
+        if not isinstance(node, Node):
+            return node
+        method = getattr(self, node.data, None)
+        if method is not None:
+            return method(node)
+        return self.generic(node)
+
+    def generic(self, node):
+        children = []
+        for child in node.children:
+            children.append((yield child) if isinstance(child, Node) else child)
+        if node.data in FOLD_OPERATORS and not any(isinstance(child, Node) for child in children):
+            value = self.evaluate(node.data, getattr(self.operators, node.data), children)
+            if value is not NOT_CONSTANT:
+                return value
+        return Node(node.data, children)
+
+    def evaluate(self, name, fn, args):
+        """
+        Valor de fn(*args), ou NOT_CONSTANT se a chamada falhar (o erro fica
+        para a execução) ou o resultado não puder virar um literal. name é o
+        nome da operação ou função, usado para descartar resultados grandes
+        demais antes da chamada (veja result_size).
+        """
+        if result_size(name, args) > FOLD_MAX_SIZE:
+            return NOT_CONSTANT
+        try:
+            value = fn(*args)
+        except Exception:
+            return NOT_CONSTANT
+        if not isinstance(value, FOLD_TYPES):
+            return NOT_CONSTANT
+        if isinstance(value, int) and value.bit_length() > FOLD_MAX_SIZE:
+            return NOT_CONSTANT
+        if isinstance(value, str) and len(value) > FOLD_MAX_SIZE:
+            return NOT_CONSTANT
+        return value
+
+    def is_pure(self, name) -> bool:
+        return not self.partial and name not in self.assigned and name not in self.consts
+
+    # Regras -------------------------------------------------------------------
+    def name(self, node):
+        name = node.children[0]
+        if name in self.consts:
+            return self.consts[name]
+        if name in PURE_CONSTANTS and self.is_pure(name):
+            return BUILTINS[name]
+        return node
+
+    def seq(self, node):
+        # Constantes definidas na sequência valem somente até o seu final: os
+        # comandos seguintes da sequência externa podem ser executados sem que
+        # a definição tenha acontecido (ex.: dentro de um if).
+        saved = self.consts.copy()
+        children = []
+        for child in node.children:
+            child = yield child
+            children.append(child)
+            self.bind(child)
+        self.consts = saved
+        return Node(node.data, children)
+
+    def bind(self, cmd):
+        if isinstance(cmd, Node) and cmd.data in ("let", "null") and len(cmd.children) == 1:
+            cmd = cmd.children[0]
+        if not (isinstance(cmd, Node) and cmd.data == "assign"):
+            return
+        name, value = cmd.children
+        if not self.partial and self.assigned.get(name) == 1 and not isinstance(value, Node):
+            self.consts[name] = value
+
+    def func(self, node):
+        name, arg = node.children
+        arg = yield arg
+        if name in PURE_FUNCTIONS and self.is_pure(name) and not isinstance(arg, Node):
+            value = self.evaluate(name, BUILTINS[name], [arg])
+            if value is not NOT_CONSTANT:
+                return value
+        return Node(node.data, [name, arg])
+
+    def call(self, node):
+        name, xargs = node.children
+        xargs = yield xargs
+        args = xargs.children
+        if name in PURE_FUNCTIONS and self.is_pure(name) and not any(isinstance(arg, Node) for arg in args):
+            value = self.evaluate(name, BUILTINS[name], args)
+            if value is not NOT_CONSTANT:
+                return value
+        return Node(node.data, [name, xargs])
+
+    # Com a condição literal, só o ramo executado é dobrado: os outros nunca
+    # rodam e podem conter expressões caras de avaliar.
+    def and_e(self, node):
+        x = yield node.children[0]
+        if isinstance(x, Node):
+            return Node(node.data, [x, (yield node.children[1])])
+        return (yield node.children[1]) if x else x
+
+    def or_e(self, node):
+        x = yield node.children[0]
+        if isinstance(x, Node):
+            return Node(node.data, [x, (yield node.children[1])])
+        return x if x else (yield node.children[1])
+
+    def if_(self, node):
+        cond, then, *rest = node.children
+        cond = yield cond
+        if isinstance(cond, Node):
+            children = [cond, (yield then)]
+            for child in rest:
+                children.append((yield child))
+            return Node(node.data, children)
+        if cond:
+            return (yield then)
+        if len(rest) == 1:
+            return (yield rest[0])
+        if rest:
+            return (yield Node("if_", rest))  # else if
+        return None
+
+    def while_(self, node):
+        cond, block = node.children
+        cond = yield cond
+        if not isinstance(cond, Node) and not cond:
+            return None
+        return Node(node.data, [cond, (yield block)])
+
+
+class DeadCodeEliminator:
+    """
+    Remove código que nunca é executado ou cujo resultado nunca é usado.
+
+    * Comandos de uma sequência depois de return, break ou continue.
+    * Ramos de if_ com condição literal e laços while_ com condição falsa.
+    * Definições (let ou atribuição) de nomes que nunca são lidos, quando o
+      valor é um literal ou uma função anônima, e literais usados como
+      comandos. O último comando de uma sequência é sempre mantido, pois é o
+      valor da sequência.
+
+    Com partial=True, a árvore é só uma parte do programa e os nomes podem ser
+    lidos pelas outras partes: nenhuma definição é removida.
+
+    removed acumula o número de nós removidos.
+
+    >>> dce = DeadCodeEliminator()
+    >>> dce.eliminate(ast_expr.parse("let x = 1; f = |y| ({ return y; y + 1 }); f(2)"))
+    Node('seq', [Node('null', [Node('assign', ['f', Node('lambd', [Node('args', [Node('arg', ['y'])]), Node('seq', [Node('seq', [Node('null', [Node('ret', [Node('name', ['y'])])])])])])])]), Node('func', ['f', 2])])
+    >>> dce.removed
+    4
+    """
+
+    def __init__(self, partial=False):
+        self.removed = 0
+        self.partial = partial
+        self.reads = set()  # nomes lidos em algum ponto do programa
+        self.jumps = {}  # id -> nós que sempre terminam com return, break ou continue
+
+    def eliminate(self, tree):
+        """
+        Retorna a árvore sem o código morto.
+        """
+        size = count_nodes(tree)
+        while True:
+            # Remover uma definição pode deixar outras sem uso
+            self.reads = read_names(tree)
+            tree = trampoline(self.visit, tree)
+            self.jumps.clear()
+            new_size = count_nodes(tree)
+            if new_size == size:
+                return tree
+            self.removed += size - new_size
+            size = new_size
+
+    def visit(self, node):
+        # Gerador, como em ConstantFolder.visit
+        if not isinstance(node, Node):
+            return node
+        method = getattr(self, node.data, None)
+        if method is not None:
+            return method(node)
+        return self.generic(node)
+
+    def generic(self, node):
+        children = []
+        for child in node.children:
+            children.append((yield child) if isinstance(child, Node) else child)
+        new = Node(node.data, children)
+        if node.data in ("ret", "loop_break", "loop_continue"):
+            self.jump(new)
+        elif node.data in ("null", "let") and any(self.is_jump(child) for child in children):
+            self.jump(new)
+        return new
+
+    def jump(self, node):
+        # Os nós são guardados junto com o id para que o id não seja reusado
+        # por outro nó durante a passada
+        self.jumps[id(node)] = node
+
+    def is_jump(self, node) -> bool:
+        """
+        Verifica se a execução do nó já visitado sempre termina com return,
+        break ou continue.
+        """
+        return id(node) in self.jumps
+
+    def is_unused(self, cmd) -> bool:
+        if not isinstance(cmd, Node):
+            return True  # literal usado como comando
+        if cmd.data not in ("let", "null") or len(cmd.children) != 1:
+            return False
+        cmd = cmd.children[0]
+        if not isinstance(cmd, Node):
+            return True
+        if cmd.data != "assign":
+            return cmd.data == "lambd"
+        name, value = cmd.children
+        if self.partial or name in self.reads:
+            return False
+        return not isinstance(value, Node) or value.data == "lambd"
+
+    # Regras -------------------------------------------------------------------
+    def name(self, node):
+        return node  # folha: evita criar um gerador
+
+    def seq(self, node):
+        children = []
+        for child in node.children:
+            child = yield child
+            children.append(child)
+            if self.is_jump(child):
+                new = Node(node.data, [cmd for cmd in children[:-1] if not self.is_unused(cmd)] + [child])
+                self.jump(new)
+                return new
+        *init, last = children
+        return Node(node.data, [cmd for cmd in init if not self.is_unused(cmd)] + [last])
+
+    def if_(self, node):
+        cond, then, *rest = node.children
+        cond = yield cond
+        if isinstance(cond, Node):
+            for i, child in enumerate(rest):
+                rest[i] = yield child
+            if len(rest) >= 2 and not isinstance(rest[0], Node):
+                # else if com condição literal
+                elif_cond, elif_then, *else_ = rest
+                rest = [elif_then] if elif_cond else else_
+            new = Node(node.data, [cond, (yield then)] + rest)
+            branches = new.children[1::2] + new.children[-1:]
+            if len(new.children) % 2 == 1 and all(self.is_jump(branch) for branch in branches):
+                self.jump(new)
+            return new
+        if cond:
+            return (yield then)
+        if len(rest) == 1:
+            return (yield rest[0])
+        if rest:
+            return (yield Node("if_", rest))
+        return None
+
+    def while_(self, node):
+        cond, block = node.children
+        cond = yield cond
+        if not isinstance(cond, Node) and not cond:
+            return None
+        return Node(node.data, [cond, (yield block)])
+
+
+def read_names(tree) -> set:
+    """
+    Nomes lidos em tree, incluindo os nomes de funções chamadas.
+    """
+    names = set()
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, Node):
+            continue
+        if node.data in ("name", "func", "call", "fn", "attr"):
+            names.add(node.children[0])
+        stack.extend(node.children)
+    return names
+
+
+def count_nodes(tree) -> int:
+    """
+    Número de nós Node em tree.
+    """
+    count = 0
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Node):
+            count += 1
+            stack.extend(node.children)
+    return count
+
+
+def count_definitions(tree) -> dict:
+    """
+    Número de vezes que cada nome é definido em tree: atribuições, variáveis
+    de laços for, argumentos e funções declaradas com fn.
+    """
+    counts = {}
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, Node):
+            continue
+        if node.data in ("assign", "for_", "arg", "fn"):
+            name = node.children[0]
+            counts[name] = counts.get(name, 0) + 1
+        stack.extend(node.children)
+    return counts
+
+
+def optimize(tree, partial=False):
+    """
+    Aplica os passos de otimização à árvore: dobra de constantes e remoção de
+    código morto. partial indica que a árvore é só uma parte do programa (veja
+    ConstantFolder).
+    """
+    return DeadCodeEliminator(partial).eliminate(ConstantFolder(partial).fold(tree))
+
+
+# Compilação para closures ----------------------------------------------------
+
+# O transformer reavalia a árvore nó a nó, despachando cada nó pelo nome da
+# regra, toda vez que um trecho de código é executado (ex.: a cada iteração de
+# um laço). O compilador percorre a árvore uma única vez e produz funções
+# Python aninhadas (closures) que recebem o ambiente e executam o código: todo
+# o despacho é resolvido durante a compilação.
+#
+# A semântica é a mesma do RuspyTransformer; os dois mecanismos podem ser
+# escolhidos em _eval_or_exec() (veja ENGINES).
+#
+# Os nomes também são resolvidos durante a compilação. Argumentos e variáveis
+# atribuídas dentro de uma função são locais e ficam em posições fixas de uma
+# lista, o quadro (frame) da chamada:
+#
+#     [globais, capturas da função, local 0, local 1, ...]
+#
+# Só os nomes globais (nível do módulo e pré-definidos) ficam no dicionário.
+# Como no transformer, uma variável local lida antes da primeira atribuição é
+# procurada nos escopos externos: posições ainda não atribuídas guardam UNSET.
+#
+# Cada função guarda somente as variáveis das funções externas que lê (veja
+# free_names), numa tupla (globais, captura 1, captura 2, ...), e não o quadro
+# inteiro em que foi criada: funções usadas como estruturas de dados (ex.: cons
+# em exemplos/pair.rpy) ocupam pouca memória e não mantêm vivas as outras
+# variáveis do quadro. Argumentos nunca atribuídos na função que os define são
+# copiados para a tupla; as demais variáveis lidas por funções internas ficam
+# numa célula (Cell), compartilhada pelo quadro e pelas funções criadas nele,
+# que veem as atribuições feitas depois da criação.
+#
+# Chamadas em posição de cauda (último valor do corpo de uma função, ramos de
+# if, segundo operando de && e ||, valor de return) entre funções compiladas
+# retornam TailCall em vez de empilhar mais uma chamada (veja CompiledFunction).
+
+FRAME_HEADER = 2  # globais e quadro externo
+UNSET = object()  # variável local ainda não atribuída
+
+
+class Jump:
+    """
+    Desvio do fluxo de controle: return, break ou continue.
+
+    Em posição de comando (corpo de funções e laços, comandos de seq, ramos de
+    if), as closures retornam Jump em vez de lançar ReturnValue, LoopBreak ou
+    LoopContinue, e seq, if_, os laços e as funções repassam ou tratam o
+    desvio. throw() lança a exceção equivalente quando o desvio sai de uma
+    posição de comando (ex.: break numa função chamada no corpo de um laço).
+    """
+
+    __slots__ = ("kind", "value")
+
+    def __init__(self, kind, value=None):
+        self.kind = kind
+        self.value = value
+
+    def __repr__(self):
+        return f"Jump({self.kind!r}, {self.value!r})"
+
+    def throw(self):
+        if self.kind == "return":
+            raise ReturnValue(self.value)
+        raise LoopBreak() if self.kind == "break" else LoopContinue()
+
+
+BREAK = Jump("break")
+CONTINUE = Jump("continue")
+
+
+class Cell:
+    """
+    Variável local lida por funções internas. O quadro guarda a célula no
+    lugar do valor e as funções criadas nele capturam a própria célula.
+    """
+
+    __slots__ = ("value",)
+
+    def __init__(self, value=UNSET):
+        self.value = value
+
+    def __repr__(self):
+        return f"Cell({self.value!r})"
+
+    def __setitem__(self, key, value):
+        # Laços atribuem a variável com target[key] = value
+        self.value = value
+
+
+class Scope:
+    """
+    Escopo de uma função durante a compilação: associa os nomes locais às
+    posições no quadro.
+
+    cells guarda as posições das variáveis que ficam em células, e captures
+    associa cada (escopo externo, posição) lido pela função à sua posição na
+    tupla de capturas (frame[1]).
+    """
+
+    __slots__ = ("parent", "slots", "nargs", "unset", "counters", "cells", "captures")
+
+    def __init__(self, parent, args, block):
+        self.parent = parent
+        self.nargs = len(args)
+        self.counters = set()  # variáveis de laços for_range em compilação
+        self.slots = {name: FRAME_HEADER + i for i, name in enumerate(args)}
+        assigned = assigned_names(block)
+        names = sorted(assigned.difference(args))
+        self.slots.update((name, FRAME_HEADER + self.nargs + i) for i, name in enumerate(names))
+        self.unset = (UNSET,) * len(names)
+
+        reads, inner = function_reads(block)
+        self.cells = {self.slots[name] for name in inner & assigned}
+        self.captures = {}
+        if parent is not None:
+            for name in sorted((reads | inner).difference(args)):
+                for place in parent.lookup(name):
+                    self.captures.setdefault(place, len(self.captures) + 1)
+
+    def resolve(self, name) -> list:
+        """
+        Lista de (profundidade, posição) dos escopos que definem name, do mais
+        interno para o mais externo.
+        """
+        found = []
+        depth = 0
+        scope = self
+        while scope is not None:
+            if name in scope.slots:
+                found.append((depth, scope.slots[name]))
+            scope = scope.parent
+            depth += 1
+        return found
+
+    def lookup(self, name) -> list:
+        """
+        Lista de (escopo, posição) dos escopos que definem name, do mais
+        interno para o mais externo, até o primeiro argumento: argumentos
+        sempre têm valor e os escopos seguintes nunca são consultados.
+        """
+        found = []
+        scope = self
+        while scope is not None:
+            if name in scope.slots:
+                index = scope.slots[name]
+                found.append((scope, index))
+                if scope.is_arg(index):
+                    break
+            scope = scope.parent
+        return found
+
+    def is_arg(self, index) -> bool:
+        return index < FRAME_HEADER + self.nargs
+
+
+# Especialização por tipos (quickening) ---------------------------------------
+
+# div_ (/) e rest (%) testam os tipos dos operandos a cada execução, pois a
+# divisão de inteiros é inteira. Cada ponto do programa que usa um destes
+# operadores registra os tipos que recebe: depois de QUICKEN_WARMUP execuções
+# seguidas com dois int (ou dois float), a closure do ponto é reescrita no
+# próprio lugar para a versão especializada, que faz a operação diretamente.
+# Se outros tipos aparecerem, o ponto volta para a versão genérica e pode se
+# especializar de novo; depois de QUICKEN_MAX_DEOPT desespecializações ele
+# desiste e fica com o operador do RuspyTransformer.
+#
+# A reescrita troca o __code__ da closure entregue ao nó pai por outro criado
+# na mesma chamada de quick_div_/quick_rest: as variáveis livres (x, y, site)
+# são as mesmas e o pai passa a executar o código novo sem nenhuma indireção.
+#
+# Os outros operadores já despacham direto para o módulo operator, escrito em
+# C: uma versão especializada com testes de tipo seria mais lenta.
+
+QUICKEN_WARMUP = 8
+QUICKEN_MAX_DEOPT = 4
+QUICKEN_STATS = {"sites": 0, "specialized": 0, "deoptimized": 0, "generic": 0}
+
+
+def quick_div_(x, y, site):
+    def warmup(frame):
+        return site.observe(x(frame), y(frame))
+
+    def generic(frame):
+        return site.op(x(frame), y(frame))
+
+    def int_int(frame):
+        a = x(frame)
+        b = y(frame)
+        if type(a) is int and type(b) is int:
+            return a // b
+        return site.deopt(a, b)
+
+    def float_float(frame):
+        a = x(frame)
+        b = y(frame)
+        if type(a) is float and type(b) is float:
+            return a / b
+        return site.deopt(a, b)
+
+    return warmup, generic, {int: int_int, float: float_float}
+
+
+def quick_rest(x, y, site):
+    def warmup(frame):
+        return site.observe(x(frame), y(frame))
+
+    def generic(frame):
+        return site.op(x(frame), y(frame))
+
+    def int_int(frame):
+        a = x(frame)
+        b = y(frame)
+        if type(a) is int and type(b) is int:
+            return a % b
+        return site.deopt(a, b)
+
+    def float_float(frame):
+        a = x(frame)
+        b = y(frame)
+        if type(a) is float and type(b) is float:
+            return a % b
+        return site.deopt(a, b)
+
+    return warmup, generic, {int: int_int, float: float_float}
+
+
+QUICKEN_OPERATORS = {"div_": quick_div_, "rest": quick_rest}
+
+
+class QuickSite:
+    """
+    Ponto de uso de um operador com especialização por tipos.
+
+    run é a closure entregue ao compilador, cujo código é trocado por um de
+    warmup (registra os tipos), fast (especializados por tipo) e generic. kind
+    é o tipo dos operandos da versão especializada em uso.
+    """
+
+    __slots__ = ("op", "run", "warmup", "generic", "fast", "kind", "seen", "hits", "deopts")
+
+    def __init__(self, make, op, x, y):
+        self.op = op
+        self.run, generic, fast = make(x, y, self)
+        self.warmup = self.run.__code__
+        self.generic = generic.__code__
+        self.fast = {kind: fn.__code__ for kind, fn in fast.items()}
+        self.kind = self.seen = None
+        self.hits = self.deopts = 0
+        QUICKEN_STATS["sites"] += 1
+
+    def observe(self, a, b):
+        value = self.op(a, b)  # erros acontecem antes de registrar os tipos
+        kind = type(a)
+        if kind is not type(b) or kind not in self.fast:
+            self.seen = None
+        elif kind is self.seen:
+            self.hits += 1
+            if self.hits >= QUICKEN_WARMUP:
+                self.rewrite(self.fast[kind], kind)
+                QUICKEN_STATS["specialized"] += 1
+        else:
+            self.seen = kind
+            self.hits = 1
+        return value
+
+    def deopt(self, a, b):
+        self.deopts += 1
+        self.seen = None
+        QUICKEN_STATS["deoptimized"] += 1
+        if self.deopts < QUICKEN_MAX_DEOPT:
+            self.rewrite(self.warmup, None)
+        else:
+            self.rewrite(self.generic, None)
+            QUICKEN_STATS["generic"] += 1
+        return self.op(a, b)
+
+    def rewrite(self, code, kind):
+        self.run.__code__ = code
+        self.kind = kind
+
+
+def quicken_stats(clear=False) -> dict:
+    """
+    Contadores dos pontos de especialização criados pelo compilador de
+    closures: pontos criados, especializações, desespecializações e pontos que
+    desistiram de especializar.
+    """
+    stats = dict(QUICKEN_STATS)
+    if clear:
+        QUICKEN_STATS.update(dict.fromkeys(QUICKEN_STATS, 0))
+    return stats
+
+
+class RuspyCompiler:
+    """
+    Compila árvores de nós Node em closures f(frame).
+
+    Cada regra da gramática tem um método com o mesmo nome, que recebe os
+    filhos do nó ainda não compilados e retorna a closure correspondente.
+    Regras sem método próprio e que não são formas especiais (operadores,
+    range etc) reutilizam o método do RuspyTransformer, aplicado aos valores
+    dos filhos. Estes métodos não podem depender do ambiente: o transformer
+    usado aqui tem um ambiente vazio.
+
+    >>> code = RuspyCompiler().compile(ast_expr.parse("x = 20; x * 2 + 2"))
+    >>> code([new_env(), None])
+    42
+    """
+
+    def __init__(self):
+        self.operators = RuspyTransformer(ChainMap())
+        self.scope = None  # nível do módulo
+        self.tail = False  # o nó em compilação está em posição de cauda?
+        self.stmt = False  # o nó está em posição de comando (pode retornar Jump)?
+        self.jumps = set()  # closures que podem retornar Jump
+        self.loops = 0  # laços em volta do nó, na função atual
+        self.pure = {}  # funções memorizadas automaticamente (veja pure_dependencies)
+
+    def compile(self, node, tail=False, stmt=False):
+        """
+        Retorna uma closure que avalia node no ambiente recebido.
+        """
+        if not isinstance(node, Node):
+            return self.const(node)  # literal decodificado durante a análise
+
+        data = node.data
+        children = node.children
+        outer = self.tail, self.stmt
+        self.tail, self.stmt = tail, stmt
+        try:
+            method = getattr(self, data, None)
+            if method is not None:
+                return method(*children)
+            op = getattr(self.operators, data, None)
+            if op is None or data in RuspyTransformer.special:
+                return self.unknown(data, children)
+            if data in QUICKEN_OPERATORS and len(children) == 2:
+                return self.quicken(QUICKEN_OPERATORS[data], op, children)
+            return self.operator(op, children)
+        finally:
+            self.tail, self.stmt = outer
+
+    def compile_all(self, nodes, stmt=False) -> list:
+        return [self.compile(node, stmt=stmt) for node in nodes]
+
+    def may_jump(self, *closures) -> bool:
+        return any(run in self.jumps for run in closures)
+
+    def jumping(self, run, jumps=True):
+        """
+        Registra que a closure pode retornar Jump.
+        """
+        if jumps:
+            self.jumps.add(run)
+        return run
+
+    # Valores e operadores -----------------------------------------------------
+    def const(self, value):
+        return lambda frame: value
+
+    def unknown(self, data, children):
+        # Como no transformer, os filhos são avaliados antes do erro
+        args = self.compile_all(children)
+
+        def run(frame):
+            for arg in args:
+                arg(frame)
+            raise missing_rule(data)
+
+        return run
+
+    def operator(self, op, children):
+        args = self.compile_all(children)
+        if len(args) == 1:
+            [x] = args
+            return lambda frame: op(x(frame))
+        if len(args) == 2:
+            x, y = args
+            return lambda frame: op(x(frame), y(frame))
+        return lambda frame: op(*[arg(frame) for arg in args])
+
+    def quicken(self, make, op, children):
+        x, y = self.compile_all(children)
+        return QuickSite(make, op, x, y).run
+
+    def name(self, name):
+        name = str(name)
+        scope = self.scope
+        found = [] if scope is None else scope.lookup(name)
+        run = self.global_name(name)
+        for owner, index in reversed(found):
+            if owner is scope:
+                always = scope.is_arg(index) or index in scope.counters  # sempre atribuída
+                if index in scope.cells:
+                    run = self.local_cell(index, None if always else run)
+                elif always:
+                    run = self.local_arg(index)
+                else:
+                    run = self.local_name(index, run)
+            elif index in owner.cells:
+                run = self.captured_cell(scope.captures[owner, index], run)
+            else:
+                run = self.captured(scope.captures[owner, index])  # argumento
+        return run
+
+    def global_name(self, name):
+        def run(frame):
+            try:
+                return frame[0][name]
+            except KeyError:
+                raise ValueError(f"variável inexistente: {name}")
+
+        return run
+
+    def local_arg(self, index):
+        return lambda frame: frame[index]
+
+    def local_name(self, index, outer):
+        def run(frame):
+            value = frame[index]
+            return outer(frame) if value is UNSET else value
+
+        return run
+
+    def local_cell(self, index, outer=None):
+        if outer is None:
+            return lambda frame: frame[index].value
+
+        def run(frame):
+            value = frame[index].value
+            return outer(frame) if value is UNSET else value
+
+        return run
+
+    def captured(self, index):
+        return lambda frame: frame[1][index]
+
+    def captured_cell(self, index, outer):
+        def run(frame):
+            value = frame[1][index].value
+            return outer(frame) if value is UNSET else value
+
+        return run
+
+    def assign(self, name, value):
+        name = str(name)
+        value = self.compile(value)
+        if self.scope is None:
+            def run(frame):
+                frame[0][name] = value(frame)
+        elif self.scope.slots[name] in self.scope.cells:
+            index = self.scope.slots[name]
+
+            def run(frame):
+                frame[index].value = value(frame)
+        else:
+            index = self.scope.slots[name]
+
+            def run(frame):
+                frame[index] = value(frame)
+
+        return run
+
+    # Sequências ---------------------------------------------------------------
+    def seq(self, *children):
+        stmt = self.stmt
+        *init, last = children
+        cmds = self.compile_all(init, stmt) + [self.compile(last, self.tail, stmt)]
+        if len(cmds) == 1:
+            return cmds[0]
+        *init, last = cmds
+
+        if not self.may_jump(*init):
+            def run(frame):
+                for cmd in init:
+                    cmd(frame)
+                return last(frame)
+        else:
+            def run(frame):
+                for cmd in init:
+                    value = cmd(frame)
+                    if type(value) is Jump:
+                        return value
+                return last(frame)
+
+        return self.jumping(run, self.may_jump(*cmds))
+
+    def null(self, *children):
+        cmds = self.compile_all(children, self.stmt)
+
+        if not self.may_jump(*cmds):
+            def run(frame):
+                for cmd in cmds:
+                    cmd(frame)
+        else:
+            def run(frame):
+                for cmd in cmds:
+                    value = cmd(frame)
+                    if type(value) is Jump:
+                        return value
+
+        return self.jumping(run, self.may_jump(*cmds))
+
+    let = null
+
+    def mod(self, *children):
+        self.pure = pure_dependencies(children)
+        fns = self.compile_all(children)
+
+        def run(frame):
+            for fn in fns:
+                fn(frame)
+            return frame[0].maps[0]
+
+        return run
+
+    def xargs(self, *children):
+        return self.tuple_of(self.compile_all(children))
+
+    def tuple_of(self, args):
+        if len(args) == 1:
+            [x] = args
+            return lambda frame: (x(frame),)
+        if len(args) == 2:
+            x, y = args
+            return lambda frame: (x(frame), y(frame))
+        return lambda frame: tuple([arg(frame) for arg in args])
+
+    # Chamadas de função -------------------------------------------------------
+    # Cada chamada tem um cache em linha da função chamada: nomes globais que
+    # não estão no ambiente (funções pré-definidas, como println e sqrt) são
+    # resolvidos uma única vez por ambiente, sem passar por
+    # Namespace.__missing__. Chamadas com até 4 argumentos têm closures
+    # próprias, e funções compiladas sem memorização são executadas
+    # diretamente por run(), sem passar por __call__.
+    def callee(self, name):
+        name = str(name)
+        if self.scope is not None and self.scope.resolve(name):
+            get = self.name(name)
+
+            def run(frame):
+                fn = get(frame)
+                if callable(fn):
+                    return fn
+                raise ValueError(f"{fn} não é uma função!")
+
+            return run
+
+        site = [None, None]  # último ambiente global e função pré-definida
+
+        def run(frame):
+            env = frame[0]
+            fn = env.get(name, UNSET)
+            if fn is UNSET:
+                if env is site[0]:
+                    return site[1]
+                try:
+                    fn = env[name]
+                except KeyError:
+                    raise ValueError(f"variável inexistente: {name}")
+                if callable(fn):
+                    # A camada de nomes pré-definidos não muda durante a
+                    # execução: basta conferir que o nome continua fora do
+                    # ambiente, o que get() já faz
+                    site[:] = env, fn
+            if callable(fn):
+                return fn
+            raise ValueError(f"{fn} não é uma função!")
+
+        return run
+
+    def func(self, name, arg):
+        return self.call_site(name, [self.compile(arg)])
+
+    def call(self, name, args):
+        return self.call_site(name, self.compile_all(args.children))
+
+    def call_site(self, name, args):
+        callee = self.callee(name)
+        if self.tail:
+            return self.tail_call(callee, self.tuple_of(args) if args else self.const(()))
+
+        if len(args) == 0:
+            def run(frame):
+                fn = callee(frame)
+                if type(fn) is CompiledFunction and fn.memo is None:
+                    return fn.run(())
+                return fn()
+        elif len(args) == 1:
+            [a] = args
+
+            def run(frame):
+                x = a(frame)
+                fn = callee(frame)
+                if type(fn) is CompiledFunction and fn.memo is None:
+                    return fn.run((x,))
+                return fn(x)
+        elif len(args) == 2:
+            a, b = args
+
+            def run(frame):
+                x, y = a(frame), b(frame)
+                fn = callee(frame)
+                if type(fn) is CompiledFunction and fn.memo is None:
+                    return fn.run((x, y))
+                return fn(x, y)
+        elif len(args) == 3:
+            a, b, c = args
+
+            def run(frame):
+                x, y, z = a(frame), b(frame), c(frame)
+                fn = callee(frame)
+                if type(fn) is CompiledFunction and fn.memo is None:
+                    return fn.run((x, y, z))
+                return fn(x, y, z)
+        elif len(args) == 4:
+            a, b, c, d = args
+
+            def run(frame):
+                x, y, z, w = a(frame), b(frame), c(frame), d(frame)
+                fn = callee(frame)
+                if type(fn) is CompiledFunction and fn.memo is None:
+                    return fn.run((x, y, z, w))
+                return fn(x, y, z, w)
+        else:
+            def run(frame):
+                values = tuple([arg(frame) for arg in args])
+                fn = callee(frame)
+                if type(fn) is CompiledFunction and fn.memo is None:
+                    return fn.run(values)
+                return fn(*values)
+
+        return run
+
+    def tail_call(self, callee, args):
+        def run(frame):
+            values = args(frame)
+            fn = callee(frame)
+            if type(fn) is CompiledFunction:
+                # Funções memorizadas também: só a chamada externa vai ao cache
+                return TailCall(fn, values)
+            return fn(*values)
+
+        return run
+
+    def ret(self, value):
+        # Dentro de um laço, a chamada precisa acontecer antes de sair dele:
+        # um break na função chamada interrompe o laço
+        value = self.compile(value, self.scope is not None and not self.loops)
+        if self.stmt:
+            return self.jumping(lambda frame: Jump("return", value(frame)))
+
+        def run(frame):
+            raise ReturnValue(value(frame))
+
+        return run
+
+    # Formas especiais ---------------------------------------------------------
+    def and_e(self, x, y):
+        x, y = self.compile(x), self.compile(y, self.tail)
+        return lambda frame: x(frame) and y(frame)
+
+    def or_e(self, x, y):
+        x, y = self.compile(x), self.compile(y, self.tail)
+        return lambda frame: x(frame) or y(frame)
+
+    def if_(self, cond, then, *rest):
+        tail, stmt = self.tail, self.stmt
+        cond, then = self.compile(cond), self.compile(then, tail, stmt)
+        if not rest:
+            run = lambda frame: then(frame) if cond(frame) else None
+            return self.jumping(run, self.may_jump(then))
+        if len(rest) == 1:
+            else_ = self.compile(rest[0], tail, stmt)
+            run = lambda frame: then(frame) if cond(frame) else else_(frame)
+            return self.jumping(run, self.may_jump(then, else_))
+
+        elif_cond, elif_then = self.compile(rest[0]), self.compile(rest[1], tail, stmt)
+        else_ = self.compile(rest[2], tail, stmt) if len(rest) == 3 else self.const(None)
+
+        def run(frame):
+            if cond(frame):
+                return then(frame)
+            elif elif_cond(frame):
+                return elif_then(frame)
+            return else_(frame)
+
+        return self.jumping(run, self.may_jump(then, elif_then, else_))
+
+    # Laços ---------------------------------------------------------------------
+    # O corpo fica em posição de comando: break e continue chegam como BREAK e
+    # CONTINUE, e return como Jump, repassado pelo laço (ou lançado como
+    # exceção, se o laço não está em posição de comando). Os tratadores de
+    # LoopBreak e LoopContinue continuam valendo para os desvios executados
+    # em funções chamadas pelo corpo.
+    def while_(self, cond, block):
+        cond, block = self.compile(cond), self.loop_body(block)
+        if not self.may_jump(block):
+            def run(frame):
+                while cond(frame):
+                    try:
+                        block(frame)
+                    except LoopContinue:
+                        continue
+                    except LoopBreak:
+                        break
+
+            return run
+
+        escape = self.escape()
+
+        def run(frame):
+            while cond(frame):
+                try:
+                    value = block(frame)
+                except LoopContinue:
+                    continue
+                except LoopBreak:
+                    break
+                if type(value) is Jump:
+                    if value is BREAK:
+                        break
+                    if value is not CONTINUE:
+                        return escape(value)
+
+        return self.jumping(run, self.stmt)
+
+    def for_(self, name, expr, block):
+        name = str(name)
+        index = None if self.scope is None else self.scope.slots[name]
+        if isinstance(expr, Node) and expr.data in ("range", "irange"):
+            return self.for_range(name, index, expr, block)
+        place = self.loop_target(name, index)
+        expr, block = self.compile(expr), self.loop_body(block)
+        if not self.may_jump(block):
+            def run(frame):
+                target, key = place(frame)
+                for value in expr(frame):
+                    target[key] = value
+                    try:
+                        block(frame)
+                    except LoopContinue:
+                        continue
+                    except LoopBreak:
+                        break
+
+            return run
+
+        escape = self.escape()
+
+        def run(frame):
+            target, key = place(frame)
+            for value in expr(frame):
+                target[key] = value
+                try:
+                    value = block(frame)
+                except LoopContinue:
+                    continue
+                except LoopBreak:
+                    break
+                if type(value) is Jump:
+                    if value is BREAK:
+                        break
+                    if value is not CONTINUE:
+                        return escape(value)
+
+        return self.jumping(run, self.stmt)
+
+    def for_range(self, name, index, expr, block):
+        # Laço sobre a..b ou a..=b, o caso mais comum: o range é criado pelo
+        # mesmo operador (e com os mesmos erros) do caso geral, e os comandos
+        # do corpo são executados diretamente, sem as closures de seq e null
+        # em volta de cada um.
+        make = getattr(self.operators, expr.data)
+        place = self.loop_target(name, index)
+        start, stop = self.compile_all(expr.children)
+        # No corpo, a variável do laço já foi atribuída: é lida diretamente da
+        # posição no quadro, sem testar UNSET
+        counters = set() if self.scope is None else self.scope.counters
+        fresh = index not in counters
+        counters.add(index)
+        try:
+            cmds = tuple(self.loop_commands(block))
+        finally:
+            if fresh:
+                counters.discard(index)
+
+        if self.may_jump(*cmds):
+            escape = self.escape()
+
+            def run(frame):
+                target, key = place(frame)
+                body = cmds
+                for value in make(start(frame), stop(frame)):
+                    target[key] = value
+                    try:
+                        for cmd in body:
+                            jump = cmd(frame)
+                            if type(jump) is Jump:
+                                break
+                        else:
+                            continue
+                    except LoopContinue:
+                        continue
+                    except LoopBreak:
+                        break
+                    if jump is BREAK:
+                        break
+                    if jump is not CONTINUE:
+                        return escape(jump)
+
+            return self.jumping(run, self.stmt)
+
+        def run(frame):
+            # Variáveis locais em vez das variáveis da closure no laço
+            target, key = place(frame)
+            body = cmds
+            for value in make(start(frame), stop(frame)):
+                target[key] = value
+                try:
+                    for cmd in body:
+                        cmd(frame)
+                except LoopContinue:
+                    continue
+                except LoopBreak:
+                    break
+
+        if index is None or index in self.scope.cells or len(cmds) != 1:
+            return run
+
+        def run_one(frame):
+            [cmd], slot = cmds, index
+            for value in make(start(frame), stop(frame)):
+                frame[slot] = value
+                try:
+                    cmd(frame)
+                except LoopContinue:
+                    continue
+                except LoopBreak:
+                    break
+
+        return run_one
+
+    def loop_target(self, name, index):
+        """
+        Closure que retorna (objeto, chave) em que o laço atribui a variável.
+        """
+        if index is None:
+            return lambda frame: (frame[0], name)
+        if index in self.scope.cells:
+            return lambda frame: (frame[index], None)
+        return lambda frame: (frame, index)
+
+    def loop_body(self, block):
+        self.loops += 1
+        try:
+            return self.compile(block, stmt=True)
+        finally:
+            self.loops -= 1
+
+    def loop_commands(self, block) -> list:
+        """
+        Compila os comandos do corpo de um laço, cujos valores são
+        descartados: let/null de um único filho viram o próprio filho.
+        """
+        cmds = block.children if isinstance(block, Node) and block.data in ("seq", "null") else [block]
+        cmds = [
+            cmd.children[0] if isinstance(cmd, Node) and cmd.data in ("let", "null") and len(cmd.children) == 1 else cmd
+            for cmd in cmds
+        ]
+        self.loops += 1
+        try:
+            return self.compile_all(cmds, stmt=True)
+        finally:
+            self.loops -= 1
+
+    def escape(self):
+        """
+        O que um laço faz com um return vindo do corpo: repassa o Jump em
+        posição de comando, ou lança ReturnValue.
+        """
+        return (lambda jump: jump) if self.stmt else Jump.throw
+
+    def loop_break(self, *children):
+        if self.stmt:
+            return self.jumping(self.const(BREAK))
+
+        def run(frame):
+            raise LoopBreak()
+
+        return run
+
+    def loop_continue(self, *children):
+        if self.stmt:
+            return self.jumping(self.const(CONTINUE))
+
+        def run(frame):
+            raise LoopContinue()
+
+        return run
+
+    def fn(self, name, *args):
+        name = str(name)
+        block = args[-1] if args else None
+        if not (isinstance(block, Node) and block.data in ("seq", "null")):
+            # Chamada de função no nível do módulo: fn : ID "(" xargs? ")" ";"
+            callee = self.name(name)
+            xargs = self.compile(block) if args else self.const(())
+
+            def call(frame):
+                values = xargs(frame)
+                return callee(frame)(*values)
+
+            return call
+
+        make = self.function(name, args)
+        memo = name in self.pure
+        deps = self.pure.get(name, ())
+
+        def run(frame):
+            func = make(frame)
+            if memo:
+                func.memo = MemoCache(deps=deps)
+            frame[0][name] = func
+            return func
+
+        return run
+
+    def lambd(self, *args):
+        return self.function("<lambda>", args)
+
+    def function(self, name, args):
+        *args, block = args
+        names = [str(arg.children[0]) for arg in args[0].children] if args else []
+        outer, loops = self.scope, self.loops
+        scope = Scope(outer, names, block)
+        self.scope, self.loops = scope, 0
+        try:
+            body = self.compile(block, tail=True, stmt=True)
+        finally:
+            self.scope, self.loops = outer, loops
+
+        if scope.cells:
+            # Células novas a cada chamada, com o valor inicial da posição
+            cells, run = tuple(sorted(scope.cells)), body
+
+            def body(frame):
+                for index in cells:
+                    frame[index] = Cell(frame[index])
+                return run(frame)
+
+        code = FunctionCode(name, names, body, scope.unset)
+        capture = self.capture(scope.captures)
+        return lambda frame: CompiledFunction(code, capture(frame))
+
+    def capture(self, captures):
+        """
+        Closure que monta a tupla (globais, capturas...) de uma função criada
+        no quadro atual, a partir das posições de scope.captures.
+        """
+        scope = self.scope
+        places = sorted(captures, key=captures.get)
+        if all(owner is scope for owner, _ in places):
+            indices = [index for _, index in places]
+            if not indices:
+                return lambda frame: (frame[0],)
+            return itemgetter(0, *indices)  # os globais estão em frame[0]
+
+        # Variáveis da função atual vêm do quadro; as de funções mais externas,
+        # das capturas da função atual
+        sources = [
+            (True, index) if owner is scope else (False, scope.captures[owner, index])
+            for owner, index in places
+        ]
+
+        def run(frame):
+            env = frame[1]
+            return (frame[0], *[frame[i] if own else env[i] for own, i in sources])
+
+        return run
+
+
+class FunctionCode:
+    """
+    Parte de uma função compilada comum a todas as funções criadas pela mesma
+    expressão: nome, argumentos, corpo e valores iniciais das variáveis locais
+    que não são argumentos (unset).
+    """
+
+    __slots__ = ("name", "args", "body", "unset")
+
+    def __init__(self, name, args, body, unset=()):
+        self.name = name
+        self.args = args
+        self.body = body
+        self.unset = unset
+
+
+class CompiledFunction:
+    """
+    Função ruspy cujo corpo foi compilado para uma closure.
+
+    code é o FunctionCode compartilhado e env a tupla (globais, capturas...)
+    com os valores e células das variáveis dos escopos externos lidas pela
+    função. Chamadas em posição de cauda retornadas pelo corpo (TailCall) são
+    executadas no mesmo laço. memo é o cache de resultados (MemoCache) de
+    funções puras, ou None.
+    """
+
+    __slots__ = ("code", "env", "memo")
+
+    def __init__(self, code, env):
+        self.code = code
+        self.env = env
+        self.memo = None
+
+    def __repr__(self):
+        return f"<fn {self.code.name}>"
+
+    @property
+    def name(self):
+        return self.code.name
+
+    @property
+    def args(self):
+        return self.code.args
+
+    def __call__(self, *args):
+        if self.memo is not None:
+            return self.memo.call(self, args)
+        return self.run(args)
+
+    def run(self, args):
+        fn = self
+        while True:
+            code = fn.code
+            if len(args) != len(code.args):
+                raise TypeError(
+                    f"{code.name}() espera {len(code.args)} argumento(s), recebeu {len(args)}"
+                )
+            env = fn.env
+            try:
+                value = code.body([env[0], env, *args, *code.unset])
+            except ReturnValue as ret:
+                value = ret.value
+            if type(value) is Jump:
+                if value.kind != "return":
+                    value.throw()  # break/continue fora de um laço
+                value = value.value
+            if type(value) is not TailCall:
+                return value
+            fn = value.fn
+            args = value.args
+
+
+class Namespace(dict):
+    """
+    Definições do usuário sobre uma camada base compartilhada.
+
+    Nomes ausentes são procurados em base (por padrão BUILTINS), que não é
+    copiada nem alterada: criar um ambiente custa o mesmo qualquer que seja o
+    número de nomes pré-definidos, e ler uma definição do usuário é uma busca
+    comum em dicionário. Atribuições, iteração, len() e `in` veem somente as
+    definições do usuário.
+
+    maps e new_child() imitam a interface de ChainMap, usada pelos escopos de
+    função do transformer.
+    """
+
+    __slots__ = ("base",)
+
+    def __init__(self, data=(), base=None):
+        super().__init__(data)
+        self.base = BUILTINS if base is None else base
+
+    def __missing__(self, name):
+        return self.base[name]
+
+    @property
+    def maps(self) -> list:
+        return [self, self.base]
+
+    def new_child(self, m=None) -> ChainMap:
+        return ChainMap({} if m is None else m, self)
+
+
+BUILTINS = MappingProxyType(RuspyTransformer.global_names)
+
+
+def new_env(base=None) -> Namespace:
+    """
+    Ambiente global novo: definições do usuário sobre os nomes pré-definidos
+    (BUILTINS ou base).
+    """
+    return Namespace(base=base)
+
+
+def run_tree(tree, env=None):
+    """
+    Executa a árvore com o interpretador de árvores (RuspyTransformer).
+    """
+    return RuspyTransformer(env).transform(tree)
+
+
+def run_closure(tree, env=None):
+    """
+    Compila a árvore para closures e as executa.
+    """
+    if env is None:
+        env = new_env()
+    try:
+        code = RuspyCompiler().compile(tree)
+    except RecursionError:
+        # Cada nível da árvore vira uma closure aninhada. Árvores profundas
+        # demais (ex.: expressões geradas por programas) vão para a máquina
+        # virtual, que não usa a pilha do Python para avaliar expressões.
+        return run_vm(tree, env)
+    return code([env, None])
+
+
+# Memorização de funções puras ------------------------------------------------
+
+# Funções do módulo sem efeitos colaterais, que dependem somente dos
+# argumentos, são memorizadas automaticamente pelo compilador de closures: cada
+# uma ganha um cache LRU próprio com no máximo MEMO_SIZE resultados. Uma função
+# é pura quando o corpo
+#
+# * lê somente argumentos, variáveis locais, constantes pré-definidas
+#   (PURE_CONSTANTS) e outras funções do módulo;
+# * chama somente funções puras do módulo e de PURE_FUNCTIONS (println, por
+#   exemplo, é impura);
+# * não cria funções anônimas nem executa break/continue fora de um laço.
+#
+# Os resultados dependem também das funções do módulo chamadas, direta ou
+# indiretamente, e da própria função (nas chamadas recursivas). O cache guarda
+# os valores globais desses nomes e é esvaziado quando algum deles é
+# redefinido (ex.: mod["g"] = outra_função).
+#
+# No código ruspy, memo(f); e nomemo(f); no nível do módulo, depois da
+# definição de f, ligam e desligam a memorização (veja memo()). memo_stats()
+# mostra as taxas de acerto.
+
+MEMO_SIZE = 1024
+MEMO_TYPES = (int, str)  # tipos dos argumentos usados como chave
+
+
+class MemoCache:
+    """
+    Cache LRU dos resultados de uma função, com estatísticas de uso.
+
+    Somente chamadas cujos argumentos são int ou str usam o cache (1 e 1.0,
+    por exemplo, seriam a mesma chave de um dicionário). Erros não são
+    guardados.
+
+    deps são os nomes globais de que os resultados dependem: os valores
+    guardados valem enquanto esses nomes não forem redefinidos.
+    """
+
+    __slots__ = ("values", "maxsize", "hits", "misses", "deps", "bound")
+
+    def __init__(self, maxsize=MEMO_SIZE, deps=()):
+        self.values = OrderedDict()
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self.deps = deps
+        self.bound = None  # valores de deps quando os resultados foram guardados
+
+    def call(self, fn, args):
+        for arg in args:
+            if type(arg) not in MEMO_TYPES:
+                return fn.run(args)
+        values = self.values
+        if self.deps:
+            bound = tuple(map(fn.env[0].get, self.deps))
+            if bound != self.bound:
+                values.clear()
+                self.bound = bound
+        try:
+            value = values[args]
+        except KeyError:
+            self.misses += 1
+            value = values[args] = fn.run(args)
+            if len(values) > self.maxsize:
+                values.popitem(last=False)
+            return value
+        self.hits += 1
+        values.move_to_end(args)
+        return value
+
+    def info(self) -> dict:
+        calls = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "size": len(self.values),
+            "maxsize": self.maxsize,
+            "hit_rate": self.hits / calls if calls else 0.0,
+        }
+
+
+def pure_functions(fns) -> set:
+    """
+    Nomes das funções puras entre as declarações fn de um módulo.
+    """
+    return set(pure_dependencies(fns))
+
+
+def pure_dependencies(fns) -> dict:
+    """
+    Funções puras entre as declarações fn de um módulo, cada uma com os nomes
+    de que os seus resultados dependem: ela mesma e as funções do módulo que
+    chama, direta ou indiretamente.
+    """
+    bodies = {}
+    defined = {}
+    for fn in fns:
+        name, *args = fn.children
+        block = args[-1] if args else None
+        if isinstance(block, Node) and block.data in ("seq", "null"):
+            bodies[name] = fn
+            defined[name] = defined.get(name, 0) + 1
+
+    calls = {}
+    for name, fn in bodies.items():
+        if defined[name] == 1:
+            calls[name] = function_calls(fn, bodies)
+    pure = {name for name, called in calls.items() if called is not None}
+
+    # Funções que chamam funções impuras do módulo também são impuras
+    changed = True
+    while changed:
+        changed = False
+        for name in list(pure):
+            if not calls[name] <= pure:
+                pure.discard(name)
+                changed = True
+
+    deps = {}
+    for name in pure:
+        seen = {name}
+        stack = [name]
+        while stack:
+            for callee in calls[stack.pop()] - seen:
+                seen.add(callee)
+                stack.append(callee)
+        deps[name] = tuple(sorted(seen))
+    return deps
+
+
+def function_calls(fn, module) -> set:
+    """
+    Funções do módulo chamadas por fn, ou None se fn tiver efeitos
+    colaterais ou depender de valores globais.
+    """
+    _, *args = fn.children
+    *args, block = args
+    local = {arg.children[0] for arg in args[0].children} if args else set()
+    local |= assigned_names(block)
+    calls = set()
+    stack = [(block, False)]
+    while stack:
+        node, in_loop = stack.pop()
+        if not isinstance(node, Node):
+            continue
+        data = node.data
+        if data in ("lambd", "fn"):
+            return None
+        if data in ("loop_break", "loop_continue") and not in_loop:
+            return None
+        if data in ("name", "func", "call"):
+            name = node.children[0]
+            if name in local:
+                # Chamadas de argumentos podem ter qualquer efeito
+                if data != "name" or name in module:
+                    return None
+            elif name in module:
+                calls.add(name)
+            elif name not in (PURE_CONSTANTS if data == "name" else PURE_FUNCTIONS):
+                return None
+        in_loop = in_loop or data in ("while_", "for_")
+        stack.extend((child, in_loop) for child in node.children)
+    return calls
+
+
+def memo_stats(namespace) -> dict:
+    """
+    Estatísticas dos caches das funções memorizadas de um módulo.
+    """
+    return {
+        name: value.memo.info()
+        for name, value in namespace.items()
+        if isinstance(value, CompiledFunction) and value.memo is not None
+    }
+
+
+# Compilação para bytecode Python ---------------------------------------------
+
+# PythonCompiler traduz a árvore de nós para um ast.Module do Python, que é
+# compilado com compile() e executado com exec(). Funções ruspy viram funções
+# Python de verdade, laços viram laços nativos e blocos viram comandos que
+# guardam o seu valor em variáveis temporárias.
+#
+# Os nomes pré-definidos e as funções auxiliares do compilador ficam no
+# dicionário __builtins__ do módulo gerado. Os nomes auxiliares e temporários
+# ("ruspy.div_", "$1", ...) não são identificadores válidos em ruspy e, por
+# isso, não colidem com as variáveis do programa.
+#
+# O Python decide em tempo de compilação quais nomes são locais, enquanto o
+# ambiente ruspy procura a variável na cadeia de escopos no momento da leitura.
+# Quando uma função lê uma variável local que pode ainda não ter sido
+# atribuída, o resultado seria diferente: o compilador levanta NotCompilable e
+# run_python() executa o programa com o compilador de closures.
+
+PY_RESULT = "$result"
+PY_RESERVED = {"None", "True", "False", "__debug__"}
+PY_BINOPS = {
+    "add": ast.Add,
+    "sub": ast.Sub,
+    "mul": ast.Mult,
+    "div": ast.Div,
+    "pow": ast.Pow,
+    "rest": ast.Mod,
+    "rshift": ast.RShift,
+    "lshift": ast.LShift,
+    "or_": ast.BitOr,
+    "and_": ast.BitAnd,
+    "xor": ast.BitXor,
+}
+PY_COMPARE = {"eq": ast.Eq, "ne": ast.NotEq, "gt": ast.Gt, "lt": ast.Lt, "ge": ast.GtE, "le": ast.LtE}
+PY_UNARY = {"neg": ast.USub, "pos": ast.UAdd}
+PY_JUMPS = (ast.Return, ast.Raise, ast.Break, ast.Continue)
+
+
+class NotCompilable(Exception):
+    """
+    O programa usa uma construção que o PythonCompiler não reproduz fielmente.
+    """
+
+
+class PyScope:
+    """
+    Escopo de uma função durante a compilação.
+
+    assigned guarda os nomes atribuídos em algum ponto do corpo (locais em
+    Python) e defined os que certamente já foram atribuídos no ponto atual da
+    compilação.
+    """
+
+    __slots__ = ("parent", "assigned", "defined", "loops")
+
+    def __init__(self, parent, assigned=(), defined=()):
+        self.parent = parent
+        self.assigned = set(assigned)
+        self.defined = set(defined)
+        self.loops = 0
+
+    @property
+    def is_function(self):
+        return self.parent is not None
+
+
+class PythonCompiler:
+    """
+    Traduz árvores de nós Node para código Python.
+
+    Cada regra tem um método com o mesmo nome que recebe os filhos do nó e
+    retorna um par (comandos, expressão): os comandos devem ser executados
+    antes de avaliar a expressão, que produz o valor do nó. Operadores e
+    comparações viram operadores do Python; as demais regras puras usam o
+    método do RuspyTransformer, como no RuspyCompiler.
+
+    Funções com chamadas em posição de cauda têm duas versões: a pública faz
+    essas chamadas com py_tail_call() e a usada por py_tail_call() as retorna
+    como TailCall, como em CompiledFunction.
+
+    >>> code, helpers = PythonCompiler().compile(ast_expr.parse("x = 20; x * 2 + 2"))
+    >>> env = {"__builtins__": helpers}
+    >>> exec(code, env)
+    >>> env[PY_RESULT]
+    42
+    """
+
+    def __init__(self):
+        self.operators = RuspyTransformer(ChainMap())
+        self.helpers = {}
+        self.scope = PyScope(None)
+        self.counter = 0
+        self.tails = 0  # chamadas em posição de cauda compiladas
+        self.tail_loop = None  # (nome, argumentos, variável com a própria função)
+        self.tail_scope = self.scope
+        self.looping = False
+
+    def compile(self, tree) -> tuple:
+        """
+        Retorna o objeto de código e o dicionário de nomes pré-definidos e
+        auxiliares que deve ser usado como __builtins__.
+        """
+        stmts, expr = self.value(tree)
+        stmts.append(ast.Assign([py_store(PY_RESULT)], expr))
+        module = ast.fix_missing_locations(ast.Module(stmts, type_ignores=[]))
+        code = compile(module, "<ruspy>", "exec")
+        return code, Namespace(self.helpers)
+
+    # Auxiliares ---------------------------------------------------------------
+    def temp(self) -> str:
+        self.counter += 1
+        return f"${self.counter}"
+
+    def helper(self, name, obj) -> ast.expr:
+        key = f"ruspy.{name}"
+        self.helpers[key] = obj
+        return py_load(key)
+
+    def value(self, node) -> tuple:
+        """
+        Compila um nó para (comandos, expressão).
+        """
+        if not isinstance(node, Node):
+            return [], ast.Constant(node)  # literal decodificado durante a análise
+
+        data = node.data
+        children = node.children
+        method = getattr(self, data, None)
+        if method is not None:
+            return method(*children)
+        if data in PY_BINOPS:
+            stmts, (x, y) = self.values(children)
+            return stmts, ast.BinOp(x, PY_BINOPS[data](), y)
+        if data in PY_COMPARE:
+            stmts, (x, y) = self.values(children)
+            return stmts, ast.Compare(x, [PY_COMPARE[data]()], [y])
+        if data in PY_UNARY:
+            stmts, [x] = self.values(children)
+            return stmts, ast.UnaryOp(PY_UNARY[data](), x)
+        op = getattr(self.operators, data, None)
+        if op is None or data in RuspyTransformer.special:
+            return self.unknown(data, children)
+        stmts, args = self.values(children)
+        return stmts, ast.Call(self.helper(data, op), args, [])
+
+    def values(self, nodes) -> tuple:
+        """
+        Compila uma lista de nós avaliados da esquerda para a direita.
+        """
+        stmts, exprs = [], []
+        for node in nodes:
+            cmds, expr = self.value(node)
+            if cmds:
+                # Os valores anteriores precisam ser calculados antes dos
+                # comandos deste nó
+                for i, prev in enumerate(exprs):
+                    if not isinstance(prev, ast.Constant):
+                        name = self.temp()
+                        stmts.append(ast.Assign([py_store(name)], prev))
+                        exprs[i] = py_load(name)
+                stmts.extend(cmds)
+            exprs.append(expr)
+        return stmts, exprs
+
+    def discard(self, node) -> list:
+        """
+        Comandos que avaliam o nó e descartam o seu valor.
+        """
+        stmts, expr = self.value(node)
+        if isinstance(expr, ast.Name) and expr.id in self.scope.defined:
+            return stmts
+        if not isinstance(expr, ast.Constant):
+            stmts.append(ast.Expr(expr))
+        return stmts
+
+    def branch(self, fn, *args):
+        # Atribuições feitas em ramos condicionais não valem depois deles
+        defined = set(self.scope.defined)
+        try:
+            return fn(*args)
+        finally:
+            self.scope.defined = defined
+
+    def unknown(self, data, children):
+        stmts = []
+        for child in children:
+            stmts.extend(self.discard(child))
+        error = ast.Call(self.helper("missing_rule", missing_rule), [ast.Constant(data)], [])
+        stmts.append(ast.Raise(error, None))
+        return stmts, ast.Constant(None)
+
+    # Variáveis ----------------------------------------------------------------
+    def name(self, name):
+        if name in PY_RESERVED:
+            raise NotCompilable(f"nome reservado em Python: {name}")
+        scope = self.scope
+        while scope.is_function:
+            if name in scope.assigned:
+                if name not in scope.defined:
+                    raise NotCompilable(f"{name} pode ser lido antes de ser atribuído")
+                break
+            scope = scope.parent
+        return [], py_load(name)
+
+    def assign(self, name, value):
+        if name in PY_RESERVED:
+            raise NotCompilable(f"nome reservado em Python: {name}")
+        stmts, expr = self.value(value)
+        stmts.append(ast.Assign([py_store(name)], expr))
+        self.scope.defined.add(name)
+        return stmts, ast.Constant(None)
+
+    # Sequências ---------------------------------------------------------------
+    def seq(self, *children):
+        *init, last = children
+        stmts = []
+        for child in init:
+            stmts.extend(self.discard(child))
+        cmds, expr = self.value(last)
+        return stmts + cmds, expr
+
+    def null(self, *children):
+        stmts = []
+        for child in children:
+            stmts.extend(self.discard(child))
+        return stmts, ast.Constant(None)
+
+    let = mod = null
+
+    def xargs(self, *children):
+        stmts, args = self.values(children)
+        return stmts, ast.Tuple(args, ast.Load())
+
+    # Chamadas de função -------------------------------------------------------
+    def func(self, name, arg):
+        stmts, [fn, arg] = self.values([Node("name", [name]), arg])
+        return stmts, ast.Call(fn, [arg], [])
+
+    def call(self, name, args):
+        stmts, [fn, *args] = self.values([Node("name", [name]), *args.children])
+        return stmts, ast.Call(fn, args, [])
+
+    def ret(self, value):
+        stmts, expr = self.value(value)
+        if self.scope.is_function:
+            stmts.append(ast.Return(expr))
+        else:
+            error = ast.Call(self.helper("ReturnValue", ReturnValue), [expr], [])
+            stmts.append(ast.Raise(error, None))
+        return stmts, ast.Constant(None)
+
+    # Formas especiais ---------------------------------------------------------
+    def and_e(self, x, y, negate=False):
+        stmts, x = self.value(x)
+        cmds, y = self.branch(self.value, y)
+        if not cmds:
+            op = ast.Or() if negate else ast.And()
+            return stmts, ast.BoolOp(op, [x, y])
+        name = self.temp()
+        test = py_load(name)
+        if negate:
+            test = ast.UnaryOp(ast.Not(), test)
+        stmts.append(ast.Assign([py_store(name)], x))
+        stmts.append(ast.If(test, cmds + [ast.Assign([py_store(name)], y)], []))
+        return stmts, py_load(name)
+
+    def or_e(self, x, y):
+        return self.and_e(x, y, negate=True)
+
+    def if_(self, cond, then, *rest):
+        # Mesma interpretação dos filhos que RuspyTransformer.if_
+        if len(rest) == 1:
+            branches, else_ = [(cond, then)], rest[0]
+        else:
+            branches, else_ = [(cond, then), *zip(rest[:1], rest[1:2])], None
+            if len(rest) == 3:
+                else_ = rest[2]
+
+        compiled = []
+        for i, (cond, then) in enumerate(branches):
+            # Somente a primeira condição é sempre avaliada
+            test = self.value(cond) if i == 0 else self.branch(self.value, cond)
+            compiled.append((test, self.branch(self.value, then)))
+        otherwise = self.branch(self.value, else_) if else_ is not None else ([], ast.Constant(None))
+
+        simple = not otherwise[0] and all(
+            not cmds and (i == 0 or not stmts) for i, ((stmts, _), (cmds, _)) in enumerate(compiled)
+        )
+        if simple:
+            expr = otherwise[1]
+            for (_, test), (_, value) in reversed(compiled[1:]):
+                expr = ast.IfExp(test, value, expr)
+            (stmts, test), (_, value) = compiled[0]
+            return stmts, ast.IfExp(test, value, expr)
+
+        name = self.temp()
+
+        def result(cmds, expr):
+            # Ramos que terminam em return, break etc não produzem valor
+            if cmds and isinstance(cmds[-1], PY_JUMPS):
+                return cmds
+            return cmds + [ast.Assign([py_store(name)], expr)]
+
+        orelse = result(*otherwise)
+        for (stmts, test), then in reversed(compiled):
+            orelse = stmts + [ast.If(test, result(*then), orelse)]
+        return orelse, py_load(name)
+
+    def while_(self, cond, block):
+        stmts, test = self.value(cond)
+        body = self.loop_body(block)
+        if stmts:
+            exit = ast.If(ast.UnaryOp(ast.Not(), test), [ast.Break()], [])
+            loop = ast.While(ast.Constant(True), stmts + [exit] + body, [])
+        else:
+            loop = ast.While(test, body, [])
+        return [loop], ast.Constant(None)
+
+    def for_(self, name, expr, block):
+        if name in PY_RESERVED:
+            raise NotCompilable(f"nome reservado em Python: {name}")
+        stmts, iterable = self.value(expr)
+        body = self.loop_body(block, name)
+        stmts.append(ast.For(py_store(name), iterable, body, []))
+        return stmts, ast.Constant(None)
+
+    def loop_body(self, block, name=None):
+        scope = self.scope
+        defined = set(scope.defined)
+        if name is not None:
+            scope.defined.add(name)
+        scope.loops += 1
+        try:
+            body = self.discard(block) or [ast.Pass()]
+        finally:
+            scope.loops -= 1
+            scope.defined = defined
+
+        # break/continue executados dentro de funções chamadas pelo corpo
+        # chegam como exceções
+        if has_calls(block):
+            handlers = [
+                ast.ExceptHandler(self.helper("LoopContinue", LoopContinue), None, [ast.Continue()]),
+                ast.ExceptHandler(self.helper("LoopBreak", LoopBreak), None, [ast.Break()]),
+            ]
+            body = [ast.Try(body, handlers, [], [])]
+        return body
+
+    def loop_break(self, *children):
+        if self.scope.loops:
+            return [ast.Break()], ast.Constant(None)
+        error = ast.Call(self.helper("LoopBreak", LoopBreak), [], [])
+        return [ast.Raise(error, None)], ast.Constant(None)
+
+    def loop_continue(self, *children):
+        if self.scope.loops:
+            return [ast.Continue()], ast.Constant(None)
+        error = ast.Call(self.helper("LoopContinue", LoopContinue), [], [])
+        return [ast.Raise(error, None)], ast.Constant(None)
+
+    def fn(self, name, *args):
+        block = args[-1] if args else None
+        if not (isinstance(block, Node) and block.data in ("seq", "null")):
+            # Chamada de função no nível do módulo: fn : ID "(" xargs? ")" ";"
+            return self.call(name, block if args else Node("xargs", []))
+
+        if name in PY_RESERVED:
+            raise NotCompilable(f"nome reservado em Python: {name}")
+        stmts = self.function(name, *args)
+        self.scope.defined.add(name)
+        return stmts, py_load(name)
+
+    def lambd(self, *args):
+        stmts = self.function("<lambda>", *args)
+        return stmts, py_load("<lambda>")
+
+    def function(self, name, *args) -> list:
+        *args, block = args
+        names = [arg.children[0] for arg in args[0].children] if args else []
+        if len(set(names)) != len(names) or PY_RESERVED.intersection(names):
+            raise NotCompilable(f"argumentos inválidos em Python: {names}")
+
+        parent = self.scope
+        self.scope = scope = PyScope(parent, assigned_names(block) | set(names), names)
+        try:
+            stmts, expr = self.value(block)
+        finally:
+            self.scope = parent
+        stmts.append(ast.Return(expr))
+        self.tail_scope = scope
+
+        # Recursões em cauda diretas viram um laço no corpo da função. Funções
+        # internas capturariam as variáveis compartilhadas entre as iterações.
+        tail_name, self_name = self.temp(), self.temp()
+        self.tail_loop = None if has_functions(block) else (name, names, self_name)
+        self.looping = False
+        tails = self.tails
+        body = self.tail_calls(deepcopy(stmts), TailCall)
+        if self.tails == tails:
+            return [self.function_def(name, names, stmts)]
+        stmts = self.tail_calls(stmts, py_tail_call)
+        decorator = ast.Call(self.helper("py_tail_body", py_tail_body), [py_load(tail_name)], [])
+        if not self.looping:
+            return [self.function_def(tail_name, names, body), self.function_def(name, names, stmts, [decorator])]
+        body = [ast.While(ast.Constant(True), body, [])]
+        stmts = [ast.While(ast.Constant(True), stmts, [])]
+        return [
+            self.function_def(tail_name, names, body),
+            self.function_def(name, names, stmts, [decorator]),
+            # Referência à função que não muda se o nome for redefinido
+            ast.Assign([py_store(self_name)], py_load(name)),
+        ]
+
+    def function_def(self, name, names, stmts, decorators=()) -> ast.FunctionDef:
+        # Nomes globais inexistentes levantam o mesmo erro dos outros mecanismos
+        # também quando a função é chamada depois, a partir do Python.
+        error = ast.Call(self.helper("missing_name", missing_name), [py_load("$error")], [])
+        handler = ast.ExceptHandler(self.helper("NameError", NameError), "$error", [ast.Raise(error, py_load("$error"))])
+        stmts = [ast.Try(stmts, [handler], [], [])]
+        arguments = ast.arguments(
+            posonlyargs=[],
+            args=[ast.arg(name) for name in names],
+            kwonlyargs=[],
+            kw_defaults=[],
+            defaults=[],
+        )
+        return ast.FunctionDef(name, arguments, stmts, decorator_list=list(decorators), returns=None)
+
+    # Chamadas em posição de cauda ---------------------------------------------
+    def tail_calls(self, stmts, call) -> list:
+        """
+        Troca as chamadas retornadas em stmts (fora de laços), fn(*args), por
+        call(fn, args). Modifica stmts.
+
+        Um break na função chamada precisa interromper o laço em que está o
+        return, portanto os comandos dentro de laços não são alterados.
+        """
+        for i in range(1, len(stmts)):
+            # if compilado como comando: "if ...: $1 = f(x) ... return $1"
+            ret, prev = stmts[i], stmts[i - 1]
+            if isinstance(ret, ast.Return) and isinstance(ret.value, ast.Name) and isinstance(prev, ast.If):
+                name = ret.value.id
+                if name.startswith("$"):
+                    self.tail_branches(prev, name)
+
+        result = []
+        for stmt in stmts:
+            if isinstance(stmt, ast.Return) and stmt.value is not None:
+                result.extend(self.tail_return(stmt.value, call))
+            else:
+                if isinstance(stmt, ast.If):
+                    stmt.body = self.tail_calls(stmt.body, call)
+                    stmt.orelse = self.tail_calls(stmt.orelse, call)
+                result.append(stmt)
+        return result
+
+    def is_global(self, name) -> bool:
+        # Somente chamadas a funções globais passam pelo trampolim: argumentos
+        # e variáveis locais (ex.: head(lst) = lst(true)) são chamados
+        # diretamente.
+        if name.startswith(("ruspy.", "$")):
+            return False
+        scope = self.tail_scope
+        while scope.is_function:
+            if name in scope.assigned:
+                return False
+            scope = scope.parent
+        return True
+
+    def tail_branches(self, stmt, name):
+        # Ramos que terminam atribuindo o valor de retorno passam a retorná-lo
+        for branch in (stmt.body, stmt.orelse):
+            last = branch[-1] if branch else None
+            if isinstance(last, ast.If):
+                self.tail_branches(last, name)
+            elif isinstance(last, ast.Assign) and [t.id for t in last.targets if isinstance(t, ast.Name)] == [name]:
+                branch[-1] = ast.Return(last.value)
+
+    def tail_return(self, expr, call) -> list:
+        """
+        Comandos equivalentes a "return expr" com as chamadas em posição de
+        cauda de expr, fn(*args), trocadas por call(fn, args).
+        """
+        if isinstance(expr, ast.Call) and isinstance(expr.func, ast.Name) and self.is_global(expr.func.id):
+            self.tails += 1
+            name = self.temp()
+            stmts = [ast.Assign([py_store(name)], expr.func)]
+            loop = self.tail_loop
+            if loop is not None and expr.func.id == loop[0] and len(expr.args) == len(loop[1]):
+                # A própria função: atualiza os argumentos e volta ao início
+                self.looping = True
+                test = ast.Compare(py_load(name), [ast.Is()], [py_load(loop[2])])
+                targets = ast.Tuple([py_store(arg) for arg in loop[1]], ast.Store())
+                again = [ast.Assign([targets], ast.Tuple(expr.args, ast.Load())), ast.Continue()]
+                stmts.append(ast.If(test, again, []))
+            args = ast.Tuple(expr.args, ast.Load())
+            if call is TailCall:
+                stmts.append(ast.Return(ast.Call(self.helper("TailCall", TailCall), [py_load(name), args], [])))
+                return stmts
+            # Funções sem a versão ruspy_tail são chamadas diretamente
+            test = ast.Call(self.helper("hasattr", hasattr), [py_load(name), ast.Constant("ruspy_tail")], [])
+            tail = ast.Call(self.helper("py_tail_call", py_tail_call), [py_load(name), args], [])
+            direct = ast.Call(py_load(name), expr.args, [])
+            stmts.append(ast.Return(ast.IfExp(test, tail, direct)))
+            return stmts
+        if isinstance(expr, ast.IfExp):
+            return [ast.If(expr.test, self.tail_return(expr.body, call), self.tail_return(expr.orelse, call))]
+        if isinstance(expr, ast.BoolOp):
+            # x && y: retorna x se for falso, senão retorna y
+            *init, last = expr.values
+            first = init[0] if len(init) == 1 else ast.BoolOp(expr.op, init)
+            name = self.temp()
+            test = py_load(name)
+            if isinstance(expr.op, ast.And):
+                test = ast.UnaryOp(ast.Not(), test)
+            return [
+                ast.Assign([py_store(name)], first),
+                ast.If(test, [ast.Return(py_load(name))], []),
+                *self.tail_return(last, call),
+            ]
+        return [ast.Return(expr)]
+
+
+def py_tail_call(fn, args):
+    """
+    Faz a chamada em posição de cauda fn(*args) de uma função gerada pelo
+    PythonCompiler.
+
+    Funções com chamadas em posição de cauda são executadas pela versão que
+    as retorna como TailCall (ruspy_tail), e as chamadas retornadas são feitas
+    por este laço: a pilha do Python não cresce em recursões em cauda,
+    inclusive mútuas.
+    """
+    while True:
+        tail = getattr(fn, "ruspy_tail", None)
+        if tail is None:
+            return fn(*args)
+        result = tail(*args)
+        if type(result) is not TailCall:
+            return result
+        fn, args = result.fn, result.args
+
+
+def py_tail_body(tail):
+    """
+    Decorador que associa a uma função gerada pelo PythonCompiler a sua versão
+    que retorna as chamadas em posição de cauda (veja py_tail_call).
+    """
+
+    def decorator(fn):
+        tail.__name__ = tail.__qualname__ = fn.__name__
+        fn.ruspy_tail = tail
+        return fn
+
+    return decorator
+
+
+def missing_name(error: NameError) -> ValueError:
+    """
+    Erro de variável inexistente correspondente a um NameError do código
+    gerado pelo PythonCompiler.
+    """
+    return ValueError(f"variável inexistente: {error.name}")
+
+
+def py_load(name) -> ast.Name:
+    return ast.Name(name, ast.Load())
+
+
+def py_store(name) -> ast.Name:
+    return ast.Name(name, ast.Store())
+
+
+def assigned_names(node) -> set:
+    """
+    Nomes atribuídos (assign e for_) em node, sem entrar em funções anônimas.
+    """
+    names = set()
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Node) and node.data != "lambd":
+            if node.data in ("assign", "for_"):
+                names.add(node.children[0])
+            stack.extend(node.children)
+    return names
+
+
+def function_parts(node):
+    """
+    Argumentos e corpo de um nó lambd ou de uma declaração fn, ou None se node
+    não define uma função.
+    """
+    if not isinstance(node, Node) or node.data not in ("lambd", "fn") or not node.children:
+        return None
+    children = node.children[1:] if node.data == "fn" else node.children
+    if not children:
+        return None
+    *args, block = children
+    if node.data == "fn" and not (isinstance(block, Node) and block.data in ("seq", "null")):
+        return None  # chamada de função no nível do módulo
+    return [str(arg.children[0]) for arg in args[0].children] if args else [], block
+
+
+def function_reads(node) -> tuple:
+    """
+    Nomes lidos em node (fora das funções definidas nele) e nomes livres das
+    funções definidas em node.
+    """
+    reads, inner = set(), set()
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if not isinstance(node, Node):
+            continue
+        function = function_parts(node)
+        if function is not None:
+            inner |= free_names(*function)
+            continue
+        if node.data in ("name", "func", "call", "fn"):
+            reads.add(node.children[0])
+        stack.extend(node.children)
+    return reads, inner
+
+
+def free_names(args, block) -> set:
+    """
+    Nomes que uma função procura nos escopos externos: lidos no corpo ou nas
+    funções internas, exceto os argumentos. Variáveis locais também entram,
+    pois são procuradas fora enquanto não forem atribuídas.
+
+    >>> sorted(free_names(["x"], ast_expr.parse("|y| x + y + z")))
+    ['z']
+    """
+    reads, inner = function_reads(block)
+    return (reads | inner).difference(args)
+
+
+def has_functions(node) -> bool:
+    """
+    Verifica se node define funções (fn ou funções anônimas).
+    """
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Node):
+            if function_parts(node) is not None:
+                return True
+            stack.extend(node.children)
+    return False
+
+
+def has_calls(node) -> bool:
+    """
+    Verifica se node contém chamadas de função (fora de funções anônimas).
+    """
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, Node) and node.data != "lambd":
+            if node.data in ("func", "call", "fn"):
+                return True
+            stack.extend(node.children)
+    return False
+
+
+def run_python(tree, env=None):
+    """
+    Compila a árvore para bytecode Python e a executa.
+
+    Módulos retornam um Namespace com as funções definidas, que são funções
+    Python comuns, como os demais mecanismos. Programas que o compilador não reproduz fielmente (veja
+    NotCompilable) e ambientes explícitos são executados por run_closure().
+    """
+    if env is not None:
+        return run_closure(tree, env)
+    try:
+        code, names = PythonCompiler().compile(tree)
+    except (NotCompilable, SyntaxError, ValueError, RecursionError):
+        return run_closure(tree)
+
+    env = {"__builtins__": names}
+    try:
+        exec(code, env)
+    except NameError as ex:
+        raise missing_name(ex) from ex
+    if isinstance(tree, Node) and tree.data == "mod":
+        return Namespace({k: v for k, v in env.items() if not k.startswith(("$", "<", "__builtins__"))})
+    return env[PY_RESULT]
+
+
+# Máquina virtual de pilha ----------------------------------------------------
+
+# BytecodeCompiler traduz a árvore de nós para objetos de código (CodeObject):
+# um vetor de instruções, uma tabela de constantes e uma tabela de nomes. Cada
+# instrução ocupa duas posições do vetor (código da operação e argumento); os
+# saltos usam a posição de destino no vetor. VirtualMachine executa esses
+# objetos com uma pilha de valores, da mesma forma que o interpretador do
+# CPython executa bytecode.
+#
+# break/continue executados dentro de funções chamadas pelo corpo de um laço
+# chegam como exceções (LoopBreak/LoopContinue). Cada laço cujo corpo faz
+# chamadas registra uma entrada na tabela handlers do objeto de código, que
+# diz para onde saltar e quantos valores manter na pilha.
+#
+# Chamadas em posição de cauda dentro de funções usam TAIL_CALL: se a função
+# chamada também é da máquina virtual, run() retorna TailCall e a chamada é
+# feita pelo laço de VmFunction.__call__.
+
+OP_NAMES = (
+    "CONST", "LOAD", "STORE", "POP", "DUP", "UNARY", "BINARY", "BUILD_TUPLE",
+    "CALL", "CALL_FN", "JUMP", "JUMP_IF_FALSE", "JUMP_IF_FALSE_OR_POP",
+    "JUMP_IF_TRUE_OR_POP", "GET_ITER", "FOR_ITER", "MAKE_FUNCTION", "MODULE",
+    "RETURN", "RAISE_RETURN", "BREAK", "CONTINUE", "MISSING", "TAIL_CALL",
+)  # fmt: skip
+(
+    OP_CONST, OP_LOAD, OP_STORE, OP_POP, OP_DUP, OP_UNARY, OP_BINARY, OP_BUILD_TUPLE,
+    OP_CALL, OP_CALL_FN, OP_JUMP, OP_JUMP_IF_FALSE, OP_JUMP_IF_FALSE_OR_POP,
+    OP_JUMP_IF_TRUE_OR_POP, OP_GET_ITER, OP_FOR_ITER, OP_MAKE_FUNCTION, OP_MODULE,
+    OP_RETURN, OP_RAISE_RETURN, OP_BREAK, OP_CONTINUE, OP_MISSING, OP_TAIL_CALL,
+) = range(len(OP_NAMES))  # fmt: skip
+
+# Efeito de cada instrução na altura da pilha (as demais dependem do argumento)
+STACK_EFFECT = {
+    OP_CONST: 1, OP_LOAD: 1, OP_STORE: -1, OP_DUP: 1, OP_UNARY: 0, OP_BINARY: -1,
+    OP_JUMP: 0, OP_JUMP_IF_FALSE: -1, OP_JUMP_IF_FALSE_OR_POP: -1,
+    OP_JUMP_IF_TRUE_OR_POP: -1, OP_GET_ITER: 0, OP_FOR_ITER: 1, OP_MAKE_FUNCTION: 1,
+    OP_MODULE: 1, OP_RETURN: -1, OP_RAISE_RETURN: -1, OP_BREAK: 0, OP_CONTINUE: 0,
+    OP_MISSING: 0,
+}  # fmt: skip
+
+# Operações puras, identificadas pela posição nesta lista (argumento de
+# UNARY/BINARY). Os códigos fazem parte do formato serializado.
+VM_OPERATORS = [
+    "add", "sub", "mul", "div", "pow", "rshift", "lshift", "or_", "and_", "xor",
+    "eq", "ne", "gt", "lt", "ge", "le", "rest", "div_", "range", "irange",
+    "neg", "pos",
+]  # fmt: skip
+VM_UNARY = {"neg", "pos"}
+VM_FUNCTIONS = [getattr(RuspyTransformer(ChainMap()), name) for name in VM_OPERATORS]
+VM_MAGIC = b"RUSPYVM1"
+
+
+class CodeObject:
+    """
+    Código compilado de um módulo, expressão ou função.
+
+    ops é um vetor de inteiros com pares (operação, argumento). handlers
+    guarda tuplas (início, fim, altura da pilha, destino do break, destino do
+    continue) para os laços que tratam LoopBreak/LoopContinue.
+
+    >>> code = BytecodeCompiler().compile(ast_expr.parse("x = 40; x + 2"))
+    >>> print(code.dis(), end="")
+    <module>
+       0 CONST            0 (40)
+       2 STORE            0 (x)
+       4 LOAD             0 (x)
+       6 CONST            2 (2)
+       8 BINARY           0 (add)
+      10 RETURN           0
+    """
+
+    __slots__ = ("name", "args", "ops", "consts", "names", "handlers")
+
+    def __init__(self, name, args, ops=None, consts=None, names=None, handlers=None):
+        self.name = name
+        self.args = list(args)
+        self.ops = array("i") if ops is None else ops
+        self.consts = [] if consts is None else consts
+        self.names = [] if names is None else names
+        self.handlers = [] if handlers is None else handlers
+
+    def __repr__(self):
+        return f"<CodeObject {self.name} com {len(self.ops) // 2} instruções>"
+
+    def __reduce__(self):
+        return (CodeObject.frombytes, (self.tobytes(),))
+
+    def dis(self) -> str:
+        """
+        Listagem das instruções, seguida das funções definidas no código.
+        """
+        lines = [f"{self.name}\n"]
+        for pc in range(0, len(self.ops), 2):
+            op, arg = self.ops[pc], self.ops[pc + 1]
+            if op in (OP_CONST, OP_MISSING, OP_MAKE_FUNCTION):
+                detail = f" ({self.consts[arg]!r})"
+            elif op in (OP_LOAD, OP_STORE):
+                detail = f" ({self.names[arg]})"
+            elif op in (OP_UNARY, OP_BINARY):
+                detail = f" ({VM_OPERATORS[arg]})"
+            else:
+                detail = ""
+            lines.append(f"{pc:4d} {OP_NAMES[op]:<16} {arg}{detail}\n")
+        for const in self.consts:
+            if isinstance(const, CodeObject):
+                lines.append("\n" + const.dis())
+        return "".join(lines)
+
+    # Serialização -------------------------------------------------------------
+    def tobytes(self) -> bytes:
+        """
+        Serializa o código (e as funções que ele define) com marshal.
+        """
+        return VM_MAGIC + marshal.dumps(self._astuple())
+
+    @classmethod
+    def frombytes(cls, data) -> "CodeObject":
+        if not data.startswith(VM_MAGIC):
+            raise ValueError("dados não estão no formato CodeObject")
+        return cls._fromtuple(marshal.loads(data[len(VM_MAGIC) :]))
+
+    def _astuple(self):
+        # Constantes são valores simples; tuplas representam funções
+        consts = tuple(c._astuple() if isinstance(c, CodeObject) else c for c in self.consts)
+        return (self.name, tuple(self.args), self.ops.tolist(), consts, tuple(self.names), tuple(self.handlers))
+
+    @classmethod
+    def _fromtuple(cls, data):
+        name, args, ops, consts, names, handlers = data
+        consts = [cls._fromtuple(c) if isinstance(c, tuple) else c for c in consts]
+        return cls(name, args, array("i", ops), consts, list(names), [tuple(h) for h in handlers])
+
+
+class Loop:
+    """
+    Laço em compilação: altura da pilha dentro do corpo, destino do continue
+    e saltos de break que aguardam o endereço de saída.
+    """
+
+    __slots__ = ("depth", "head", "breaks")
+
+    def __init__(self, depth, head):
+        self.depth = depth
+        self.head = head
+        self.breaks = []
+
+
+class BytecodeCompiler:
+    """
+    Gera um CodeObject a partir de uma árvore de nós Node.
+
+    Cada regra tem um método com o mesmo nome que emite as instruções que
+    deixam o valor do nó no topo da pilha. O compilador acompanha a altura da
+    pilha para saber quantos valores descartar em break e continue.
+    """
+
+    def __init__(self, name="<module>", args=(), is_function=False):
+        self.code = CodeObject(name, args)
+        self.is_function = is_function
+        self.tail = False  # o nó em compilação está em posição de cauda?
+        self.depth = 0
+        self.loops = []
+        self.targets = set()  # destinos de saltos para frente
+        self.const_ids = {}
+        self.name_ids = {}
+
+    def compile(self, tree) -> CodeObject:
+        self.value(tree, self.is_function)
+        self.emit(OP_RETURN)
+        return self.code
+
+    # Auxiliares ---------------------------------------------------------------
+    def emit(self, op, arg=0) -> int:
+        """
+        Acrescenta uma instrução e retorna a sua posição.
+        """
+        pos = len(self.code.ops)
+        if op == OP_POP and arg == 1 and pos and self.code.ops[-2] == OP_CONST and pos not in self.targets:
+            # CONST seguido de POP não faz nada. Saltos para o CONST removido
+            # continuam corretos: passam a apontar para a próxima instrução.
+            del self.code.ops[-2:]
+            self.depth -= 1
+            return pos - 2
+        self.code.ops.extend((op, arg))
+        if op in (OP_POP, OP_CALL, OP_CALL_FN, OP_TAIL_CALL):
+            self.depth -= arg
+        elif op == OP_BUILD_TUPLE:
+            self.depth += 1 - arg
+        else:
+            self.depth += STACK_EFFECT[op]
+        return pos
+
+    def leave(self, op, arg=0):
+        # Instruções que não continuam na próxima (return, break etc): o
+        # código seguinte, inalcançável, conta com o valor da expressão
+        depth = self.depth
+        self.emit(op, arg)
+        self.depth = depth + 1
+
+    def here(self) -> int:
+        return len(self.code.ops)
+
+    def patch(self, pos, target=None):
+        target = self.here() if target is None else target
+        self.code.ops[pos + 1] = target
+        self.targets.add(target)
+
+    def const(self, value) -> int:
+        key = (type(value), value if not isinstance(value, CodeObject) else id(value))
+        try:
+            return self.const_ids[key]
+        except KeyError:
+            self.code.consts.append(value)
+            return self.const_ids.setdefault(key, len(self.code.consts) - 1)
+
+    def name_id(self, name) -> int:
+        try:
+            return self.name_ids[name]
+        except KeyError:
+            self.code.names.append(name)
+            return self.name_ids.setdefault(name, len(self.code.names) - 1)
+
+    def value(self, node, tail=False):
+        """
+        Emite as instruções que empilham o valor de node.
+
+        As regras são geradores que produzem os filhos a compilar, sozinhos ou
+        como (filho, tail), e trampoline os compila com uma pilha explícita:
+        a profundidade da árvore não consome a pilha do Python.
+        """
+        outer = self.tail
+        trampoline(self.visit, (node, tail))
+        self.tail = outer
+
+    def visit(self, item):
+        # As regras leem self.tail antes de produzir o primeiro filho
+        node, self.tail = item if isinstance(item, tuple) else (item, False)
+        if not isinstance(node, Node):
+            self.emit(OP_CONST, self.const(node))  # literal decodificado durante a análise
+            return None
+        method = getattr(self, node.data, None)
+        if method is not None:
+            return method(*node.children)
+        return self.generic(node)
+
+    def generic(self, node):
+        data = node.data
+        for child in node.children:
+            yield child
+        if data in VM_OPERATORS:
+            op = OP_UNARY if data in VM_UNARY else OP_BINARY
+            self.emit(op, VM_OPERATORS.index(data))
+        else:
+            # Como no transformer, os filhos são avaliados antes do erro
+            if node.children:
+                self.emit(OP_POP, len(node.children))
+            self.leave(OP_MISSING, self.const(data))
+
+    # Variáveis e sequências ---------------------------------------------------
+    def name(self, name):
+        self.emit(OP_LOAD, self.name_id(name))
+
+    def assign(self, name, value):
+        yield value
+        self.emit(OP_STORE, self.name_id(name))
+        self.emit(OP_CONST, self.const(None))
+
+    def seq(self, *children):
+        tail = self.tail
+        *init, last = children
+        for child in init:
+            yield child
+            self.emit(OP_POP, 1)
+        yield last, tail
+
+    def null(self, *children):
+        for child in children:
+            yield child
+            self.emit(OP_POP, 1)
+        self.emit(OP_CONST, self.const(None))
+
+    let = null
+
+    def mod(self, *fns):
+        for fn in fns:
+            yield fn
+            self.emit(OP_POP, 1)
+        self.emit(OP_MODULE)
+
+    def xargs(self, *children):
+        for child in children:
+            yield child
+        self.emit(OP_BUILD_TUPLE, len(children))
+
+    # Chamadas de função -------------------------------------------------------
+    def func(self, name, arg):
+        tail = self.tail
+        yield arg
+        self.emit(OP_LOAD, self.name_id(name))
+        self.emit(OP_TAIL_CALL if tail else OP_CALL, 1)
+
+    def call(self, name, args):
+        tail = self.tail
+        for arg in args.children:
+            yield arg
+        self.emit(OP_LOAD, self.name_id(name))
+        self.emit(OP_TAIL_CALL if tail else OP_CALL, len(args.children))
+
+    def ret(self, value):
+        # Dentro de um laço, a chamada precisa acontecer antes de sair dele:
+        # um break na função chamada interrompe o laço
+        yield value, self.is_function and not self.loops
+        self.leave(OP_RETURN if self.is_function else OP_RAISE_RETURN)
+
+    # Formas especiais ---------------------------------------------------------
+    def and_e(self, x, y):
+        tail = self.tail
+        yield x
+        jump = self.emit(OP_JUMP_IF_FALSE_OR_POP)
+        yield y, tail
+        self.patch(jump)
+
+    def or_e(self, x, y):
+        tail = self.tail
+        yield x
+        jump = self.emit(OP_JUMP_IF_TRUE_OR_POP)
+        yield y, tail
+        self.patch(jump)
+
+    def if_(self, cond, then, *rest):
+        # Mesma interpretação dos filhos que RuspyTransformer.if_
+        if len(rest) == 1:
+            branches, else_ = [(cond, then)], rest[0]
+        else:
+            branches, else_ = [(cond, then), *zip(rest[:1], rest[1:2])], None
+            if len(rest) == 3:
+                else_ = rest[2]
+
+        depth = self.depth
+        tail = self.tail
+        ends = []
+        for cond, then in branches:
+            yield cond
+            skip = self.emit(OP_JUMP_IF_FALSE)
+            yield then, tail
+            ends.append(self.emit(OP_JUMP))
+            self.patch(skip)
+            self.depth = depth
+        if else_ is None:
+            self.emit(OP_CONST, self.const(None))
+        else:
+            yield else_, tail
+        for end in ends:
+            self.patch(end)
+
+    def while_(self, cond, block):
+        head = self.here()
+        yield cond
+        exit = self.emit(OP_JUMP_IF_FALSE)
+        loop = Loop(self.depth, head)
+        start, end = yield from self.loop_body(loop, block)
+        self.patch(exit)
+        self.loop_exit(loop, block, start, end, self.here())
+        self.emit(OP_CONST, self.const(None))
+
+    def for_(self, name, expr, block):
+        yield expr
+        self.emit(OP_GET_ITER)
+        loop = Loop(self.depth, self.here())
+        exit = self.emit(OP_FOR_ITER)
+        self.emit(OP_STORE, self.name_id(name))
+        start, end = yield from self.loop_body(loop, block)
+
+        # O break de um laço for também descarta o iterador; FOR_ITER faz o
+        # mesmo quando o iterador se esgota
+        brk = self.here()
+        if loop.breaks or has_calls(block):
+            self.emit(OP_POP, 1)
+        self.patch(exit)
+        self.depth = loop.depth - 1
+        self.loop_exit(loop, block, start, end, brk)
+        self.emit(OP_CONST, self.const(None))
+
+    def loop_body(self, loop, block) -> tuple:
+        """
+        Emite o corpo do laço e o salto de volta; retorna o intervalo do corpo.
+        """
+        self.loops.append(loop)
+        start = self.here()
+        yield block
+        self.emit(OP_POP, 1)
+        self.loops.pop()
+        end = self.here()
+        self.emit(OP_JUMP, loop.head)
+        self.depth = loop.depth
+        return start, end
+
+    def loop_exit(self, loop, block, start, end, brk):
+        for pos in loop.breaks:
+            self.patch(pos, brk)
+        if has_calls(block):
+            self.code.handlers.append((start, end, loop.depth, brk, loop.head))
+
+    def loop_break(self, *children):
+        self.jump_out(OP_BREAK)
+
+    def loop_continue(self, *children):
+        self.jump_out(OP_CONTINUE)
+
+    def jump_out(self, op):
+        if not self.loops:
+            self.leave(op)
+            return
+        loop = self.loops[-1]
+        depth = self.depth
+        if depth > loop.depth:
+            self.emit(OP_POP, depth - loop.depth)
+        if op == OP_BREAK:
+            loop.breaks.append(self.emit(OP_JUMP))
+        else:
+            self.emit(OP_JUMP, loop.head)
+        self.depth = depth + 1
+
+    def fn(self, name, *args):
+        block = args[-1] if args else None
+        if not (isinstance(block, Node) and block.data in ("seq", "null")):
+            # Chamada de função no nível do módulo: fn : ID "(" xargs? ")" ";"
+            xargs = block.children if args else []
+            for arg in xargs:
+                yield arg
+            self.emit(OP_LOAD, self.name_id(name))
+            self.emit(OP_CALL_FN, len(xargs))
+            return
+
+        self.emit(OP_MAKE_FUNCTION, self.const(self.function(name, *args)))
+        self.emit(OP_DUP)
+        self.emit(OP_STORE, self.name_id(name))
+
+    def lambd(self, *args):
+        self.emit(OP_MAKE_FUNCTION, self.const(self.function("<lambda>", *args)))
+
+    def function(self, name, *args) -> CodeObject:
+        *args, block = args
+        names = [arg.children[0] for arg in args[0].children] if args else []
+        return BytecodeCompiler(name, names, is_function=True).compile(block)
+
+
+class VirtualMachine:
+    """
+    Executa objetos de código com uma pilha de valores.
+
+    O ambiente é o mesmo usado pelo RuspyTransformer (veja new_env()). instructions
+    acumula o número de instruções executadas.
+    """
+
+    def __init__(self):
+        self.instructions = 0
+
+    def run(self, code: CodeObject, env):
+        ops = code.ops
+        consts = code.consts
+        names = code.names
+        functions = VM_FUNCTIONS
+        stack = []
+        push = stack.append
+        pop = stack.pop
+        pc = count = 0
+        try:
+            while True:
+                try:
+                    while True:
+                        op = ops[pc]
+                        arg = ops[pc + 1]
+                        pc += 2
+                        count += 1
+                        if op == OP_LOAD:
+                            try:
+                                push(env[names[arg]])
+                            except KeyError:
+                                raise ValueError(f"variável inexistente: {names[arg]}")
+                        elif op == OP_CONST:
+                            push(consts[arg])
+                        elif op == OP_BINARY:
+                            y = pop()
+                            stack[-1] = functions[arg](stack[-1], y)
+                        elif op == OP_CALL:
+                            fn = pop()
+                            if not callable(fn):
+                                raise ValueError(f"{fn} não é uma função!")
+                            if arg:
+                                args = stack[-arg:]
+                                del stack[-arg:]
+                                push(fn(*args))
+                            else:
+                                push(fn())
+                        elif op == OP_JUMP_IF_FALSE:
+                            if not pop():
+                                pc = arg
+                        elif op == OP_POP:
+                            del stack[-arg:]
+                        elif op == OP_STORE:
+                            env[names[arg]] = pop()
+                        elif op == OP_JUMP:
+                            pc = arg
+                        elif op == OP_RETURN:
+                            return pop()
+                        elif op == OP_FOR_ITER:
+                            try:
+                                push(next(stack[-1]))
+                            except StopIteration:
+                                pop()
+                                pc = arg
+                        elif op == OP_UNARY:
+                            stack[-1] = functions[arg](stack[-1])
+                        elif op == OP_JUMP_IF_FALSE_OR_POP:
+                            if stack[-1]:
+                                pop()
+                            else:
+                                pc = arg
+                        elif op == OP_JUMP_IF_TRUE_OR_POP:
+                            if stack[-1]:
+                                pc = arg
+                            else:
+                                pop()
+                        elif op == OP_GET_ITER:
+                            stack[-1] = iter(stack[-1])
+                        elif op == OP_DUP:
+                            push(stack[-1])
+                        elif op == OP_MAKE_FUNCTION:
+                            fn = consts[arg]
+                            push(VmFunction(fn.name, fn.args, fn, env, self))
+                        elif op == OP_CALL_FN:
+                            fn = pop()
+                            args = stack[-arg:] if arg else ()
+                            if arg:
+                                del stack[-arg:]
+                            push(fn(*args))
+                        elif op == OP_BUILD_TUPLE:
+                            args = tuple(stack[-arg:]) if arg else ()
+                            if arg:
+                                del stack[-arg:]
+                            push(args)
+                        elif op == OP_MODULE:
+                            push(env.maps[0])
+                        elif op == OP_RAISE_RETURN:
+                            raise ReturnValue(pop())
+                        elif op == OP_BREAK:
+                            raise LoopBreak()
+                        elif op == OP_CONTINUE:
+                            raise LoopContinue()
+                        elif op == OP_TAIL_CALL:
+                            fn = pop()
+                            if not callable(fn):
+                                raise ValueError(f"{fn} não é uma função!")
+                            args = stack[-arg:] if arg else []
+                            if arg:
+                                del stack[-arg:]
+                            if type(fn) is VmFunction:
+                                return TailCall(fn, args)
+                            push(fn(*args))
+                        elif op == OP_MISSING:
+                            raise missing_rule(consts[arg])
+                        else:
+                            raise ValueError(f"instrução inválida: {op}")
+                except (LoopBreak, LoopContinue) as ex:
+                    # break/continue vindo de uma função chamada no corpo
+                    for start, end, depth, brk, head in code.handlers:
+                        if start <= pc - 2 < end:
+                            del stack[depth:]
+                            pc = brk if isinstance(ex, LoopBreak) else head
+                            break
+                    else:
+                        raise
+        finally:
+            self.instructions += count
+
+
+class VmFunction(RuspyFunction):
+    """
+    Função ruspy compilada para um CodeObject.
+
+    Chamadas em posição de cauda retornadas pela máquina virtual (TailCall)
+    são executadas no mesmo laço.
+    """
+
+    __slots__ = ("vm",)
+
+    def __init__(self, name, args, body, env, vm):
+        super().__init__(name, args, body, env)
+        self.vm = vm
+
+    def __call__(self, *args):
+        fn = self
+        while True:
+            if len(args) != len(fn.args):
+                raise TypeError(
+                    f"{fn.name}() espera {len(fn.args)} argumento(s), recebeu {len(args)}"
+                )
+            value = fn.vm.run(fn.body, fn.env.new_child(dict(zip(fn.args, args))))
+            if type(value) is not TailCall:
+                return value
+            fn = value.fn
+            args = value.args
+
+
+def run_vm(tree, env=None):
+    """
+    Compila a árvore para bytecode da máquina virtual e o executa.
+    """
+    code = BytecodeCompiler().compile(tree)
+    return VirtualMachine().run(code, new_env() if env is None else env)
+
+
+# Mecanismos de execução disponíveis para eval/module/run
+ENGINES = {"tree": run_tree, "closure": run_closure, "python": run_python, "vm": run_vm}
+ENGINE = "closure"
+OPTIMIZE = True  # aplica optimize() antes da execução
+
+
+def eval(src):
+    """
+    Avalia uma expressão ruspy.
+
+    >>> eval("1 + 1")
+    2
+    """
+    return _eval_or_exec(src, is_exec=False)
+
+
+def module(src) -> dict:
+    """
+    Avalia um módulo ruspy e retorna um dicionário com as funções definidas
+    no módulo.
+
+    Você pode utilizar estas funções a partir de código Python.
+
+    >>> dic = module("fn incr(n: int) { n + 1 }")
+    >>> f = dic["incr"]
+    >>> f(1)
+    2
+    """
+    return _eval_or_exec(src, is_exec=True)
+
+
+def run(src):
+    """
+    Avalia um módulo ruspy e executa automaticamente a função main.
+
+    >>> src = '''
+    ... fn main() {
+    ...     print("hello world!")
+    ... }
+    ... '''
+    hello world!
+    """
+    mod = module(src)
     main = mod.get("main")
     if not main:
         raise RuntimeError('módulo não define uma função "main()"')
     main()
 
 
-def _eval_or_exec(src: str, is_exec=False) -> Any:
-    # Função utilizada internamente por eval/module/run.
+# Cache de árvores sintáticas -------------------------------------------------
+
+# Serviços que chamam eval()/module() repetidamente com o mesmo código fonte
+# (fórmulas, regras de configuração etc) não precisam reanalisá-lo. Guardamos as
+# árvores num cache LRU limitado pelo número de entradas e, opcionalmente, pelo
+# tamanho estimado das árvores em bytes.
+#
+# As árvores em cache são compartilhadas entre execuções e, portanto, nunca
+# devem ser modificadas. O RuspyTransformer apenas lê a árvore e constrói novos
+# valores a partir dela.
+class ParseCache:
+    """
+    Cache LRU de árvores sintáticas indexado por (parser, símbolo inicial,
+    código, otimização).
+
+    >>> cache = ParseCache(max_entries=2)
+    >>> tree = cache.parse(grammar_expr, "1 + 1")
+    >>> cache.parse(grammar_expr, "1 + 1") is tree
+    True
+    >>> cache.stats()["hits"]
+    1
+    """
+
+    def __init__(self, max_entries=256, max_bytes=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.clear()
+
+    def clear(self):
+        self._data = OrderedDict()
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self):
+        return len(self._data)
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._data),
+            "bytes": self.size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def parse(self, grammar: EntryPoint, src: str, optimized=False):
+        """
+        Retorna a árvore de src, analisando o código apenas se necessário.
+
+        Se optimized for verdadeiro, armazena e retorna a árvore já otimizada
+        (veja optimize), de forma que um acerto dispensa também a otimização.
+        """
+        key = (grammar.parser, grammar.start, src, bool(optimized))
+        try:
+            tree, _ = self._data[key]
+        except KeyError:
+            pass
+        else:
+            self.hits += 1
+            self._data.move_to_end(key)
+            return tree
+
+        self.misses += 1
+        tree = grammar.parse(src)
+        if optimized:
+            tree = optimize(tree)
+        if self.max_entries:
+            self._store(key, tree, tree_size(tree) + sys.getsizeof(src))
+        return tree
+
+    def _store(self, key, tree, size):
+        if self.max_bytes is not None and size > self.max_bytes:
+            return
+        self._data[key] = (tree, size)
+        self.size += size
+        while len(self._data) > self.max_entries or (
+            self.max_bytes is not None and self.size > self.max_bytes
+        ):
+            _, (_, evicted) = self._data.popitem(last=False)
+            self.size -= evicted
+            self.evictions += 1
+
+
+def tree_size(tree) -> int:
+    """
+    Estimativa da memória ocupada por uma árvore sintática, em bytes.
+    """
+    size = 0
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        size += sys.getsizeof(node)
+        if isinstance(node, (Tree, Node)):
+            size += sys.getsizeof(node.children)
+            stack.extend(node.children)
+    return size
+
+
+PARSE_CACHE = ParseCache(max_entries=256, max_bytes=64 * 1024 * 1024)
+
+
+# Diagnóstico de erros de sintaxe ---------------------------------------------
+
+# Rejeitar uma entrada inválida deve custar pouco, qualquer que seja o seu
+# tamanho. O erro guarda apenas uma referência ao código e só monta a mensagem
+# (com os tokens próximos ao erro) quando ela é de fato lida, relexando uma
+# janela limitada em volta da posição do erro.
+#
+# Nada é impresso por padrão. Atribua um arquivo (ex.: sys.stderr) a
+# SYNTAX_ERROR_STREAM para imprimir a mensagem de cada erro de sintaxe.
+SYNTAX_ERROR_STREAM = None
+WINDOW_CHARS = 240
+TOKENS_BEFORE = 8
+TOKENS_AFTER = 4
+MAX_TOKEN_CHARS = 40
+MAX_MESSAGE_CHARS = 2000
+
+
+# Atributos dos erros do Lark usados por RuspySyntaxError
+LARK_ERROR_FIELDS = ("pos_in_stream", "line", "column", "expected", "allowed", "token")
+
+
+class RuspySyntaxError(LarkError):
+    """
+    Erro de sintaxe com informações estruturadas sobre a posição do erro.
+
+    Atributos:
+        src: código analisado.
+        error: exceção original do Lark.
+        offset: posição de src no código completo (ex.: trechos de um fluxo).
+        pos, line, column: posição do erro (pos é o índice no código completo).
+        expected: conjunto de terminais esperados, quando conhecido.
+        found: tipo do token encontrado (ou None para erros do lexer).
+
+    A janela de tokens (tokens) e a mensagem (str(erro)) são calculadas
+    somente na primeira vez em que são acessadas.
+    """
+
+    def __init__(self, src: str, error: LarkError, grammar=None, offset=0):
+        # args guarda o que é necessário para montar a mensagem (repr, pickle)
+        super().__init__(src, error)
+        self.src = src
+        self.error = error
+        self.grammar = grammar
+        self.offset = offset
+        pos = getattr(error, "pos_in_stream", None)
+        self.pos = offset + len(src) if pos is None or pos < 0 else pos
+        self.line = getattr(error, "line", None)
+        self.column = getattr(error, "column", None)
+        self.expected = set(getattr(error, "expected", None) or getattr(error, "allowed", None) or ())
+        token = getattr(error, "token", None)
+        self.found = token.type if token is not None else None
+        if self.found in ("$END", "<EOF>"):
+            # O Lark reaproveita a posição do último token para o fim da entrada
+            self.pos = offset + len(src)
+        self._tokens = None
+        self._message = None
+
+    def __str__(self):
+        if self._message is None:
+            self._message = self.format()
+        return self._message
+
+    def __reduce__(self):
+        # O erro do Lark guarda o estado do parser, que não é serializável.
+        # Levamos só os campos lidos por __init__ e o diagnóstico já montado.
+        error = LarkError(*self.error.args)
+        error.__dict__.update((k, v) for k, v in vars(self.error).items() if k in LARK_ERROR_FIELDS)
+        return (type(self), (self.src, error, None, self.offset), {"_message": str(self), "_tokens": self.tokens})
+
+    def window(self) -> tuple:
+        """
+        Intervalo [start, end) de src usado para montar o diagnóstico.
+
+        Começa no início da linha do erro e termina no fim dela, sem se
+        afastar mais que WINDOW_CHARS caracteres da posição do erro.
+        """
+        src, pos = self.src, self.pos - self.offset
+        start = max(0, pos - WINDOW_CHARS)
+        end = min(len(src), pos + WINDOW_CHARS)
+        nl = src.rfind("\n", start, pos)
+        if nl >= 0:
+            start = nl + 1
+        nl = src.find("\n", pos, end)
+        if nl >= 0:
+            end = nl
+        return start, end
+
+    @property
+    def tokens(self) -> list:
+        """
+        Tokens próximos ao erro, com start_pos relativo ao código completo.
+        """
+        if self._tokens is None:
+            self._tokens = self._lex_window()
+        return self._tokens
+
+    def _lex_window(self):
+        if self.grammar is None:
+            return []
+        start, end = self.window()
+        before, after = [], []
+        try:
+            for tk in self.grammar.lex(self.src[start:end]):
+                tk = Token(tk.type, tk.value, tk.start_pos + start + self.offset)
+                if tk.start_pos < self.pos:
+                    before.append(tk)
+                    del before[:-TOKENS_BEFORE]
+                else:
+                    after.append(tk)
+                    if len(after) >= TOKENS_AFTER:
+                        break
+        except LarkError:
+            # A janela pode começar ou terminar no meio de um token, e o erro
+            # pode ser do próprio lexer: mostramos o que foi possível ler.
+            pass
+        return before + after
+
+    def context(self) -> str:
+        """
+        Linha do erro (limitada à janela) com um ^ marcando a posição.
+        """
+        start, end = self.window()
+        line = self.src[start:end]
+        return f"{line}\n{' ' * len(self.src[start : self.pos - self.offset].expandtabs())}^"
+
+    def format(self) -> str:
+        where = f"linha {self.line}, coluna {self.column}" if self.line else f"posição {self.pos}"
+        lines = [f"Erro de sintaxe na {where}:", "", self.context(), "", "Tokens próximos:"]
+        for tk in self.tokens:
+            value = str(tk)
+            if len(value) > MAX_TOKEN_CHARS:
+                value = value[: MAX_TOKEN_CHARS - 3] + "..."
+            mark = "  <--" if tk.start_pos == self.pos else ""
+            lines.append(f" - {value!r} ({tk.type}){mark}")
+        if self.expected:
+            expected = sorted(self.expected)
+            extra = f" e mais {len(expected) - 10}" if len(expected) > 10 else ""
+            lines.append(f"\nEsperava: {', '.join(expected[:10])}{extra}")
+        message = "\n".join(lines)
+        if len(message) > MAX_MESSAGE_CHARS:
+            message = message[: MAX_MESSAGE_CHARS - 3] + "..."
+        return message
+
+    def as_dict(self) -> dict:
+        """
+        Representação do erro como dicionário (ex.: para respostas em JSON).
+        """
+        return {
+            "pos": self.pos,
+            "line": self.line,
+            "column": self.column,
+            "expected": sorted(self.expected),
+            "found": self.found,
+            "tokens": [(tk.type, str(tk), tk.start_pos) for tk in self.tokens],
+            "message": str(self),
+        }
+
+
+def syntax_error(src: str, error: LarkError, grammar=None, offset=0) -> RuspySyntaxError:
+    """
+    Converte um erro do Lark em RuspySyntaxError e o imprime em
+    SYNTAX_ERROR_STREAM, se houver.
+    """
+    err = RuspySyntaxError(src, error, grammar, offset)
+    if SYNTAX_ERROR_STREAM is not None:
+        print(err, file=SYNTAX_ERROR_STREAM)
+    return err
+
+
+def _eval_or_exec(src: str, is_exec=False, engine=None) -> Any:
+    # Função utilizada internamente por eval/module/run. O mecanismo de
+    # execução padrão é ENGINE (veja ENGINES); OPTIMIZE liga o otimizador.
     if is_exec:
-        grammar = grammar_mod
+        grammar = ast_mod
     else:
-        grammar = grammar_expr
+        grammar = ast_expr
     try:
+        tree = PARSE_CACHE.parse(grammar, src, optimized=OPTIMIZE)
+    except LarkError as ex:
+        raise syntax_error(src, ex, grammar) from ex
+    return execute(tree, engine, optimized=True)
 
-        tree = grammar.parse(src)
-    except LarkError:
-        print(f"Erro avaliando a expressão: \n{src}")
-        print("\nImprimindo tokens")
-        for i, tk in enumerate(grammar.lex(src), start=1):
-            print(f" - {i}) {tk} ({tk.type})")
-        raise
-    transformer = RuspyTransformer()
-    result = transformer.transform(tree)
-
-    if isinstance(result, Tree):
-        print(tree.pretty())
-        bads = [*tree.find_pred(lambda x: not hasattr(transformer, x.data))]
-        bad = bads[0] if bads else tree
-        raise NotImplementedError(
-            f"""
-            não implementou regra para lidar com: {tree.data!r}.
-            Crie um método como abaixo na classe do transformer.
-                def {bad.data}(self, ...): 
-                    return ... 
-            """
-        )
+
+def execute(tree, engine=None, env=None, partial=False, optimized=False) -> Any:
+    """
+    Otimiza a árvore (se OPTIMIZE) e a executa com o mecanismo engine (ENGINE
+    por padrão) no ambiente env. partial indica que a árvore é só uma parte do
+    programa (veja optimize); optimized, que a árvore já passou pelo otimizador.
+    """
+    if OPTIMIZE and not optimized:
+        tree = optimize(tree, partial)
+    # Nós sem regra correspondente no transformer geram NotImplementedError
+    run = ENGINES[engine or ENGINE]
+    return run(tree) if env is None else run(tree, env)
+
+
+# Recarga incremental de módulos ----------------------------------------------
+
+# Em vez de reanalisar o módulo inteiro a cada alteração, dividimos o código
+# nas suas declarações de nível superior (fn ...) e analisamos cada uma
+# separadamente. Uma edição só reanalisa as declarações que ela toca e troca as
+# funções correspondentes no dicionário do módulo. Como as funções ruspy
+# resolvem nomes globais no momento da chamada, os chamadores passam a usar as
+# novas definições imediatamente.
+
+# Trechos que alteram o aninhamento ou precisam ser pulados ao procurar o fim
+# de uma declaração. Strings e comentários incompletos consomem o restante do
+# texto.
+ITEM_REGEX = re.compile(r'"(?:[^"\\]|\\.)*(?:"|\Z)|//[^\n]*|/\*(?:.*?\*/|.*\Z)|[{}()\[\];]', re.S)
+
+# Espaços e comentários entre declarações.
+GAP_REGEX = re.compile(r"(?:\s+|//[^\n]*|/\*.*?\*/)*", re.S)
+
+
+# Declarações e comandos que terminam no fechamento do bloco, sem ";".
+BLOCK_START_REGEX = re.compile(r"(?:fn|if|for|while)\b|\{")
+ELSE_REGEX = re.compile(r"else\b")
+
+
+def split_items(src, start=0, end=None) -> tuple:
+    """
+    Divide src[start:end] nas declarações de nível superior de um módulo ou nos
+    comandos de nível superior de uma sequência.
+
+    Retorna a lista de intervalos (início, fim) de cada declaração e um
+    booleano indicando se o trecho termina numa fronteira de declaração, isto
+    é, fora de blocos, parênteses, strings e comentários.
+
+    >>> split_items("fn f() { 1 }  fn g() { 2 }")
+    ([(0, 12), (14, 26)], True)
+    >>> split_items("x = 1; if x { 2 } else { 3 }")
+    ([(0, 6), (7, 28)], True)
+    """
+    end = len(src) if end is None else end
+    items = []
+    pos = start
+    while True:
+        item_start = pos = GAP_REGEX.match(src, pos, end).end()
+        if pos >= end:
+            return items, True
+        is_block = BLOCK_START_REGEX.match(src, pos, end) is not None
+
+        depth = 0
+        while True:
+            m = ITEM_REGEX.search(src, pos, end)
+            if m is None:
+                return items, False
+            tk = m.group()
+            pos = m.end()
+            if tk in "([{":
+                depth += 1
+            elif tk in ")]}":
+                depth -= 1
+            if depth or tk not in ("}", ";"):
+                continue
+            if tk == ";" or is_block:
+                # if ... { } else { } continua depois do primeiro bloco.
+                nxt = GAP_REGEX.match(src, pos, end).end()
+                if tk == ";" or not ELSE_REGEX.match(src, nxt, end):
+                    break
+
+        # O ";" opcional depois de um bloco pertence ao bloco.
+        if tk == "}":
+            nxt = GAP_REGEX.match(src, pos, end).end()
+            if src.startswith(";", nxt) and nxt < end:
+                pos = nxt + 1
+        items.append((item_start, pos))
+
+
+def common_prefix(a: str, b: str) -> int:
+    """
+    Tamanho do maior prefixo comum entre a e b.
+    """
+    lo, hi = 0, min(len(a), len(b))
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[lo:mid] == b[lo:mid]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+def common_suffix(a: str, b: str, limit: int) -> int:
+    """
+    Tamanho do maior sufixo comum entre a e b, limitado a limit caracteres.
+    """
+    lo, hi = 0, limit
+    na, nb = len(a), len(b)
+    while lo < hi:
+        mid = (lo + hi + 1) // 2
+        if a[na - mid : na - lo] == b[nb - mid : nb - lo]:
+            lo = mid
+        else:
+            hi = mid - 1
+    return lo
+
+
+class LiveModule:
+    """
+    Módulo ruspy que pode ser editado e recarregado incrementalmente.
+
+    O dicionário namespace é o mesmo devolvido por module() e continua válido
+    entre as edições. Cada declaração alterada é executada como em module(),
+    com o mecanismo ENGINE e o otimizador (veja execute).
+
+    >>> live = LiveModule("fn f(x) { x + 1 }")
+    >>> f = live.namespace["f"]
+    >>> live.update("fn f(x) { x + 2 }")
+    ['f']
+    >>> live.namespace["f"](1)
+    3
+    """
+
+    def __init__(self, src=""):
+        self.src = ""
+        self.namespace = new_env()
+
+        # Declarações em ordem: posição no código, texto e nomes definidos.
+        self.starts = []
+        self.ends = []
+        self.texts = []
+        self.names = []
+        self.edit(0, 0, src)
+
+    def update(self, src: str) -> list:
+        """
+        Substitui o código fonte por src, reavaliando somente as declarações
+        alteradas. Retorna a lista de nomes (re)definidos ou removidos.
+        """
+        prefix = common_prefix(self.src, src)
+        limit = min(len(self.src), len(src)) - prefix
+        suffix = common_suffix(self.src, src, limit)
+        return self.edit(prefix, len(self.src) - suffix, src[prefix : len(src) - suffix])
+
+    def edit(self, start: int, end: int, text: str) -> list:
+        """
+        Substitui o trecho src[start:end] por text.
+
+        O custo depende apenas do tamanho da edição e das declarações que ela
+        toca, não do tamanho do módulo. Se alguma declaração nova tiver erros
+        de sintaxe, levanta RuspySyntaxError e o módulo permanece inalterado.
+        Erros ao executar as declarações novas também desfazem a edição (os
+        efeitos externos de chamadas no nível do módulo, como prints, ficam).
+        """
+        src = self.src[:start] + text + self.src[end:]
+        delta = len(text) - (end - start)
+        starts, ends = self.starts, self.ends
+
+        # Declarações tocadas pela edição: items[i:j]. Reanalisamos a região
+        # entre o fim da declaração anterior e o início da seguinte, estendendo
+        # a região enquanto a edição deixar blocos ou comentários abertos.
+        i = bisect_left(ends, start)
+        j = bisect_right(starts, end)
+        lo = ends[i - 1] if i else 0
+        while True:
+            hi = starts[j] + delta if j < len(starts) else len(src)
+            spans, done = split_items(src, lo, hi)
+            if done:
+                break
+            if j == len(starts):
+                # Código incompleto no final: o parser reporta o erro.
+                spans.append((spans[-1][1] if spans else lo, hi))
+                break
+            j += 1
+
+        old = dict(zip(self.texts[i:j], self.names[i:j]))
+        texts = [src[a:b] for a, b in spans]
+        trees = {}
+        for text in texts:
+            if text not in old:
+                try:
+                    trees[text] = ast_mod.parse(text)
+                except LarkError as ex:
+                    raise syntax_error(text, ex, ast_mod) from ex
+
+        # Nomes que deixaram de existir
+        removed = {name for names in self.names[i:j] for name in names}
+        names = [
+            old[text] if text in old else [str(fn.children[0]) for fn in trees[text].children if is_fn_def(fn)]
+            for text in texts
+        ]
+
+        # Valores anteriores dos nomes que as declarações novas redefinem, para
+        # desfazer a edição em caso de erro.
+        ns = self.namespace
+        saved = {name: ns.get(name, UNSET) for text, item in zip(texts, names) if text in trees for name in item}
+        try:
+            for text in texts:
+                if text in trees:
+                    self._run(trees[text])
+        except BaseException:
+            for name, value in saved.items():
+                if value is UNSET:
+                    ns.pop(name, None)
+                else:
+                    ns[name] = value
+            raise
+        defined = {name for item in names for name in item}
+        for name in removed - defined:
+            self.namespace.pop(name, None)
+            self._restore(name, i, j)
+
+        for k in range(j, len(starts)):
+            starts[k] += delta
+            ends[k] += delta
+        starts[i:j] = [a for a, _ in spans]
+        ends[i:j] = [b for _, b in spans]
+        self.texts[i:j] = texts
+        self.names[i:j] = names
+        self.src = src
+        changed = {name for text, item in zip(texts, names) if text in trees for name in item}
+        return sorted(changed | (removed - defined))
+
+    def _restore(self, name, i, j):
+        # Caso raro: o nome removido também é declarado fora da região editada.
+        # Reavaliamos a última dessas declarações.
+        for k in reversed(range(len(self.names))):
+            if not i <= k < j and name in self.names[k]:
+                self._run(ast_mod.parse(self.texts[k]))
+                return
+
+    def _run(self, tree):
+        # As demais declarações podem mudar a qualquer momento: o otimizador
+        # trata cada uma como parte de um programa maior.
+        execute(tree, env=self.namespace, partial=True)
+
+
+def is_fn_def(tree) -> bool:
+    """
+    Verifica se o nó fn corresponde a uma declaração de função (e não a uma
+    chamada no nível do módulo).
+    """
+    block = tree.children[-1]
+    return isinstance(block, (Tree, Node)) and block.data in ("seq", "null")
+
+
+# Execução em fluxo ------------------------------------------------------------
+
+# Scripts gerados automaticamente podem ter centenas de MB de comandos no nível
+# superior. Em vez de ler o arquivo inteiro e construir uma única árvore para
+# toda a sequência, lemos o arquivo em blocos, separamos os comandos com
+# split_items() e executamos cada um assim que estiver completo. A memória
+# usada depende do tamanho do maior comando, e não do tamanho do arquivo.
+#
+# Os trechos não são analisados isoladamente: um único estado do parser LALR
+# recebe os tokens de todos eles, como se o arquivo fosse analisado de uma vez.
+# Assim o fluxo aceita e rejeita exatamente os mesmos programas que
+# eval()/module() (ex.: "y = |a| { a + 1 };" é válido sozinho, mas não seguido
+# de outro comando, pois o ";" pertence ao bloco).
+CHUNK_SIZE = 1 << 20
+
+
+def iter_items(fd, chunk_size=CHUNK_SIZE):
+    """
+    Lê o arquivo fd em blocos e o divide nos comandos (ou declarações) de nível
+    superior.
+
+    Cada trecho inclui os espaços e comentários que o precedem e o último vai
+    até o fim do arquivo: a concatenação dos trechos é o arquivo inteiro.
+    """
+    buf = ""
+    chunks = []  # blocos lidos e ainda não analisados
+    size = 0  # len(buf) + tamanho de chunks
+    wait = 0  # tamanho que o texto deve atingir antes da próxima análise
+    while True:
+        chunk = fd.read(chunk_size)
+        chunks.append(chunk)
+        size += len(chunk)
+        if chunk and size < wait:
+            continue
+        buf += "".join(chunks)
+        chunks.clear()
+        spans, done = split_items(buf)
+        if chunk or done:
+            # O último comando pode continuar no próximo bloco (ex.: um "else"
+            # ou ";" depois de "}") e só é liberado quando outro comando
+            # começar. No fim do arquivo, leva os comentários finais.
+            spans = spans[:-1]
+        pos = 0
+        for _, end in spans:
+            yield buf[pos:end]
+            pos = end
+        buf = buf[pos:]
+        size = len(buf)
+        # Um comando maior que o bloco seria reanalisado desde o início a cada
+        # leitura (custo quadrático). Se nada foi liberado, esperamos o texto
+        # dobrar de tamanho antes de analisá-lo de novo.
+        wait = 0 if spans else 2 * size
+        if not chunk:
+            # Último comando ou código incompleto, cujo erro é reportado pelo
+            # parser
+            if buf:
+                yield buf
+            return
+
+
+def parse_stream(grammar: EntryPoint, texts):
+    """
+    Analisa o programa formado pela concatenação de texts e produz árvores
+    (seq ou mod) com os comandos de nível superior assim que o parser os
+    reduz. A última árvore é a produzida no fim da entrada.
+
+    Erros de sintaxe são levantados como RuspySyntaxError, com a posição
+    no programa completo.
+    """
+    interactive = grammar.parser.parse_interactive(start=grammar.start)
+    values = interactive.parser_state.value_stack
+    lexer = grammar.parser.parser.lexer
+    # Posição do trecho atual no programa: caracteres e linhas anteriores e
+    # coluna (a partir de 0) em que ele começa.
+    offset = lines = column = 0
+    src = ""
+    last = None  # último token, com a posição no programa completo
+    for i, text in enumerate(texts):
+        offset += len(src)
+        nl = src.count("\n")
+        lines += nl
+        column = len(src) - src.rfind("\n") - 1 if nl else column + len(src)
+        src = text
+        try:
+            if isinstance(lexer, DfaLexer):
+                # ^ só casa no início do arquivo
+                tokens = lexer.tokenize(src, bol=i == 0)
+            else:
+                tokens = grammar.lex(src)
+            tk = None
+            for tk in tokens:
+                interactive.feed_token(tk)
+        except LarkError as ex:
+            raise stream_error(src, ex, grammar, offset, lines, column) from ex
+        if tk is not None:
+            col = tk.column + column if tk.line == 1 else tk.column
+            last = Token(tk.type, tk.value, tk.start_pos + offset, tk.line + lines, col)
+
+        # Os comandos já reduzidos se acumulam na regra auxiliar de cmd+ (ou
+        # fn+), na base da pilha. Esvaziá-la mantém a memória constante.
+        done = values[0] if values else None
+        if isinstance(done, Node) and done.data.startswith("__") and done.children:
+            items = done.children[:]
+            done.children.clear()
+            yield Node(grammar.start, items)
+    try:
+        # Como em parse(), o fim da entrada herda a posição do último token
+        yield interactive.feed_eof(last)
+    except LarkError as ex:
+        raise syntax_error(src, ex, grammar, offset) from ex
+
+
+def stream_error(src, error, grammar, offset, lines, column) -> RuspySyntaxError:
+    """
+    syntax_error() para o trecho src de um fluxo, que começa na posição offset,
+    depois de lines linhas, na coluna column (a partir de 0).
+
+    O Lark numera as posições a partir do início do trecho.
+    """
+    # Erros no fim da entrada usam -1 ou "?" como posição
+    pos = getattr(error, "pos_in_stream", None)
+    if isinstance(pos, int) and pos >= 0:
+        error.pos_in_stream = pos + offset
+    line = getattr(error, "line", None)
+    if isinstance(line, int) and line > 0:
+        error.line = line + lines
+        if line == 1 and isinstance(getattr(error, "column", None), int):
+            error.column += column
+    return syntax_error(src, error, grammar, offset)
+
+
+def exec_stream(fd, is_exec=False, chunk_size=CHUNK_SIZE, engine=None) -> Any:
+    """
+    Executa um arquivo ruspy comando por comando, sem carregá-lo inteiro na
+    memória. Cada comando passa pelo otimizador e pelo mecanismo de execução,
+    como em _eval_or_exec().
+
+    No modo script (is_exec=False), retorna o valor do último comando, como
+    eval(). No modo módulo, retorna o dicionário de funções, como module().
+    """
+    grammar = ast_mod if is_exec else ast_expr
+    env = new_env()
+    result = None
+    for tree in parse_stream(grammar, iter_items(fd, chunk_size)):
+        result = execute(tree, engine, env, partial=True)
     return result
 
 
@@ -464,7 +5848,7 @@ def _eval_or_exec(src: str, is_exec=False) -> Any:
 # com o ruspy.
 if __name__ == "__main__":
     if "--help" in sys.argv:
-        print("Digite python ruspy.py [ARQUIVO] [--script]")
+        print("Digite python ruspy.py [ARQUIVO] [--script] [--stream]")
         print("")
         print("Opções:")
         print("  --help:")
@@ -472,18 +5856,32 @@ if __name__ == "__main__":
         print("  --script:")
         print("         avalia como expressão no modo script, como se")
         print("         estivéssemos executando o código dentro da função main()")
+        print("  --stream:")
+        print("         lê e executa o arquivo comando por comando, sem")
+        print("         carregá-lo inteiro na memória")
         exit()
-    elif "--script" in sys.argv:
+    if "--stream" in sys.argv:
+        do_stream = True
+        del sys.argv[sys.argv.index("--stream")]
+    else:
+        do_stream = False
+    if "--script" in sys.argv:
         do_eval = True
         del sys.argv[sys.argv.index("--script")]
     else:
         do_eval = False
     with open(sys.argv[-1]) as fd:
-        src = fd.read()
-        if do_eval:
-            print(f"\n> {eval(src)}")
+        if do_stream and do_eval:
+            print(f"\n> {exec_stream(fd)}")
+        elif do_stream:
+            main = exec_stream(fd, is_exec=True).get("main")
+            if not main:
+                raise RuntimeError('módulo não define uma função "main()"')
+            main()
+        elif do_eval:
+            print(f"\n> {eval(fd.read())}")
         else:
-            run(src)
+            run(fd.read())
 
 
 # test_comp_org
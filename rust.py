@@ -98,6 +98,17 @@ OCT_DIGIT : /[0-7]/
 )
 
 
+class Env(dict):
+    # Variáveis do usuário sobre os nomes pré-definidos: os nomes ausentes são
+    # lidos de base, que é compartilhada entre as execuções e nunca copiada.
+    def __init__(self, base):
+        super().__init__()
+        self.base = base
+
+    def __missing__(self, name):
+        return self.base[name]
+
+
 class CalcTransformer(InlineTransformer):
     from operator import add, sub, mul, truediv as div, pow, neg, pos
     from operator import rshift, lshift, or_, and_, xor
@@ -119,7 +130,7 @@ class CalcTransformer(InlineTransformer):
 
     def __init__(self):
         super().__init__()
-        self.env = self.names.copy()
+        self.env = Env(self.names)
 
 
     def INT(self, tk):
@@ -0,0 +1,78 @@
+"""
+# perf-ast
+
+Árvore sintática executável construída durante a análise LALR.
+
+* O parser produz nós Node diretamente, sem lark.Tree nem Token.
+* Literais já chegam decodificados.
+* Avaliar a árvore de nós equivale a avaliar a árvore do Lark.
+* O parser com transformer reaproveita o cache de tabelas em disco.
+* ast_parser compartilha as tabelas LALR e o lexer do parser principal.
+"""
+import pytest
+from lark import Token, Tree
+
+
+def walk(node):
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(getattr(node, "children", ()))
+
+
+def test_sem_árvore_do_lark(ruspy):
+    src = (ruspy.PATH / "exemplos" / "pair.rpy").read_text()
+    tree = ruspy.ast_mod.parse(src)
+    assert isinstance(tree, ruspy.Node)
+    assert not any(isinstance(x, (Tree, Token)) for x in walk(tree))
+
+
+@pytest.mark.parametrize(
+    "src, value",
+    [
+        ("1_000", 1000),
+        ("0x_ff", 255),
+        ("0o17", 15),
+        ("0b1_01", 5),
+        ("1.5e1", 15.0),
+        ("2f32", 2.0),
+        (r'"a\tb\\\"\x41\u{1_F6_00}"', 'a\tb\\"A\U0001f600'),
+    ],
+)
+def test_literais_decodificados(ruspy, src, value):
+    assert ruspy.ast_expr.parse(src) == value
+    assert ruspy.eval(src) == value
+
+
+def test_equivale_à_árvore_do_lark(ruspy):
+    src = (ruspy.PATH / "exemplos" / "fib.rpy").read_text()
+    lark_mod = ruspy.RuspyTransformer().transform(ruspy.grammar_mod.parse(src))
+    ast_mod = ruspy.RuspyTransformer().transform(ruspy.ast_mod.parse(src))
+    assert [lark_mod["fib"](i) for i in range(10)] == [ast_mod["fib"](i) for i in range(10)]
+
+    for src in ["x = 2; y = |a| a * x; y(21)", "if 1 > 2 { 1 } else { 2.5 }", "(1 + 2) % 2"]:
+        tree = ruspy.grammar_expr.parse(src)
+        assert ruspy.RuspyTransformer().transform(tree) == ruspy.eval(src)
+
+
+def test_pretty_no_formato_do_lark(ruspy):
+    node = ruspy.Node("add", [ruspy.Node("name", ["x"]), 1])
+    tree = Tree("add", [Tree("name", ["x"]), 1])
+    assert node.pretty() == tree.pretty()
+
+
+def test_cache_com_transformer(ruspy, tmp_path):
+    options = dict(transformer=ruspy.AstBuilder(), tree_class=ruspy.Node, cache_dir=str(tmp_path))
+    cold = ruspy.make_parser("seq", **options)
+    assert [p.suffix for p in tmp_path.iterdir()] == [".pickle"]
+    warm = ruspy.make_parser("seq", **options)
+    assert warm.parse("x + 1") == cold.parse("x + 1") == ruspy.Node("add", [ruspy.Node("name", ["x"]), 1])
+
+
+def test_tabelas_compartilhadas(ruspy):
+    ast, main = ruspy.ast_parser.parser, ruspy.parser.parser
+    assert ast.parser.parser.parse_table is main.parser.parser.parse_table
+    assert ast.lexer is main.lexer
+    assert ruspy.ast_expr.parse("x + 1") == ruspy.Node("add", [ruspy.Node("name", ["x"]), 1])
+    assert ruspy.grammar_expr.parse("x + 1") == Tree("add", [Tree("name", [Token("ID", "x")]), Tree("lit", [Token("INT", "1")])])
@@ -0,0 +1,96 @@
+"""
+# perf-cache
+
+Cache em disco das tabelas LALR geradas a partir de GRAMMAR.
+
+* O parser salvo em disco deve produzir as mesmas árvores que um parser novo.
+* O cache é invalidado automaticamente quando a gramática muda.
+* Arquivos corrompidos são ignorados e reconstruídos.
+* Um único parser com vários símbolos iniciais atende eval, module e run.
+* O cache padrão fica num diretório do usuário; arquivos que outros usuários
+  podem alterar não são carregados.
+"""
+import os
+
+import pytest
+
+SRC = "fn f(x) { x + 1 }"
+
+
+def test_cria_e_reaproveita_cache(ruspy, tmp_path):
+    path = ruspy.cache_path("mod", cache_dir=str(tmp_path))
+    assert not os.path.exists(path)
+
+    cold = ruspy.make_parser("mod", cache_dir=str(tmp_path))
+    assert os.path.exists(path)
+    mtime = os.stat(path).st_mtime_ns
+
+    warm = ruspy.make_parser("mod", cache_dir=str(tmp_path))
+    assert os.stat(path).st_mtime_ns == mtime
+    assert warm.parse(SRC) == cold.parse(SRC)
+
+
+def test_chave_depende_da_gramática_e_do_símbolo_inicial(ruspy, tmp_path):
+    d = str(tmp_path)
+    assert ruspy.cache_path("mod", cache_dir=d) != ruspy.cache_path("seq", cache_dir=d)
+    assert ruspy.cache_path("mod", cache_dir=d) != ruspy.cache_path(
+        "mod", ruspy.GRAMMAR + "\n// outra versão", cache_dir=d
+    )
+
+
+def test_cache_corrompido_é_reconstruído(ruspy, tmp_path):
+    path = ruspy.cache_path("seq", cache_dir=str(tmp_path))
+    with open(path, "wb") as fd:
+        fd.write(b"lixo")
+
+    parser = ruspy.make_parser("seq", cache_dir=str(tmp_path))
+    assert parser.parse("1 + 2").data == "add"
+    with open(path, "rb") as fd:
+        assert fd.read() != b"lixo"
+
+
+def test_não_deixa_arquivos_temporários(ruspy, tmp_path):
+    ruspy.make_parser("seq", cache_dir=str(tmp_path))
+    assert [p.suffix for p in tmp_path.iterdir()] == [".pickle"]
+
+
+def test_pontos_de_entrada_compartilham_o_parser(ruspy, tmp_path):
+    assert ruspy.grammar_expr.parser is ruspy.grammar_mod.parser
+
+    for start, src in [("seq", "x = 1; x + 2"), ("mod", SRC)]:
+        alone = ruspy.make_parser(start, cache_dir=str(tmp_path))
+        assert ruspy.EntryPoint(ruspy.parser, start).parse(src) == alone.parse(src)
+
+
+def test_diretório_padrão_do_usuário(ruspy, monkeypatch, tmp_path):
+    monkeypatch.setenv("XDG_CACHE_HOME", str(tmp_path))
+    assert ruspy.default_cache_dir() == str(tmp_path / "ruspy")
+    monkeypatch.delenv("XDG_CACHE_HOME")
+    monkeypatch.setenv("HOME", str(tmp_path))
+    assert ruspy.default_cache_dir() == str(tmp_path / ".cache" / "ruspy")
+    assert not ruspy.CACHE_DIR.startswith(os.path.join(ruspy.tempfile.gettempdir(), "ruspy-cache"))
+
+
+def test_diretório_criado_com_permissão_restrita(ruspy, tmp_path):
+    folder = tmp_path / "cache"
+    ruspy.make_parser("seq", cache_dir=str(folder))
+    assert folder.stat().st_mode & 0o777 == 0o700
+
+
+def test_arquivos_alteráveis_por_outros_são_ignorados(ruspy, tmp_path):
+    path = ruspy.cache_path("seq", cache_dir=str(tmp_path))
+    ruspy.make_parser("seq", cache_dir=str(tmp_path))
+    os.chmod(path, 0o666)
+    with pytest.raises(PermissionError):
+        ruspy.open_cache(path)
+    os.chmod(path, 0o600)
+    os.chmod(tmp_path, 0o777)
+    try:
+        with pytest.raises(PermissionError):
+            ruspy.open_cache(path)
+        # O parser é reconstruído em vez de carregar o arquivo
+        assert ruspy.make_parser("seq", cache_dir=str(tmp_path)).parse("1 + 2").data == "add"
+    finally:
+        os.chmod(tmp_path, 0o700)
+    with ruspy.open_cache(path):
+        pass
@@ -0,0 +1,73 @@
+"""
+# perf-calls
+
+Caches por ponto de chamada e chamadas especializadas pelo número de argumentos.
+
+* No mecanismo closure, cada chamada a um nome global guarda a função
+  encontrada no ambiente de builtins: as próximas chamadas não percorrem a
+  cadeia de ambientes enquanto o nome não for redefinido.
+* Chamadas com até 4 argumentos usam closures dedicadas que avaliam os
+  argumentos sem montar listas intermediárias.
+* Funções Ruspy sem memorização são executadas diretamente, sem passar por
+  __call__.
+"""
+import pytest
+
+CHAMADAS = [
+    "f = |a| a * 2; f(3)",
+    "f = |a, b| a - b; f(7, 2)",
+    "f = |a, b, c| a * b + c; f(2, 3, 4)",
+    "f = |a, b, c, d| a + b * c - d; f(1, 2, 3, 4)",
+    "f = |a, b, c, d, e| a + b + c + d + e; f(1, 2, 3, 4, 5)",
+    "f = |a, b, c, d, e, g| a * b * c * d * e * g; f(1, 2, 3, 4, 5, 6)",
+    "max(3, 8) + min(2, 9) + abs(-4) + sqrt(16.0)",
+    "f = |x| max(x, 1); a = f(0); max = |a, b| 100; a + f(0)",
+    "g = |x| x + 1; f = |x| g(x); a = f(1); g = |x| x * 10; a + f(1)",
+    "f = |n| ({ s = 0; for i in 0..n { s = s + max(i, 3) }; s }); f(10)",
+    "f = |g| g(2); f(|x| x * 21)",
+    "fat = |n| (if n <= 1 { 1 } else { n * fat(n - 1) }); fat(10)",
+    "mk = |x| (|y| x + y); g = mk(1); g(2)",
+]
+
+
+@pytest.mark.parametrize("src", CHAMADAS)
+def test_chamadas_equivalentes(ruspy, src):
+    assert ruspy._eval_or_exec(src, engine="closure") == ruspy._eval_or_exec(src, engine="tree")
+
+
+def test_erros(ruspy):
+    with pytest.raises(ValueError, match="não é uma função"):
+        ruspy._eval_or_exec("x = 1; x(2)", engine="closure")
+    with pytest.raises(ValueError, match="variável inexistente"):
+        ruspy._eval_or_exec("f = |x| nada(x); f(1)", engine="closure")
+    # O cache não esconde um nome global que deixou de ser função
+    with pytest.raises(ValueError, match="não é uma função"):
+        ruspy._eval_or_exec("f = |x| g(x); g = |x| x; f(1); g = 2; f(1)", engine="closure")
+
+
+def test_cache_por_ambiente(ruspy):
+    # A mesma closure compilada chamada em ambientes diferentes
+    fn = ruspy.RuspyCompiler().compile(ruspy.ast_expr.parse("max(1, 2)"))
+    env = ruspy.new_env()
+    assert fn([env, None]) == 2
+    other = ruspy.new_env()
+    other["max"] = lambda a, b: -1
+    assert fn([other, None]) == -1
+    assert fn([env, None]) == 2
+
+
+def test_chamada_direta(ruspy, monkeypatch):
+    calls = []
+    call = ruspy.CompiledFunction.__call__
+    monkeypatch.setattr(ruspy.CompiledFunction, "__call__", lambda self, *args: calls.append(args) or call(self, *args))
+    src = "fn dobro(x) { x * 2 } fn f(n) { s = 0; for i in 0..n { s = s + dobro(i) }; s } nomemo(dobro);"
+    mod = ruspy._eval_or_exec(src, True, "closure")
+    assert mod["f"](4) == 12
+    assert calls == [(4,)]
+
+
+def test_memorização_preservada(ruspy):
+    src = "fn dobro(x) { x * 2 } fn f(n) { s = 0; for i in 0..n { s = s + dobro(i % 2) }; s }"
+    mod = ruspy._eval_or_exec(src, True, "closure")
+    assert mod["f"](10) == 10
+    assert ruspy.memo_stats(mod)["dobro"]["hits"] == 8
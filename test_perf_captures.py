@@ -0,0 +1,90 @@
+"""
+# perf-captures
+
+Funções guardam somente as variáveis externas que leem.
+
+* No mecanismo closure, cada função criada guarda uma tupla (globais,
+  capturas...) com as variáveis das funções externas lidas no corpo, e não o
+  quadro inteiro em que foi criada.
+* Argumentos nunca atribuídos são copiados; as outras variáveis lidas por
+  funções internas ficam em células (Cell) compartilhadas, e atribuições
+  feitas depois da criação continuam visíveis, como no interpretador de
+  árvores.
+"""
+import contextlib
+import io
+
+import pytest
+
+CAPTURAS = [
+    "f = |x| ({ g = |y| ({ if y { x = 1 }; x }); g(false) * 10 + g(true) }); f(5)",
+    "f = |n| ({ s = 0; for i in 0..n { g = |x| x + i; s = s + g(i) }; s * 100 + g(0) }); f(4)",
+    "f = |n| ({ s = 0; r = 0..n; for i in r { g = |x| x + i; s = s + g(i) }; s * 100 + g(0) }); f(4)",
+    "f = |n| ({ for i in 0..n { g = |x| x * i } ; g(1) }); f(4)",
+    "f = |a| ({ g = |b| (|c| a + c); h = g(1); h(2) }); f(10)",
+    "x = 1; f = |y| ({ g = |z| x + z; a = g(0); x = 10; a + g(0) }); f(0)",
+    "f = |a| ({ g = |b| ({ a = a + b; a }); g(1) + g(2) + a }); f(10)",
+    "f = |a| ({ g = |b| ({ h = |c| ({ a = a + c; a }); h(b) }); g(1) + g(2) + a }); f(10)",
+    "f = |a, b| ({ g = |x| ({ b = x; a + b }); g(1) + b }); f(10, 20)",
+    "f = |n| ({ g = 0; while n > 0 { k = n; g = |x| x + k; n = n - 1 }; g(0) }); f(3)",
+    "f = |n| ({ g = |x| x + m; m = n * 2; g(1) }); f(5)",
+    "f = |n| ({ g = |x| x + m; g(1) }); m = 7; f(5)",
+]
+
+
+@pytest.mark.parametrize("src", CAPTURAS)
+def test_capturas_equivalentes(ruspy, src):
+    assert ruspy._eval_or_exec(src, engine="closure") == ruspy._eval_or_exec(src, engine="tree")
+
+
+def test_exemplo_pair(ruspy):
+    src = (ruspy.PATH / "exemplos" / "pair.rpy").read_text()
+    outputs = []
+    for engine in ["tree", "closure"]:
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            ruspy._eval_or_exec(src, True, engine)["main"]()
+        outputs.append(out.getvalue())
+    assert outputs[0] == outputs[1]
+
+
+def test_tupla_de_capturas(ruspy):
+    src = (ruspy.PATH / "exemplos" / "pair.rpy").read_text()
+    mod = ruspy._eval_or_exec(src, True, "closure")
+    cell = mod["cons"](1, None)
+    assert type(cell.env) is tuple and cell.env[1:] == (1, None)
+    assert cell.env[0] is mod
+
+    # Só b é capturada; como é atribuída, fica numa célula
+    g = ruspy._eval_or_exec("f = |a| ({ b = a * 2; c = a * 3; |x| x + b }); f(5)", engine="closure")
+    [b] = g.env[1:]
+    assert type(b) is ruspy.Cell and b.value == 10
+    assert g(1) == 11
+
+
+def nodes(ruspy, tree):
+    stack = [tree]
+    while stack:
+        node = stack.pop()
+        if isinstance(node, ruspy.Node):
+            yield node
+            stack.extend(node.children)
+
+
+def test_escopos(ruspy):
+    block = ruspy.ast_expr.parse("{ s = a; t = 1; g = |x| x + a + s + b; for i in 0..b { t = t + i }; g }")
+    scope = ruspy.Scope(None, ["a", "b"], block)
+    assert scope.slots == {"a": 2, "b": 3, "g": 4, "i": 5, "s": 6, "t": 7}
+    assert scope.cells == {6}
+    [lambd] = [node for node in nodes(ruspy, block) if node.data == "lambd"]
+    inner = ruspy.Scope(scope, ["x"], lambd.children[-1])
+    assert inner.captures == {(scope, 2): 1, (scope, 3): 2, (scope, 6): 3}
+    assert scope.lookup("a") == [(scope, 2)]
+
+
+def test_nomes_livres(ruspy):
+    tree = ruspy.ast_expr.parse("{ y = x; |z| ({ w = z + y; h = |k| k + v; w }) }")
+    # w é local da função interna, mas é procurada fora enquanto não for
+    # atribuída
+    assert ruspy.free_names([], tree) == {"v", "w", "x", "y"}
+    assert ruspy.free_names(["x", "y"], tree) == {"v", "w"}
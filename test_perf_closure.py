@@ -0,0 +1,92 @@
+"""
+# perf-closure
+
+Execução por closures compiladas a partir da árvore de nós.
+
+* O compilador produz o mesmo resultado que o interpretador de árvores para
+  os exemplos e para expressões avulsas.
+* Laços, break e continue funcionam nos dois mecanismos.
+* Erros em tempo de execução são os mesmos.
+* eval/module/run usam o mecanismo padrão, ENGINE.
+"""
+import contextlib
+import io
+
+import pytest
+
+EXPRESSÕES = [
+    "x = 20; x * 2 + 2",
+    "x = 2; y = |a| a * x; y(21)",
+    "if 1 > 2 { 1 } else { 2.5 }",
+    "if 1 > 2 { 1 } else if 2 > 1 { 2 }",
+    "if 1 > 2 { 1 } else if 2 > 3 { 2 }",
+    "if 1 > 2 { 1 }",
+    "(1 + 2) % 2",
+    "7 / 2 + 7.0 / 2",
+    "1 << 4 | 3 ^ 1 & 7",
+    "0 && undefined || 3",
+    "1..=3",
+    "sqrt(16) + max(1, 2)",
+    "let x = 1; x",
+    "{}",
+    "f = |a, b| a - b; f(10, f(3, 2))",
+    "s = 0; for i in 0..10 { if i == 5 { continue }; if i == 8 { break }; s = s + i }; s",
+    "i = 0; while i < 12 { i = i + 1 }; i",
+    "s = 0; for i in 0..3 { for j in 0..3 { if j > i { break }; s = s + j } }; s",
+]
+
+ERROS = [
+    "undefined + 1",
+    "x = 1; x(2)",
+    "f = |a| a; f(1, 2)",
+    "1 as 2",
+    "println(1)?",
+]
+
+
+def run_main(ruspy, src, engine):
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        mod = ruspy._eval_or_exec(src, True, engine)
+        mod["main"]()
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("name", ["fib", "pair"])
+def test_exemplos_equivalentes(ruspy, name):
+    src = (ruspy.PATH / "exemplos" / f"{name}.rpy").read_text()
+    out = run_main(ruspy, src, "closure")
+    assert out
+    assert out == run_main(ruspy, src, "tree")
+
+
+@pytest.mark.parametrize("src", EXPRESSÕES)
+def test_expressões_equivalentes(ruspy, src):
+    assert ruspy._eval_or_exec(src, engine="closure") == ruspy._eval_or_exec(src, engine="tree")
+
+
+@pytest.mark.parametrize("src", ERROS)
+def test_mesmos_erros(ruspy, src):
+    errors = []
+    for engine in ["tree", "closure"]:
+        with pytest.raises(Exception) as info:
+            ruspy._eval_or_exec(src, engine=engine)
+        errors.append((type(info.value), str(info.value)))
+    assert errors[0] == errors[1]
+
+
+def test_mecanismo_padrão(ruspy, monkeypatch):
+    calls = []
+    run_closure = ruspy.ENGINES["closure"]
+    monkeypatch.setitem(ruspy.ENGINES, "closure", lambda tree: calls.append(tree) or run_closure(tree))
+    assert ruspy.ENGINE == "closure"
+    assert ruspy.eval("1 + 1") == 2
+    assert ruspy.module("fn f() { 1 }")["f"]() == 1
+    assert len(calls) == 2
+
+
+def test_funções_compiladas(ruspy):
+    mod = ruspy.module("fn incr(n: int) { n + 1 }")
+    assert isinstance(mod["incr"], ruspy.CompiledFunction)
+    assert mod["incr"](41) == 42
+    assert repr(mod["incr"]) == "<fn incr>"
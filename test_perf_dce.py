@@ -0,0 +1,71 @@
+"""
+# perf-dce
+
+Remoção de código morto.
+
+* Comandos depois de return, break e continue são removidos.
+* Ramos de if com condição constante e laços while com condição falsa são
+  removidos.
+* Definições sem uso, cujo valor não tem efeitos colaterais, são removidas.
+* A árvore resultante produz o mesmo resultado que a original e o número de
+  nós removidos é informado.
+"""
+import pytest
+
+EXPRESSÕES = [
+    "f = |x| ({ return x; x + 1 }); f(2)",
+    "s = 0; for i in 0..5 { if i == 3 { continue; s = 100 }; s = s + i }; s",
+    "s = 0; while true { s = s + 1; if s > 3 { break; s = 0 } }; s",
+    "if 1 > 2 { 1 } else if 2 > 1 { 2 } else { 3 }",
+    "if 1 > 2 { 1 } else if x { 2 }",
+    "x = false; if x { 1 } else if true { 2 } else { 3 }",
+    "while false { undefined }; 5",
+    "let x = 1; let y = |a| a; z = x; 3",
+    "f = |x| ({ if x { return 1 } else { return 2 }; 3 }); f(true) + f(false)",
+    "{ let x = 1; }",
+    "g = |a| a; let f = |a| g(a); 1",
+]
+
+
+@pytest.mark.parametrize("src", EXPRESSÕES)
+def test_árvores_equivalentes(ruspy, src):
+    tree = ruspy.ast_expr.parse(src)
+    try:
+        expected = ruspy.run_tree(tree)
+    except Exception as ex:
+        with pytest.raises(type(ex)):
+            ruspy.run_tree(ruspy.optimize(tree))
+        return
+    assert ruspy.run_tree(ruspy.optimize(tree)) == expected
+
+
+@pytest.mark.parametrize(
+    "src, removed",
+    [
+        ("f = |x| ({ return x; x + 1 }); f(2)", 2),
+        ("let x = 1; x = 2; 3", 4),
+        ("y = 1; let x = y; 3", 0),
+        ("g = |a| a; let f = |a| g(a); 1", 13),
+        ("if x { 1; 2 } else { 3 }", 1),
+    ],
+)
+def test_nós_removidos(ruspy, src, removed):
+    dce = ruspy.DeadCodeEliminator()
+    tree = ruspy.ast_expr.parse(src)
+    new = dce.eliminate(tree)
+    assert dce.removed == removed
+    assert ruspy.count_nodes(tree) - ruspy.count_nodes(new) == removed
+
+
+def test_ramos_constantes(ruspy):
+    tree = ruspy.optimize(ruspy.ast_expr.parse("if 1 > 2 { 1 } else if x { 2 } else { 3 }"))
+    assert tree == ruspy.Node("if_", [ruspy.Node("name", ["x"]), ruspy.Node("seq", [2]), ruspy.Node("seq", [3])])
+    assert ruspy.optimize(ruspy.ast_expr.parse("while false { 1 }; 5")) == ruspy.Node("seq", [5])
+
+
+def test_módulo(ruspy):
+    src = "fn f(x) { return x; println(x) } fn main() { let unused = 1; if false { f(1) }; f(2) }"
+    tree = ruspy.optimize(ruspy.ast_mod.parse(src))
+    assert "println" not in tree.pretty()
+    assert "unused" not in tree.pretty()
+    assert ruspy.run_tree(tree)["main"]() == 2
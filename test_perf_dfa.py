@@ -0,0 +1,81 @@
+"""
+# perf-dfa
+
+Scanner guiado por tabelas de um DFA mínimo, gerado a partir dos terminais da
+gramática (Thompson -> eliminação de ε -> subconjuntos -> Hopcroft).
+
+* O DFA construído para uma expressão simples é mínimo.
+* Os tokens produzidos coincidem com os do lexer padrão do Lark.
+* O DFA é salvo em disco e reaproveitado.
+* Expressões sem equivalente em autômatos finitos mantêm o lexer do Lark.
+"""
+import os
+
+import pytest
+
+
+def accepts(dfa, text):
+    state = dfa.start
+    for ch in text:
+        state = dfa.table[state * dfa.width + dfa.ascii_class[ord(ch)]]
+    return dfa.accept[state]
+
+
+def test_dfa_mínimo(ruspy):
+    dfa = ruspy.DFA.from_regexes([r"[0-9](?:[0-9]|_)*"])
+    assert dfa.size == 3  # morto, inicial e aceitação
+    assert accepts(dfa, "1_000") == 0
+    assert accepts(dfa, "_1") == -1
+
+    dfa = ruspy.DFA.from_regexes(["ab|cb", "a+"])
+    assert accepts(dfa, "cb") == accepts(dfa, "ab") == 0
+    assert accepts(dfa, "aaa") == 1
+    assert accepts(dfa, "abb") == -1
+
+
+def test_regex_não_suportada(ruspy):
+    for pattern in [r"(a)\1", r"a(?=b)", r"a*?", r"(?i:a)"]:
+        with pytest.raises(ruspy.RegexNotSupported):
+            ruspy.DFA.from_regexes([pattern])
+
+
+def test_lexer_instalado(ruspy):
+    assert isinstance(ruspy.parser.parser.lexer, ruspy.DfaLexer)
+    assert ruspy.eval("x = 0x10 + 0b11; x * 2") == 38
+
+
+def lark_tokens(ruspy, src):
+    return [(tk.type, str(tk), tk.line, tk.column) for tk in ruspy.parser.lex(src)]
+
+
+def dfa_tokens(ruspy, src):
+    return [(tk.type, str(tk), tk.line, tk.column) for tk in ruspy.grammar_expr.lex(src)]
+
+
+def test_mesmos_tokens_do_lark_nos_exemplos(ruspy):
+    for path in sorted((ruspy.PATH / "exemplos").glob("*.rpy")):
+        src = path.read_text()
+        assert dfa_tokens(ruspy, src) == lark_tokens(ruspy, src), path.name
+
+
+def test_mesmos_tokens_do_lark_nos_terminais(ruspy, data):
+    for grp in "ID INT BIN_INT OCT_INT HEX_INT FLOAT COMMENT STRING".split():
+        for ex in data(grp) + data(grp + "_bad"):
+            try:
+                expected = lark_tokens(ruspy, ex)
+            except ruspy.LarkError:
+                with pytest.raises(ruspy.LarkError):
+                    dfa_tokens(ruspy, ex)
+            else:
+                assert dfa_tokens(ruspy, ex) == expected, ex
+
+
+def test_cache_do_dfa(ruspy, tmp_path):
+    conf = ruspy.parser.lexer_conf
+    lexer = ruspy.DfaLexer(conf, cache_dir=str(tmp_path))
+    [path] = tmp_path.iterdir()
+    mtime = os.stat(path).st_mtime_ns
+
+    cached = ruspy.DfaLexer(conf, cache_dir=str(tmp_path))
+    assert os.stat(path).st_mtime_ns == mtime
+    assert cached.dfa.serialize() == lexer.dfa.serialize()
@@ -0,0 +1,50 @@
+"""
+# perf-env
+
+Ambiente global em camadas.
+
+* Os nomes pré-definidos ficam numa camada compartilhada e imutável, que não é
+  copiada a cada execução.
+* Definições do usuário ficam num dicionário próprio de cada execução e não
+  vazam para as execuções seguintes.
+"""
+import pytest
+
+
+def test_camada_compartilhada(ruspy):
+    env = ruspy.new_env()
+    assert env.base is ruspy.BUILTINS
+    assert env["sqrt"] is ruspy.RuspyTransformer.global_names["sqrt"]
+    assert len(env) == 0
+    with pytest.raises(TypeError):
+        ruspy.BUILTINS["sqrt"] = None
+    with pytest.raises(KeyError):
+        env["undefined"]
+
+
+@pytest.mark.parametrize("engine", ["tree", "closure", "python", "vm"])
+def test_redefinições_não_vazam(ruspy, engine):
+    assert ruspy._eval_or_exec("sqrt = |x| x; sqrt(16)", engine=engine) == 16
+    assert ruspy._eval_or_exec("sqrt(16)", engine=engine) == 4
+    assert ruspy.RuspyTransformer.global_names["sqrt"](16) == 4
+
+
+@pytest.mark.parametrize("engine", ["tree", "closure", "python", "vm"])
+def test_módulo_só_com_definições_do_usuário(ruspy, engine):
+    mod = ruspy._eval_or_exec("fn f() { sqrt(4) }", True, engine)
+    assert list(mod) == ["f"]
+    assert mod["f"]() == 2
+    # O mesmo tipo de resultado em todos os mecanismos
+    assert isinstance(mod, ruspy.Namespace)
+    assert mod["sqrt"] is ruspy.BUILTINS["sqrt"]
+    assert mod.get("sqrt") is None
+
+
+def test_escopos_de_função(ruspy):
+    env = ruspy.new_env()
+    env["x"] = 1
+    local = env.new_child({"y": 2})
+    assert (local["x"], local["y"], local["max"]) == (1, 2, max)
+    local["x"] = 3
+    assert env["x"] == 1
+    assert env.maps[0] is env
@@ -0,0 +1,111 @@
+"""
+# perf-errors
+
+Diagnóstico de erros de sintaxe limitado e preguiçoso.
+
+* Erros de sintaxe viram RuspySyntaxError (subclasse de LarkError) com a
+  posição, os terminais esperados e o token encontrado.
+* Nada é impresso por padrão.
+* A mensagem mostra só uma janela de tokens em volta do erro e tem tamanho
+  limitado, e só é montada quando lida.
+* Rejeitar uma entrada grande custa o mesmo que rejeitar uma pequena.
+* O erro tem args e pode ser serializado com pickle.
+"""
+import io
+import pickle
+import time
+
+import pytest
+
+
+def error_for(ruspy, src, is_exec=False):
+    with pytest.raises(ruspy.RuspySyntaxError) as info:
+        ruspy._eval_or_exec(src, is_exec)
+    return info.value
+
+
+def test_erro_estruturado(ruspy, capsys):
+    err = error_for(ruspy, "x = 1;\ny = 2 +;\nz")
+    assert isinstance(err, ruspy.LarkError)
+    assert (err.line, err.column, err.pos) == (2, 8, 14)
+    assert err.found == "SEMICOLON"
+    assert "INT" in err.expected
+    assert capsys.readouterr() == ("", "")
+
+    data = err.as_dict()
+    assert data["found"] == "SEMICOLON"
+    assert ("SEMICOLON", ";", 14) in data["tokens"]
+    assert "linha 2, coluna 8" in data["message"]
+
+
+def test_erro_no_fim_da_entrada(ruspy):
+    err = error_for(ruspy, "(1 + 2")
+    assert err.found == "$END"
+    assert err.pos == 6
+    assert err.expected == {"RPAR"}
+
+
+def test_erro_do_lexer(ruspy):
+    err = error_for(ruspy, "1 + 2 $ 3")
+    assert err.found is None
+    assert err.pos == 6
+    assert [tk.type for tk in err.tokens] == ["INT", "PLUS", "INT"]
+
+
+@pytest.mark.parametrize("src", ["x = 1;\ny = 2 +;\nz", "(1 + 2", "1 + 2 $ 3"])
+def test_args_e_serialização(ruspy, src):
+    err = error_for(ruspy, src)
+    assert err.args[0] == src
+    assert repr(err).startswith("RuspySyntaxError(")
+
+    fn, args, state = err.__reduce__()
+    pickle.loads(pickle.dumps((args, state)))
+    copy = fn(*args)
+    copy.__dict__.update(state)
+    assert (copy.pos, copy.line, copy.column, copy.found) == (err.pos, err.line, err.column, err.found)
+    assert copy.expected == err.expected and copy.args[0] == src
+    assert str(copy) == str(err)
+
+
+def test_mensagem_é_preguiçosa(ruspy):
+    err = error_for(ruspy, "1 + * 2")
+    calls = []
+
+    class Spy:
+        def lex(self, src, lex=err.grammar.lex):
+            calls.append(src)
+            return lex(src)
+
+    err.grammar = Spy()
+    assert not calls
+    assert str(err) == str(err)
+    assert len(calls) == 1
+
+
+def test_impressão_opcional(ruspy, monkeypatch):
+    stream = io.StringIO()
+    monkeypatch.setitem(ruspy.syntax_error.__globals__, "SYNTAX_ERROR_STREAM", stream)
+    error_for(ruspy, "1 + * 2")
+    assert "Erro de sintaxe" in stream.getvalue()
+
+
+def test_mensagem_limitada(ruspy):
+    src = "x = " + "1 + " * 20_000 + "* 2"
+    err = error_for(ruspy, src)
+    message = str(err)
+    assert len(message) <= ruspy.MAX_MESSAGE_CHARS
+    assert len(err.tokens) <= ruspy.TOKENS_BEFORE + ruspy.TOKENS_AFTER
+    assert "'*' (STAR)  <--" in message
+
+
+def test_custo_do_diagnóstico_não_depende_do_tamanho(ruspy):
+    def cost(n):
+        src = "\n".join(f"x{i} = {i};" for i in range(n)) + "\n1 + * 2"
+        err = error_for(ruspy, src)
+        start = time.perf_counter()
+        str(err)
+        return time.perf_counter() - start
+
+    small = min(cost(10) for _ in range(3))
+    large = min(cost(5_000) for _ in range(3))
+    assert large < 10 * small
@@ -0,0 +1,82 @@
+"""
+# perf-flat
+
+Árvore sintática plana em vetores tipados (FlatAst).
+
+* pretty() produz o mesmo texto que lark.Tree.pretty(), usado nos arquivos
+  exemplos/*.ast, e to_tree() reconstrói a árvore original.
+* Os intervalos do código fonte de cada nó vêm dos tokens.
+* O arquivo salvo pode ser mapeado com mmap e percorrido sem cópias.
+"""
+import pytest
+from lark import Tree
+
+from test_cfg_ast import simplify
+
+EXEMPLOS = ["fib", "pair", "simple", "math", "math2", "math3"]
+
+
+def parse(ruspy, name, ast=False):
+    src = (ruspy.PATH / "exemplos" / f"{name}.rpy").read_text()
+    if name in ("fib", "pair"):
+        return (ruspy.ast_mod if ast else ruspy.grammar_mod).parse(src)
+    return (ruspy.ast_expr if ast else ruspy.grammar_expr).parse(src)
+
+
+@pytest.mark.parametrize("name", EXEMPLOS)
+def test_mesmo_formato_do_lark(ruspy, name):
+    tree = parse(ruspy, name)
+    flat = ruspy.FlatAst.from_tree(tree)
+    assert flat.pretty() == tree.pretty()
+    assert flat.to_tree() == tree
+    assert simplify(flat.to_tree()).pretty() == simplify(tree).pretty()
+
+
+@pytest.mark.parametrize("name", EXEMPLOS)
+def test_árvore_de_nós(ruspy, name):
+    node = parse(ruspy, name, ast=True)
+    flat = ruspy.FlatAst.from_tree(node)
+    assert flat.pretty() == node.pretty()
+
+
+def test_intervalos(ruspy):
+    # Tokens descartados pela gramática (parênteses, ";"...) não têm posição
+    src = "x = 1;\nf(x + 22) * y"
+    flat = ruspy.FlatAst.from_tree(ruspy.grammar_expr.parse(src))
+    assert flat.span(0) == (0, len(src))
+    spans = {src[slice(*flat.span(i))] for i in range(len(flat))}
+    assert {"x = 1", "x + 22", "22", "f(x + 22) * y"} <= spans
+
+
+def test_vetores_paralelos(ruspy):
+    flat = ruspy.FlatAst.from_tree(ruspy.grammar_expr.parse("1 + x"))
+    assert [flat.data(i) for i in range(len(flat))] == ["add", "lit", "name", "INT", "ID"]
+    assert list(flat.children(0)) == [1, 2]
+    assert [flat.value(i) for i in range(3, 5)] == ["1", "x"]
+
+
+@pytest.mark.parametrize("name", ["pair", "math3"])
+def test_arquivo_mapeado(ruspy, tmp_path, name):
+    tree = parse(ruspy, name)
+    path = tmp_path / "tree.ast"
+    ruspy.FlatAst.from_tree(tree).save(path)
+
+    flat = ruspy.FlatAst.load(path)
+    assert isinstance(flat.kind, memoryview)
+    assert flat.pretty() == tree.pretty()
+    assert flat.to_tree() == tree
+
+
+def test_constantes(ruspy):
+    values = [None, True, -7, 1 << 80, 2.5, "ção\n"]
+    flat = ruspy.FlatAst.from_tree(ruspy.Node("seq", values))
+    loaded = ruspy.FlatAst.frombytes(flat.tobytes())
+    assert [loaded.value(i) for i in loaded.children(0)] == values
+
+    fn, args = loaded.__reduce__()
+    assert fn(*args).pretty() == flat.pretty()
+
+
+def test_arquivo_inválido(ruspy):
+    with pytest.raises(ValueError):
+        ruspy.FlatAst.frombytes(b"lixo" * 100)
@@ -0,0 +1,125 @@
+"""
+# perf-fold
+
+Dobra e propagação de constantes.
+
+* Operadores sobre literais, funções puras de math e nomes atribuídos uma
+  única vez a literais são avaliados durante a compilação.
+* A árvore otimizada produz o mesmo resultado que a original, e os erros
+  (ex.: divisão por zero) continuam acontecendo na execução.
+* O otimizador pode ser desligado com OPTIMIZE.
+* Resultados maiores que FOLD_MAX_SIZE (potências, deslocamentos, repetição e
+  formatação de strings) são descartados antes de calculados, e ramos com
+  condição literal que nunca rodam não são dobrados.
+"""
+import contextlib
+import io
+
+import pytest
+from hypothesis import given
+from hypothesis import strategies as st
+
+from test_cfg_op import ms, ns, xs, ys
+from test_perf_pycompile import OPERADORES
+
+EXPRESSÕES = [
+    "let x = 2 * 3; x + sqrt(4)",
+    "let x = 2; f = |a| a * x; f(21)",
+    "x = 3; f = |a| a * x; x = 4; f(1)",
+    "if 1 > 2 { let x = 1; 2 }; x = 5; x",
+    "true && 2 || undefined",
+    "false || max(1, 2, 3) << 2",
+    "let pi = 3; pi * 2",
+    "f = |sqrt| sqrt(4); f(|x| x + 1)",
+    "s = 0; for i in 0..4 { let k = 10; s = s + i * k }; s",
+]
+
+ERROS = ["1 / 0 + 2 * 3", "sqrt(-1)", "1 + \"a\"", "x = 1 % 0; 1", "let x = 0; 1 / x"]
+
+
+def run(ruspy, tree):
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        value = ruspy.run_tree(tree)
+    return value, out.getvalue()
+
+
+@pytest.mark.parametrize("src", EXPRESSÕES + ["sqrt(2 * sqrt(2 + 2))"])
+def test_árvores_equivalentes(ruspy, src):
+    tree = ruspy.ast_expr.parse(src)
+    assert run(ruspy, ruspy.optimize(tree)) == run(ruspy, tree)
+
+
+@given(st.sampled_from(OPERADORES), xs(), ys(), ms(), ns(), ns(), ms() | xs(), ns() | ys(), st.booleans(), st.booleans())
+def test_expressões_de_cfg_op(ruspy, template, x, y, m, n, k, a, b, p, q):
+    src = template.format(x=x, y=y, m=m, n=n, k=k, a=a, b=b, p=str(p).lower(), q=str(q).lower())
+    tree = ruspy.ast_expr.parse(src)
+    try:
+        expected = ruspy.run_tree(tree)
+    except Exception as ex:
+        with pytest.raises(type(ex)):
+            ruspy.run_tree(ruspy.optimize(tree))
+        return
+    folded = ruspy.optimize(tree)
+    assert ruspy.run_tree(folded) == expected
+    if not isinstance(expected, range):
+        assert not isinstance(folded, ruspy.Node)
+
+
+@pytest.mark.parametrize("name", ["math", "math2", "math3"])
+def test_exemplos(ruspy, name):
+    tree = ruspy.ast_expr.parse((ruspy.PATH / "exemplos" / f"{name}.rpy").read_text())
+    assert run(ruspy, ruspy.optimize(tree)) == run(ruspy, tree)
+
+
+def test_dobra(ruspy):
+    fold = ruspy.ConstantFolder().fold
+    tree = fold(ruspy.ast_expr.parse((ruspy.PATH / "exemplos" / "math3.rpy").read_text()))
+    assert tree.children[1].children[0] == 2.0
+    tree = fold(ruspy.ast_expr.parse("let x = 2; y = x * 3; z = x; z = 1; z + y"))
+    assert tree.children[1] == ruspy.Node("null", [ruspy.Node("assign", ["y", 6])])
+    assert tree.children[-1] == ruspy.Node("add", [ruspy.Node("name", ["z"]), 6])
+
+
+@pytest.mark.parametrize("src", ERROS)
+def test_erros_na_execução(ruspy, src):
+    tree = ruspy.ast_expr.parse(src)
+    folded = ruspy.optimize(tree)
+    errors = []
+    for tree in [tree, folded]:
+        with pytest.raises(Exception) as info:
+            ruspy.run_tree(tree)
+        errors.append((type(info.value), str(info.value)))
+    assert errors[0] == errors[1]
+
+
+def test_desligado(ruspy, monkeypatch):
+    calls = []
+    optimize = ruspy.optimize
+    ruspy.PARSE_CACHE.clear()
+    monkeypatch.setitem(ruspy._eval_or_exec.__globals__, "optimize", lambda tree, partial=False: calls.append(tree) or optimize(tree, partial))
+    assert ruspy.eval("1 + 2") == 3
+    assert len(calls) == 1
+    monkeypatch.setitem(ruspy._eval_or_exec.__globals__, "OPTIMIZE", False)
+    assert ruspy.eval("1 + 2") == 3
+    assert len(calls) == 1
+
+
+GRANDES = ["pow(7, 30000000)", '"ab" * 100000000', "100000000 * \"ab\"", "1 << 100000000", '"%0999999999d" % 1']
+
+
+@pytest.mark.parametrize("src", GRANDES)
+def test_resultados_grandes_não_calculados(ruspy, src):
+    tree = ruspy.ast_expr.parse(src)
+    assert ruspy.optimize(tree) == tree
+
+
+def test_ramos_mortos_não_dobrados(ruspy, monkeypatch):
+    calls = []
+    sqrt = ruspy.BUILTINS["sqrt"]
+    monkeypatch.setitem(ruspy.RuspyTransformer.global_names, "sqrt", lambda x: calls.append(x) or sqrt(x))
+    for src in ["if false { sqrt(4) } else { 1 }", "if true { 1 } else if sqrt(9) { 2 }", "false && sqrt(4)", "true || sqrt(4)", "while false { sqrt(4) }; 1"]:
+        tree = ruspy.ast_expr.parse(src)
+        assert ruspy.run_tree(ruspy.optimize(tree)) == ruspy.run_tree(tree)
+    assert calls == []
+    assert ruspy.optimize(ruspy.ast_expr.parse("if false { pow(7, 3000000) } else { 1 }")) == ruspy.Node("seq", [1])
@@ -0,0 +1,51 @@
+"""
+# perf-frames
+
+Resolução de nomes em tempo de compilação.
+
+* Argumentos e variáveis atribuídas numa função ocupam posições fixas do
+  quadro da chamada; só os nomes globais ficam no dicionário do ambiente.
+* O escopo é léxico: funções anônimas leem os locais das funções externas.
+* Variáveis locais lidas antes da atribuição continuam sendo procuradas nos
+  escopos externos, como no interpretador de árvores.
+"""
+import pytest
+
+ESCOPOS = [
+    "x = 1; f = |y| ({ z = x; x = y; x + z }); f(10) + x",
+    "f = |a| ({ g = |b| a + b; g(1) + g(2) }); f(10)",
+    "f = |a| ({ g = |b| ({ h = |c| a + b + c; h(3) }); g(2) }); f(1)",
+    "f = |a| ({ g = |b| ({ a = b; a }); g(5) + a }); f(1)",
+    "f = |n| ({ g = |k| n + k; n = n + 1; g(0) }); f(1)",
+    "f = |a, a| a; f(1, 2)",
+    "f = |n| ({ for i in 0..n { s = i }; i + s }); f(4)",
+    "fat = |n| (if n < 2 { 1 } else { n * fat(n - 1) }); fat(10)",
+    "i = 100; f = |n| ({ s = 0; for i in 0..n { s = s + i }; s }); f(5) + i",
+]
+
+
+@pytest.mark.parametrize("src", ESCOPOS)
+def test_escopos_equivalentes(ruspy, src):
+    assert ruspy._eval_or_exec(src, engine="closure") == ruspy._eval_or_exec(src, engine="tree")
+
+
+def test_quadros(ruspy):
+    block = ruspy.ast_expr.parse("{ s = a; for i in 0..b { s = s + i }; s }")
+    scope = ruspy.Scope(None, ["a", "b"], block)
+    assert scope.slots == {"a": 2, "b": 3, "i": 4, "s": 5}
+    assert scope.unset == (ruspy.UNSET, ruspy.UNSET)
+    assert scope.resolve("s") == [(0, 5)]
+    assert ruspy.Scope(scope, ["s"], block).resolve("s") == [(0, 2), (1, 5)]
+    assert scope.resolve("x") == []
+
+
+def test_locais_fora_do_ambiente(ruspy):
+    env = ruspy.new_env()
+    src = "f = |n| ({ s = 0; for i in 0..n { s = s + i }; s }); f(4)"
+    assert ruspy.run_closure(ruspy.ast_expr.parse(src), env) == 6
+    assert set(env.maps[0]) == {"f"}
+
+
+def test_variável_inexistente(ruspy):
+    with pytest.raises(ValueError, match="variável inexistente: y"):
+        ruspy._eval_or_exec("f = |x| ({ z = y; y = x; z }); f(1)", engine="closure")
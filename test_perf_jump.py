@@ -0,0 +1,91 @@
+"""
+# perf-jump
+
+return, break e continue sem exceções.
+
+* No mecanismo closure, desvios em posição de comando (corpo de funções e
+  laços, comandos de blocos, ramos de if) são valores Jump repassados pelas
+  closures: nenhuma exceção é lançada no caminho normal.
+* break/continue executados numa função chamada no corpo de um laço e
+  desvios dentro de expressões continuam usando exceções, com o mesmo
+  comportamento do interpretador de árvores.
+"""
+import sys
+
+import pytest
+
+DESVIOS = [
+    "f = |n| ({ s = 0; for i in 0..n { if i % 3 == 0 { continue }; if i > 7 { break }; s = s + i }; s }); f(20)",
+    "f = |n| ({ for i in 0..n { for j in 0..n { if i * j == 6 { return i * 10 + j } } }; 0 }); f(5)",
+    "f = |n| ({ i = 0; while true { i = i + 1; if i > n { break }; if i % 2 == 0 { continue } }; i }); f(7)",
+    "f = |x| ({ if x > 5 { return 1 } else if x > 2 { return 2 }; 3 }); f(1) + f(3) * 10 + f(9) * 100",
+    "f = |x| ({ { { return x + 1 }; 5 } }); f(1)",
+    "f = |x| ({ let y = x; return y; 2 }); f(4)",
+    "f = |n| ({ r = 0; for i in 0..n { r = i; if i == 3 { return f(0) + 100 } }; r }); f(10)",
+    "f = |n| ({ s = 0; for i in 0..n { s = s + i; if s > 5 { break; } }; s }); f(10)",
+    "f = |n| ({ s = 0; r = 0..n; for i in r { if i == 2 { continue; }; if i == 4 { return s }; s = s + i } }); f(10)",
+    "g = |x| ({ if x > 2 { break }; x }); f = |n| ({ s = 0; for i in 0..n { s = s + g(i) }; s }); f(10)",
+    "g = |x| ({ if x % 2 == 0 { continue }; x }); f = |n| ({ s = 0; for i in 0..n { s = s + g(i) }; s }); f(10)",
+    "f = |n| ({ x = (for i in 0..n { if i == 2 { return i } }); 5 }); f(4)",
+    "f = |n| ({ for i in 0..n { x = (if i == 2 { break } else { i }) }; x }); f(4)",
+    "s = 0; for i in 0..10 { if i == 4 { break }; s = s + i }; s",
+    "for i in 0..3 { return i }",
+    "break",
+    "f = |x| ({ continue }); f(1)",
+]
+
+SEM_EXCEÇÕES = DESVIOS[:9]
+
+
+def exceptions(fn):
+    """
+    Tipos das exceções lançadas durante fn().
+    """
+    seen = []
+
+    def trace(frame, event, arg):
+        if event == "exception":
+            seen.append(arg[0])
+        return trace
+
+    sys.settrace(trace)
+    try:
+        fn()
+    finally:
+        sys.settrace(None)
+    return seen
+
+
+def run(ruspy, src, engine):
+    try:
+        return ruspy._eval_or_exec(src, engine=engine)
+    except (ruspy.ReturnValue, ruspy.LoopBreak, ruspy.LoopContinue) as ex:
+        return type(ex).__name__
+
+
+@pytest.mark.parametrize("src", DESVIOS)
+def test_desvios_equivalentes(ruspy, src):
+    assert run(ruspy, src, "closure") == run(ruspy, src, "tree")
+
+
+@pytest.mark.parametrize("src", SEM_EXCEÇÕES)
+def test_sem_exceções(ruspy, src):
+    fn = ruspy.RuspyCompiler().compile(ruspy.ast_expr.parse(src))
+    control = (ruspy.ReturnValue, ruspy.LoopBreak, ruspy.LoopContinue)
+    raised = exceptions(lambda: fn([ruspy.new_env(), None]))
+    assert not [ex for ex in raised if issubclass(ex, control)]
+
+
+def test_desvio_entre_funções(ruspy):
+    fn = ruspy.RuspyCompiler().compile(ruspy.ast_expr.parse(DESVIOS[9]))
+    raised = exceptions(lambda: fn([ruspy.new_env(), None]))
+    assert ruspy.LoopBreak in raised
+
+
+def test_jump(ruspy):
+    assert ruspy.BREAK.kind == "break" and ruspy.CONTINUE.kind == "continue"
+    with pytest.raises(ruspy.ReturnValue) as info:
+        ruspy.Jump("return", 42).throw()
+    assert info.value.value == 42
+    with pytest.raises(ruspy.LoopContinue):
+        ruspy.CONTINUE.throw()
@@ -0,0 +1,143 @@
+"""
+# perf-memo
+
+Memorização automática de funções puras.
+
+* A análise de efeitos marca como puras as funções que não imprimem, não
+  chamam funções impuras nem dependem de valores globais.
+* Funções puras usam um cache LRU próprio, limitado, com estatísticas.
+* Redefinir no módulo a própria função ou uma função que ela chama esvazia o
+  cache.
+* memo(f); e nomemo(f); ligam e desligam a memorização. São pré-definidos
+  em todos os mecanismos, mas só o closure memoriza.
+"""
+import contextlib
+import io
+
+import pytest
+
+PURAS = """
+fn fib(n: int) { if n <= 1 { return 1 } else { return fib(n - 1) + fib(n - 2) } }
+fn soma(n) { s = 0; for i in 0..n { if i > 100 { break }; s = s + fib(i % 10) }; s }
+fn hyp(a, b) { sqrt(a * a + b * b) }
+fn dobro(x) { x * 2 }
+"""
+
+IMPURAS = """
+fn show(x) { println(x) }
+fn usa_show(x) { show(x) + 1 }
+fn aplica(f, x) { f(x) }
+fn global(x) { x + undefined }
+fn cria(x) { |y| x + y }
+fn sai(x) { break }
+fn dup(x) { x }
+fn dup(x) { x + 1 }
+"""
+
+
+def module(ruspy, src, engine="closure"):
+    return ruspy._eval_or_exec(src, True, engine)
+
+
+def test_análise_de_efeitos(ruspy):
+    tree = ruspy.ast_mod.parse(PURAS + IMPURAS)
+    assert ruspy.pure_functions(tree.children) == {"fib", "soma", "hyp", "dobro"}
+
+    fib = (ruspy.PATH / "exemplos" / "fib.rpy").read_text()
+    assert ruspy.pure_functions(ruspy.ast_mod.parse(fib).children) == {"fib"}
+    pair = (ruspy.PATH / "exemplos" / "pair.rpy").read_text()
+    assert ruspy.pure_functions(ruspy.ast_mod.parse(pair).children) == set()
+
+
+def test_memorização(ruspy):
+    mod = module(ruspy, PURAS)
+    assert mod["fib"](90) == 4660046610375530309
+    stats = ruspy.memo_stats(mod)
+    assert set(stats) == {"fib", "soma", "hyp", "dobro"}
+    assert stats["fib"]["misses"] == 91
+    assert stats["fib"]["hits"] == 88
+    mod["fib"](90)
+    assert ruspy.memo_stats(mod)["fib"]["hits"] == 89
+    assert 0 < ruspy.memo_stats(mod)["fib"]["hit_rate"] < 1
+
+
+def test_exemplo_fib(ruspy):
+    src = (ruspy.PATH / "exemplos" / "fib.rpy").read_text()
+    outputs = []
+    for engine in ["tree", "closure"]:
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            module(ruspy, src, engine)["main"]()
+        outputs.append(out.getvalue())
+    assert outputs[0] == outputs[1]
+
+
+def test_limite_lru(ruspy):
+    mod = module(ruspy, PURAS + "memo(dobro, 2);")
+    for x in [1, 2, 3, 2, 4]:
+        assert mod["dobro"](x) == 2 * x
+    cache = mod["dobro"].memo
+    assert list(cache.values) == [(2,), (4,)]
+    assert cache.info()["hits"] == 1
+    assert cache.info()["size"] == cache.info()["maxsize"] == 2
+
+
+def test_chaves(ruspy):
+    mod = module(ruspy, PURAS)
+    assert mod["dobro"](1) == 2
+    assert mod["dobro"](1.0) == 2.0 and isinstance(mod["dobro"](1.0), float)
+    assert mod["dobro"]("a") == "aa"
+    assert ruspy.memo_stats(mod)["dobro"]["misses"] == 2
+
+
+def test_erros_não_são_guardados(ruspy):
+    mod = module(ruspy, PURAS)
+    with pytest.raises(TypeError):
+        mod["hyp"]("a", 1)
+    with pytest.raises(TypeError):
+        mod["hyp"](1)
+    assert ruspy.memo_stats(mod)["hyp"]["size"] == 0
+
+
+def test_anotações(ruspy):
+    mod = module(ruspy, PURAS + IMPURAS + "nomemo(fib); memo(show);")
+    assert "fib" not in ruspy.memo_stats(mod)
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        mod["show"](1)
+        mod["show"](1)
+    assert out.getvalue() == "1\n"
+    assert ruspy.memo_stats(mod)["show"]["hits"] == 1
+
+
+def test_dependências(ruspy):
+    tree = ruspy.ast_mod.parse(PURAS + "fn quad(x) { dobro(dobro(x)) } fn oito(x) { quad(dobro(x)) }")
+    deps = ruspy.pure_dependencies(tree.children)
+    assert deps["fib"] == ("fib",)
+    assert deps["oito"] == ("dobro", "oito", "quad")
+
+
+def test_redefinição_esvazia_cache(ruspy):
+    mod = module(ruspy, "fn g(n) { n + 1 } fn f(n) { g(n) * 2 }")
+    assert mod["f"](1) == 4
+    mod["g"] = lambda n: 100
+    assert mod["f"](1) == 200
+    f = mod["f"]
+    mod["f"] = lambda n: 0
+    assert f(1) == 200
+    assert ruspy.memo_stats({"f": f})["f"]["size"] == 1
+
+
+@pytest.mark.parametrize("engine", ["tree", "python", "vm"])
+def test_outros_mecanismos(ruspy, engine):
+    mod = module(ruspy, PURAS + "memo(dobro); nomemo(fib);", engine)
+    assert mod["dobro"](21) == 42
+    assert mod["fib"](10) == 89
+    assert ruspy.memo_stats(mod) == {}
+
+
+def test_nomes_pré_definidos(ruspy):
+    assert ruspy.BUILTINS["memo"] is ruspy.memo and ruspy.BUILTINS["nomemo"] is ruspy.nomemo
+    mod = module(ruspy, PURAS + "nomemo(fib);")
+    assert "nomemo" not in mod and mod["fib"].memo is None
+    assert ruspy.eval("memo") is ruspy.memo
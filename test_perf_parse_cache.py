@@ -0,0 +1,88 @@
+"""
+# perf-parse-cache
+
+Cache LRU de árvores sintáticas usado por eval()/module().
+
+* Código repetido não é reanalisado nem reotimizado.
+* O cache respeita os limites de entradas e de bytes, contando acertos,
+  falhas e remoções.
+* A execução nunca modifica uma árvore armazenada no cache.
+"""
+import pytest
+import lark
+
+
+@pytest.fixture
+def cache(ruspy):
+    ruspy.PARSE_CACHE.clear()
+    yield ruspy.PARSE_CACHE
+    ruspy.PARSE_CACHE.clear()
+
+
+def test_reaproveita_árvores(ruspy, cache):
+    assert ruspy.eval("x = 20; x * 2 + 2") == 42
+    assert ruspy.eval("x = 20; x * 2 + 2") == 42
+    assert cache.stats() == {**cache.stats(), "hits": 1, "misses": 1, "entries": 1}
+
+
+def test_reaproveita_árvores_otimizadas(ruspy, cache, monkeypatch):
+    calls = []
+    optimize = ruspy.optimize
+    monkeypatch.setitem(ruspy._eval_or_exec.__globals__, "optimize", lambda *args: calls.append(args) or optimize(*args))
+    for _ in range(3):
+        assert ruspy.module("fn f(x) { x + 2 * 3 }")["f"](1) == 7
+    assert len(calls) == 1
+    assert cache.stats() == {**cache.stats(), "hits": 2, "misses": 1}
+
+    monkeypatch.setitem(ruspy._eval_or_exec.__globals__, "OPTIMIZE", False)
+    assert ruspy.module("fn f(x) { x + 2 * 3 }")["f"](1) == 7
+    assert len(calls) == 1
+    assert cache.stats() == {**cache.stats(), "misses": 2, "entries": 2}
+
+
+def test_chave_inclui_símbolo_inicial(ruspy):
+    cache = ruspy.ParseCache()
+    seq = cache.parse(ruspy.grammar_expr, "1 + 1")
+    expr = cache.parse(ruspy.EntryPoint(ruspy.parser, "expr"), "1 + 1")
+    assert seq is not expr
+    assert cache.misses == 2
+
+
+def test_limite_de_entradas(ruspy):
+    cache = ruspy.ParseCache(max_entries=2)
+    for src in ["1", "2", "3", "1"]:
+        cache.parse(ruspy.grammar_expr, src)
+    assert len(cache) == 2
+    assert cache.evictions == 2
+    assert cache.hits == 0
+
+    cache.parse(ruspy.grammar_expr, "1")
+    assert cache.hits == 1
+
+
+def test_limite_de_bytes(ruspy):
+    small = ruspy.ParseCache(max_bytes=1)
+    small.parse(ruspy.grammar_expr, "1 + 2")
+    assert len(small) == 0
+
+    cache = ruspy.ParseCache(max_bytes=10_000)
+    for i in range(100):
+        cache.parse(ruspy.grammar_expr, f"{i} + {i}")
+    assert 0 < cache.size <= 10_000
+    assert cache.evictions == 100 - len(cache)
+
+
+def test_erros_não_são_armazenados(ruspy):
+    cache = ruspy.ParseCache()
+    with pytest.raises(lark.LarkError):
+        cache.parse(ruspy.grammar_expr, "1 +")
+    assert len(cache) == 0
+
+
+def test_execução_não_modifica_árvore(ruspy, cache):
+    src = "x = 1; if x < 2 { x + 40 } else { 0 }"
+    tree = cache.parse(ruspy.grammar_expr, src)
+    before = tree.pretty()
+    assert ruspy.eval(src) == 41
+    assert ruspy.eval(src) == 41
+    assert tree.pretty() == before
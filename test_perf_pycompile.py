@@ -0,0 +1,133 @@
+"""
+# perf-pycompile
+
+Compilação de módulos ruspy para bytecode Python.
+
+* Funções ruspy viram funções Python comuns.
+* Teste diferencial: todos os exemplos e as expressões de test_cfg_op produzem
+  o mesmo resultado (e a mesma saída) em todos os mecanismos de execução.
+* Programas que o compilador não reproduz fielmente são executados pelo
+  compilador de closures.
+"""
+import contextlib
+import io
+import types
+
+import pytest
+from hypothesis import given
+from hypothesis import strategies as st
+
+from test_cfg_op import ms, ns, xs, ys
+
+EXEMPLOS = ["fib", "pair", "simple", "math", "math2", "math3"]
+
+OPERADORES = [
+    "{x} + {y} - {n}",
+    "{x} * {y} / {n}",
+    "{x} + {y} * {n}",
+    "{a} % {b}",
+    "{a} / {b}",
+    "{m} << {n} + {k}",
+    "{m} & {n} >> {k}",
+    "{m} ^ {n} | {k}",
+    "{m} | {n} ^ {k}",
+    "{m} >= {n}",
+    "{m} !=  {n}",
+    "{p} && {q} || {k}",
+    "{p} || {q} && {k}",
+    "{m} .. {n}",
+    "{m} ..= {n}",
+]
+
+
+def differential(ruspy, src, is_exec=False):
+    """
+    Executa src em cada mecanismo; retorna {mecanismo: (resultado, saída)}.
+    """
+    results = {}
+    for engine in ruspy.ENGINES:
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            value = ruspy._eval_or_exec(src, is_exec, engine)
+            if is_exec:
+                value = value["main"]()
+        if isinstance(value, range):
+            value = list(value)
+        results[engine] = (value, out.getvalue())
+    return results
+
+
+def assert_same(results):
+    expected = results["tree"]
+    assert all(result == expected for result in results.values()), results
+
+
+@pytest.mark.parametrize("name", EXEMPLOS)
+def test_exemplos(ruspy, name):
+    src = (ruspy.PATH / "exemplos" / f"{name}.rpy").read_text()
+    assert_same(differential(ruspy, src, is_exec=name in ("fib", "pair")))
+
+
+@given(
+    st.sampled_from(OPERADORES),
+    xs(),
+    ys(),
+    ms(),
+    ns(),
+    ns(),
+    ms() | xs(),
+    ns() | ys(),
+    st.sampled_from(["true", "false"]),
+    st.sampled_from(["true", "false"]),
+)
+def test_expressões_de_cfg_op(ruspy, template, x, y, m, n, k, a, b, p, q):
+    src = template.format(x=x, y=y, m=m, n=n, k=k, a=a, b=b, p=p, q=q)
+    assert_same(differential(ruspy, src))
+
+
+@pytest.mark.parametrize(
+    "src",
+    [
+        "x = 2; y = |a| a * x; y(21)",
+        "if 1 > 2 { 1 } else if 2 > 1 { 2 }",
+        "0 && undefined || 3",
+        "a = 1 + ({ b = 2; b }); a",
+        "f = |x| ({ y = x; if y > 1 { return 10 }; y }); f(1) + f(5)",
+        "g = |x| x * 2; h = |y| y + 1; g(if 1 > 0 { h(3) } else { 0 }) + g(h(1))",
+        "s = 0; for i in 0..3 { for j in 0..3 { if j > i { break }; s = s + j } }; s",
+        "s = 0; i = 0; while { i = i + 1; i < 5 } { if i == 2 { continue }; s = s + i }; s",
+        "stop = |x| ({ if x > 2 { break } }); n = 0; for i in 0..10 { stop(i); n = n + 1 }; n",
+    ],
+)
+def test_expressões_equivalentes(ruspy, src):
+    assert_same(differential(ruspy, src))
+
+
+def test_funções_python(ruspy):
+    mod = ruspy._eval_or_exec("fn incr(n: int) { n + 1 }", True, "python")
+    assert isinstance(mod["incr"], types.FunctionType)
+    assert mod["incr"].__name__ == "incr"
+    assert mod["incr"](41) == 42
+    assert list(mod) == ["incr"]
+
+
+def test_código_não_compilável(ruspy):
+    # Em ruspy, x é lido do escopo global antes da atribuição local
+    src = "x = 1; f = |y| ({ z = x; x = y; x + z }); f(10)"
+    with pytest.raises(ruspy.NotCompilable):
+        ruspy.PythonCompiler().compile(ruspy.ast_expr.parse(src))
+    assert ruspy._eval_or_exec(src, engine="python") == 11
+
+
+def test_variável_inexistente(ruspy):
+    with pytest.raises(ValueError, match="variável inexistente: undefined"):
+        ruspy._eval_or_exec("undefined + 1", engine="python")
+
+
+@pytest.mark.parametrize("engine", ["tree", "closure", "python", "vm"])
+def test_variável_inexistente_em_funções(ruspy, engine):
+    mod = ruspy._eval_or_exec("fn f(x) { x + nope } fn g(x) { |y| y + nada }", True, engine)
+    with pytest.raises(ValueError, match="variável inexistente: nope"):
+        mod["f"](1)
+    with pytest.raises(ValueError, match="variável inexistente: nada"):
+        mod["g"](1)(2)
@@ -0,0 +1,89 @@
+"""
+# perf-quicken
+
+Especialização de / e % pelos tipos observados.
+
+* No mecanismo closure, cada ponto do programa que usa / ou % registra os
+  tipos dos operandos e, depois de QUICKEN_WARMUP execuções com dois int (ou
+  dois float), é reescrito para uma versão especializada.
+* Se os tipos mudarem, o ponto volta para a versão genérica, com o mesmo
+  resultado do interpretador de árvores.
+* quicken_stats() conta os pontos criados, especializados e
+  desespecializados.
+"""
+import pytest
+
+PROGRAMAS = [
+    "f = |a, b| a / b * 100 + a % b; s = 0; for i in 1..30 { s = s + f(i * 7, 3) }; s",
+    "f = |a, b| a / b + a % b; s = 0.0; for i in 1..30 { s = s + f(i * 1.5, 2.0) }; s",
+    "f = |a, b| a / b; s = 0; for i in 1..40 { s = s + f(if i > 20 { 1.0 * i } else { i }, 2) }; s",
+    "f = |a, b| a % b; s = 0; for i in 1..40 { s = s + f(if i % 3 == 0 { 0.5 * i } else { i }, 4) }; s",
+    "f = |a, b| a / b; s = 0; for i in 1..20 { s = s + f(true, 1) + f(i, true) }; s",
+    "f = |a, b| a % b; s = \"\"; for i in 1..20 { s = f(\"%d\", i) }; s",
+    "f = |a, b| a / b; for i in 0..20 { f(10 - i, 10 - i) }",
+    "f = |a, b| a / b; for i in 0..20 { f(10.0 - i, 10.0 - i) }",
+]
+
+
+def run(ruspy, src, engine):
+    try:
+        return ruspy._eval_or_exec(src, engine=engine)
+    except ZeroDivisionError as ex:
+        return type(ex)
+
+
+@pytest.mark.parametrize("src", PROGRAMAS)
+def test_resultados_equivalentes(ruspy, src):
+    closure = run(ruspy, src, "closure")
+    tree = run(ruspy, src, "tree")
+    assert closure == tree and type(closure) is type(tree)
+
+
+def site(ruspy, src):
+    # A closure do ponto é a própria closure da expressão compilada
+    fn = ruspy.RuspyCompiler().compile(ruspy.ast_expr.parse(src))
+    cells = dict(zip(fn.__code__.co_freevars, fn.__closure__))
+    quick = cells["site"].cell_contents
+    assert quick.run is fn
+    return quick, lambda **env: fn([ruspy.new_env() | env, None])
+
+
+def test_especialização(ruspy):
+    ruspy.quicken_stats(clear=True)
+    quick, run = site(ruspy, "a / b")
+    for i in range(ruspy.QUICKEN_WARMUP):
+        assert quick.kind is None
+        assert run(a=7 + i, b=2) == (7 + i) // 2
+    assert quick.kind is int and quick.run.__code__ is quick.fast[int]
+    assert run(a=9, b=2) == 4
+
+    assert run(a=9.0, b=2) == 4.5
+    assert quick.kind is None and quick.run.__code__ is quick.warmup
+    for i in range(ruspy.QUICKEN_WARMUP):
+        run(a=1.0, b=4.0)
+    assert quick.kind is float and run(a=1.0, b=4.0) == 0.25
+    assert ruspy.quicken_stats() == {"sites": 1, "specialized": 2, "deoptimized": 1, "generic": 0}
+
+
+def test_desiste_depois_de_desespecializar(ruspy):
+    quick, run = site(ruspy, "a % b")
+    ruspy.quicken_stats(clear=True)
+    for _ in range(ruspy.QUICKEN_MAX_DEOPT):
+        for _ in range(ruspy.QUICKEN_WARMUP):
+            run(a=7, b=3)
+        assert quick.kind is int
+        assert run(a=7.5, b=3) == 1.5
+    assert quick.run.__code__ is quick.generic
+    for _ in range(ruspy.QUICKEN_WARMUP * 2):
+        assert run(a=7, b=3) == 1
+    assert quick.kind is None
+    stats = ruspy.quicken_stats()
+    assert stats["deoptimized"] == ruspy.QUICKEN_MAX_DEOPT and stats["generic"] == 1
+
+
+def test_erros_não_especializam(ruspy):
+    quick, run = site(ruspy, "a / b")
+    for _ in range(ruspy.QUICKEN_WARMUP * 2):
+        with pytest.raises(ZeroDivisionError):
+            run(a=1, b=0)
+    assert quick.kind is None
@@ -0,0 +1,64 @@
+"""
+# perf-range
+
+Laços for sobre intervalos de inteiros.
+
+* for i in a..b e for i in a..=b usam um laço dedicado no mecanismo closure:
+  a variável do laço fica numa posição do quadro e os comandos do corpo são
+  compilados uma única vez.
+* break, continue (inclusive vindos de funções chamadas no corpo), laços
+  vazios e o valor da variável depois do laço continuam iguais ao
+  interpretador de árvores.
+"""
+import pytest
+
+LAÇOS = [
+    "f = |n| ({ s = 0; for i in 0..n { s = s + i }; s }); f(10)",
+    "f = |n| ({ s = 0; for i in 1..=n { s = s + i; }; s }); f(10)",
+    "s = 0; for i in 0..10 { if i % 2 == 0 { continue }; if i > 7 { break }; s = s + i; }; s + i",
+    "f = |n| ({ s = 0; for i in 0..n { if i == 3 { continue }; s = s + i; if i > 5 { break } }; s * 100 + i }); f(10)",
+    "i = 100; f = |n| ({ for i in 0..n { }; i }); f(0) + f(3)",
+    "f = |n| ({ s = 0; for i in 0..n { for i in 0..2 { s = s + i }; s = s + i }; s }); f(4)",
+    "f = |n| ({ s = 0; for i in 0..n { i = i * 10; s = s + i }; s }); f(4)",
+    "f = |n| ({ g = 0; for i in n..0 { g = 1 }; g }); f(5)",
+    "f = |n| ({ g = 0; for i in 0..n { g = |x| x + i }; g(1) }); f(3)",
+    "g = |x| ({ if x > 2 { break }; x }); f = |n| ({ s = 0; for i in 0..n { s = s + g(i) }; s }); f(10)",
+    "g = |x| ({ if x % 2 == 0 { continue }; x }); f = |n| ({ s = 0; for i in 0..n { s = s + g(i) }; s }); f(10)",
+    "f = |a, b| ({ s = 0; for i in a * 2..=b + 1 { s = s * 2 + i }; s }); f(1, 6)",
+    "for i in 0..2.5 { 1 }",
+    "for i in 0..\"a\" { 1 }",
+]
+
+
+@pytest.mark.parametrize("engine", ["closure", "python", "vm"])
+@pytest.mark.parametrize("src", LAÇOS)
+def test_laços_equivalentes(ruspy, src, engine):
+    try:
+        expected = ruspy._eval_or_exec(src, engine="tree")
+    except Exception as ex:
+        with pytest.raises(type(ex)):
+            ruspy._eval_or_exec(src, engine=engine)
+        return
+    assert ruspy._eval_or_exec(src, engine=engine) == expected
+
+
+def test_laço_dedicado(ruspy, monkeypatch):
+    calls = []
+    for_range = ruspy.RuspyCompiler.for_range
+    monkeypatch.setattr(ruspy.RuspyCompiler, "for_range", lambda self, *args: calls.append(args[0]) or for_range(self, *args))
+    src = "f = |n| ({ s = 0; r = 0..n; for j in r { s = s + j }; for i in 0..=n { s = s + i }; s }); f(4)"
+    assert ruspy._eval_or_exec(src, engine="closure") == 16
+    assert calls == ["i"]
+
+
+def test_leitura_direta_da_variável(ruspy):
+    # Dentro do corpo, a variável do laço é lida sem testar UNSET; fora dele,
+    # continua caindo para os escopos externos se o laço não executou
+    compiler = ruspy.RuspyCompiler()
+    block = ruspy.ast_expr.parse("{ for i in 0..n { s = i }; i }")
+    compiler.scope = scope = ruspy.Scope(None, ["n"], block)
+    compiler.compile(block)
+    assert scope.counters == set()
+    frame = [ruspy.new_env(), None, 0] + list(scope.unset)
+    frame[0]["i"] = "global"
+    assert compiler.compile(block)(frame) == "global"
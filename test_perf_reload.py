@@ -0,0 +1,113 @@
+"""
+# perf-reload
+
+Recarga incremental de declarações fn em módulos ruspy.
+
+* Somente as declarações tocadas por uma edição são reanalisadas.
+* As novas funções substituem as antigas no mesmo dicionário do módulo e são
+  vistas imediatamente pelos chamadores.
+* Edições inválidas levantam RuspySyntaxError e não alteram o módulo; erros
+  de execução também desfazem a edição.
+"""
+import pytest
+import lark
+
+SRC = """
+fn double(x) { x * 2 }
+
+// comentário com } e {
+fn quad(x) { double(double(x)) }
+
+fn main() { println("ok") }
+"""
+
+
+def test_divide_declarações(ruspy):
+    src = 'fn f() { "}" };\n/* { */ f(1);\nfn g(x) { h(|y| { y }) }'
+    spans, done = ruspy.split_items(src)
+    assert done
+    assert [src[a:b] for a, b in spans] == [
+        'fn f() { "}" };',
+        "f(1);",
+        "fn g(x) { h(|y| { y }) }",
+    ]
+    assert ruspy.split_items("fn f() { 1 ")[1] is False
+
+
+def test_módulo_equivale_a_module(ruspy):
+    src = (ruspy.PATH / "exemplos" / "pair.rpy").read_text()
+    live = ruspy.LiveModule(src)
+    assert sorted(live.namespace) == sorted(ruspy.module(src))
+
+
+def test_chamadores_veem_nova_definição(ruspy):
+    live = ruspy.LiveModule(SRC)
+    quad = live.namespace["quad"]
+    assert quad(3) == 12
+
+    changed = live.update(SRC.replace("x * 2", "x * 3"))
+    assert changed == ["double"]
+    assert live.namespace["quad"] is quad
+    assert quad(3) == 27
+
+
+def test_adiciona_e_remove_funções(ruspy):
+    live = ruspy.LiveModule(SRC)
+    assert live.update(SRC + "fn triple(x) { x * 3 }") == ["triple"]
+    assert live.namespace["triple"](2) == 6
+
+    assert live.update(SRC.replace('fn main() { println("ok") }', "")) == ["main", "triple"]
+    assert sorted(live.namespace) == ["double", "quad"]
+
+
+def test_edição_reanalisa_apenas_declaração_tocada(ruspy, monkeypatch):
+    src = "\n".join(f"fn f{i}(x) {{ x + {i} }}" for i in range(200))
+    live = ruspy.LiveModule(src)
+    parsed = []
+    parse = ruspy.ast_parser.parse
+    monkeypatch.setattr(ruspy.ast_parser, "parse", lambda s, **kw: parsed.append(s) or parse(s, **kw))
+
+    pos = src.index("x + 100 }")
+    assert live.edit(pos, pos + 9, "x - 100 }") == ["f100"]
+    assert parsed == ["fn f100(x) { x - 100 }"]
+    assert live.namespace["f100"](100) == 0
+    assert live.src == src.replace("x + 100 }", "x - 100 }")
+
+
+def test_edição_que_abre_bloco(ruspy):
+    live = ruspy.LiveModule(SRC)
+    with pytest.raises(ruspy.RuspySyntaxError):
+        live.update(SRC.replace("fn quad(x) { double(double(x)) }", "fn quad(x) {"))
+    assert live.src == SRC
+    assert live.namespace["quad"](1) == 4
+
+
+@pytest.mark.parametrize("bad", ["fn quad(x) { double(double(x)) + }", "fn quad(x) { $ }"])
+def test_erro_de_sintaxe_na_edição(ruspy, bad):
+    live = ruspy.LiveModule(SRC)
+    with pytest.raises(ruspy.RuspySyntaxError) as info:
+        live.update(SRC.replace("fn quad(x) { double(double(x)) }", bad))
+    assert info.value.line == 1 and isinstance(info.value, lark.LarkError)
+    assert live.src == SRC and live.namespace["quad"](1) == 4
+
+
+@pytest.mark.parametrize("engine", ["tree", "closure", "python", "vm"])
+def test_recarga_usa_engine_e_otimizador(ruspy, monkeypatch, engine):
+    monkeypatch.setitem(ruspy._eval_or_exec.__globals__, "ENGINE", engine)
+    src = "fn s(n, acc) { if n == 0 { acc } else { s(n - 1, acc + n) } }"
+    live = ruspy.LiveModule(src)
+    live.update(src.replace("acc + n", "acc + 2 * n"))
+    n = 50 if engine == "tree" else 5000
+    assert live.namespace["s"](n, 0) == n * (n + 1)
+
+
+def test_erro_de_execução_desfaz_edição(ruspy):
+    live = ruspy.LiveModule("fn g(n) { n + 1 }")
+    with pytest.raises(ValueError):
+        live.update("fn g(n) { n + 2 }\nfn h() { 1 }\nboom(1);")
+    assert live.namespace["g"](1) == 2
+    assert "h" not in live.namespace
+    assert live.src == "fn g(n) { n + 1 }" and live.texts == ["fn g(n) { n + 1 }"]
+
+    assert live.update("fn g(n) { n + 2 }\nfn h() { 1 }") == ["g", "h"]
+    assert live.namespace["g"](1) == 3
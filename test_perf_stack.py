@@ -0,0 +1,131 @@
+"""
+# perf-stack
+
+Árvores profundas sem recursão no Python.
+
+* Cadeias longas de operadores (a + b + c + ...), blocos aninhados e
+  sequências longas são executados em todos os mecanismos.
+* O interpretador de árvores, o otimizador e a compilação para a máquina
+  virtual usam pilhas explícitas: a pilha do Python não cresce com a
+  profundidade da árvore, inclusive em ifs, laços, && e || aninhados.
+* exec_stream executa os mesmos programas profundos que eval().
+* O mecanismo closure passa as árvores profundas demais para a máquina
+  virtual.
+"""
+import contextlib
+import io
+import sys
+
+import pytest
+
+ENGINES = ["tree", "closure", "python", "vm"]
+N = 100_000
+
+
+def chain(n, term="x"):
+    return "x = 1; " + " + ".join([term] * n)
+
+
+def blocks(n):
+    return "x = 1; " + "{ " * n + "x" + " }" * n
+
+
+def ifs(n):
+    return "x = 1; " + "if x { " * n + "x" + " } else { 2 }" * n
+
+
+def loops(n):
+    return "x = 0; " + "while x < 1 { " * n + "x = x + 1" + " }" * n + "; x"
+
+
+def ands(n):
+    return "x = 1; " + " && ".join(["x"] * n) + " || x"
+
+
+@contextlib.contextmanager
+def recursion_limit(extra):
+    # Limite de recursão logo acima da profundidade atual da pilha
+    depth = 0
+    frame = sys._getframe()
+    while frame is not None:
+        depth += 1
+        frame = frame.f_back
+    old = sys.getrecursionlimit()
+    sys.setrecursionlimit(depth + extra)
+    try:
+        yield
+    finally:
+        sys.setrecursionlimit(old)
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize(
+    "src, expected",
+    [(chain(N), N), (chain(N, "1"), N), (blocks(N // 2), 1)],
+    ids=["soma", "literais", "blocos"],
+)
+def test_árvores_profundas(ruspy, engine, src, expected):
+    assert ruspy._eval_or_exec(src, engine=engine) == expected
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_sequência_longa(ruspy, engine):
+    src = "x = 0; " + "x = x + 1; " * 10_000 + "x"
+    assert ruspy._eval_or_exec(src, engine=engine) == 10_000
+
+
+@pytest.mark.parametrize("optimize", [True, False])
+@pytest.mark.parametrize("src", [ifs(5_000), loops(2_000), ands(N)], ids=["ifs", "laços", "and"])
+def test_formas_especiais_profundas(ruspy, monkeypatch, optimize, src):
+    monkeypatch.setitem(ruspy._eval_or_exec.__globals__, "OPTIMIZE", optimize)
+    assert ruspy._eval_or_exec(src, engine="tree") == 1
+
+
+def test_saltos_no_interpretador(ruspy):
+    src = """
+    f = |n| ({
+        s = 0;
+        for i in 0..n {
+            if i % 2 == 0 { continue };
+            j = 0;
+            while true { j = j + 1; if j > i { break }; s = s + j };
+            if s > 40 { return s * 100 }
+        };
+        s
+    });
+    f(5) + f(20)
+    """
+    assert ruspy._eval_or_exec(src, engine="tree") == ruspy._eval_or_exec(src, engine="closure")
+
+
+@pytest.mark.parametrize(
+    "src, expected",
+    [(chain(N), N), (blocks(20_000), 1), ("(" * 20_000 + "1" + ")" * 20_000, 1), (ifs(5_000), 1)],
+    ids=["soma", "blocos", "parênteses", "ifs"],
+)
+def test_fluxo_profundo(ruspy, src, expected):
+    assert ruspy.exec_stream(io.StringIO(src)) == expected
+
+
+@pytest.mark.parametrize("n", [1_000, N])
+def test_pilha_constante(ruspy, n):
+    for src in [chain(n), blocks(n // 4), ifs(n // 20)]:
+        tree = ruspy.ast_expr.parse(src)
+        with recursion_limit(100):
+            optimized = ruspy.optimize(tree)
+            assert ruspy.run_tree(tree) == ruspy.run_tree(optimized)
+            assert ruspy.run_vm(tree) == ruspy.run_vm(optimized)
+
+
+def test_trampoline(ruspy):
+    def depth(node):
+        if not isinstance(node, ruspy.Node):
+            return 0
+        deepest = 0
+        for child in node.children:
+            deepest = max(deepest, (yield child))
+        return deepest + 1
+
+    tree = ruspy.ast_expr.parse(chain(1_000))
+    assert ruspy.trampoline(depth, tree) == 1_001
+    assert ruspy.trampoline(depth, 42) == 0
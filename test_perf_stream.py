@@ -0,0 +1,138 @@
+"""
+# perf-stream
+
+Execução em fluxo de scripts ruspy longos.
+
+* Comandos são separados corretamente mesmo quando cruzam a fronteira entre
+  dois blocos lidos do arquivo.
+* O resultado é o mesmo de eval()/module().
+* O fluxo aceita e rejeita os mesmos programas que eval(), com os erros de
+  sintaxe na mesma posição: um único estado do parser recebe todos os
+  comandos, executados com ENGINE e OPTIMIZE.
+* Um comando maior que o bloco de leitura não é reanalisado a cada bloco.
+* A memória usada não cresce com o tamanho do arquivo.
+"""
+import io
+import tracemalloc
+from itertools import chain
+import pytest
+
+SCRIPTS = [
+    "x = 1; if x { 2 } else { 3 }",
+    "x = 1;\ny = 2;\nif y > 1 { z = 10 } else { z = 20 }\nz * 2",
+    "a = 1; /* ; } */ b = 2; // }\na + b",
+    "f = |x| x * 2; f(21)",
+    "x = 1;",
+    "{ 1 }",
+]
+
+
+@pytest.mark.parametrize("src", SCRIPTS)
+@pytest.mark.parametrize("chunk_size", [1, 2, 7, 4096])
+def test_equivale_a_eval(ruspy, src, chunk_size):
+    fd = io.StringIO(src)
+    assert ruspy.exec_stream(fd, chunk_size=chunk_size) == ruspy.eval(src)
+
+
+def test_modo_módulo(ruspy):
+    src = (ruspy.PATH / "exemplos" / "pair.rpy").read_text()
+    mod = ruspy.exec_stream(io.StringIO(src), is_exec=True, chunk_size=16)
+    assert sorted(mod) == sorted(ruspy.module(src))
+    assert mod["head"](mod["l2"](4, 2)) == 4
+
+
+def test_código_incompleto(ruspy):
+    with pytest.raises(ruspy.RuspySyntaxError):
+        ruspy.exec_stream(io.StringIO("x = 1; if x { 2"), chunk_size=3)
+
+
+VALIDADE = [
+    "// comentário\ny = |a| { a + 1 }; y(2)",
+    "y = |a| { a + 1 };",
+    "x = 1 y = 2",
+    "x = 1; 2.",
+    "2.",
+    "2.\n\n",
+    "x = 1;\ny = 2;\nz = 3;\nw = 4 +* 5;\n",
+    "x = 1;\ny = 2; z = $;",
+    "{ 1 } { 2 }",
+    "if true { 1 } else { 2 }; 3",
+    "f = |x| x; f(1)\n// fim",
+    "",
+    "   ",
+]
+
+
+@pytest.mark.parametrize("src", VALIDADE)
+@pytest.mark.parametrize("chunk_size", [1, 5, 4096])
+def test_aceita_o_mesmo_que_eval(ruspy, src, chunk_size):
+    try:
+        expected = ruspy.eval(src)
+    except ruspy.RuspySyntaxError as error:
+        with pytest.raises(ruspy.RuspySyntaxError) as info:
+            ruspy.exec_stream(io.StringIO(src), chunk_size=chunk_size)
+        assert (info.value.pos, info.value.line, info.value.column) == (error.pos, error.line, error.column)
+    else:
+        assert ruspy.exec_stream(io.StringIO(src), chunk_size=chunk_size) == expected
+
+
+@pytest.mark.parametrize("engine", ["tree", "closure", "python", "vm"])
+def test_usa_engine_e_otimizador(ruspy, monkeypatch, engine):
+    calls = []
+    run = ruspy.ENGINES[engine]
+    monkeypatch.setitem(ruspy.ENGINES, engine, lambda tree, env=None: calls.append(tree) or run(tree, env))
+    monkeypatch.setitem(ruspy._eval_or_exec.__globals__, "ENGINE", engine)
+    src = "x = 2 * 3;\nf = |y| x + y;\nx = 10;\nf(1)"
+    assert ruspy.exec_stream(io.StringIO(src), chunk_size=4) == ruspy.eval(src) == 11
+    assert calls and all(isinstance(tree, ruspy.Node) for tree in calls)
+    # 2 * 3 dobrado; x não é propagado para f, pois o restante do arquivo o redefine
+    assert calls[0].children[0].children[0] == ruspy.Node("assign", ["x", 6])
+
+
+class LazyScript(io.TextIOBase):
+    """
+    Arquivo que gera os comandos sob demanda, sem manter o texto na memória.
+    """
+
+    def __init__(self, lines):
+        body = (f"x = x + {i};\n" for i in range(lines))
+        self.lines = chain(["x = 0;\n"], body, ["x"])
+
+    def read(self, size=-1):
+        out = []
+        n = 0
+        for line in self.lines:
+            out.append(line)
+            n += len(line)
+            if n >= size:
+                break
+        return "".join(out)
+
+
+def test_memória_constante(ruspy):
+    def run(lines):
+        tracemalloc.start()
+        try:
+            result = ruspy.exec_stream(LazyScript(lines), chunk_size=1024)
+            return result, tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    small, small_peak = run(500)
+    large, large_peak = run(5_000)
+    assert small == sum(range(500))
+    assert large == sum(range(5_000))
+    assert large_peak < 2 * small_peak
+
+
+def test_comando_longo_analisado_em_tempo_linear(ruspy, monkeypatch):
+    scanned = []
+    split_items = ruspy.split_items
+    monkeypatch.setitem(
+        ruspy.iter_items.__globals__,
+        "split_items",
+        lambda src, start=0, end=None: scanned.append(len(src) - start) or split_items(src, start, end),
+    )
+    src = "if true {" + " y = 1;" * 20_000 + " 2 } else { 0 }"
+    assert ruspy.exec_stream(io.StringIO(src), chunk_size=64) == 2
+    assert sum(scanned) < 5 * len(src)
@@ -0,0 +1,69 @@
+"""
+# perf-strings
+
+Varredura em tempo linear de strings e comentários de bloco.
+
+* Strings aceitam somente escapes válidos e terminam nas primeiras aspas não
+  escapadas.
+* Comentários de bloco podem ocupar várias linhas e terminam no primeiro */.
+* O custo por byte de entradas adversárias (não terminadas, longas) não cresce
+  com o tamanho da entrada.
+"""
+import time
+
+import pytest
+
+
+def tokens(ruspy, src):
+    return [(tk.type, str(tk)) for tk in ruspy.grammar_expr.lex(src)]
+
+
+@pytest.mark.parametrize(
+    "src",
+    [r'""', r'"abc"', r'"a\nb"', r'"\"\\\0\t\r\'"', r'"\x7F"', r'"\u{1_F6_00}"', '"várias\nlinhas"'],
+)
+def test_strings_válidas(ruspy, src):
+    assert tokens(ruspy, src) == [("STRING", src)]
+
+
+@pytest.mark.parametrize("src", [r'"\q"', r'"\x7"', r'"\u{}"', r'"\u{1234567}"', r'"abc', '"\\"'])
+def test_strings_inválidas(ruspy, src):
+    with pytest.raises(ruspy.LarkError):
+        tokens(ruspy, src)
+
+
+def test_strings_não_são_gulosas(ruspy):
+    assert tokens(ruspy, '"a" + "b"') == [("STRING", '"a"'), ("PLUS", "+"), ("STRING", '"b"')]
+
+
+def test_comentários_de_bloco(ruspy):
+    assert tokens(ruspy, "/* a */ x /* b */") == [("ID", "x")]
+    assert tokens(ruspy, "/* várias\n * linhas **/ x") == [("ID", "x")]
+    assert ruspy.eval("1 /* 2 */ + /* 3\n */ 4") == 5
+
+
+def cost_per_byte(ruspy, text):
+    start = time.perf_counter()
+    try:
+        for _ in ruspy.grammar_expr.lex(text):
+            pass
+    except ruspy.LarkError:
+        pass
+    return (time.perf_counter() - start) / len(text)
+
+
+@pytest.mark.parametrize(
+    "make",
+    [
+        lambda n: '"' + "a" * n,
+        lambda n: '"' + "\\n" * n + "\\q",
+        lambda n: "/* " * n,
+        lambda n: "/*" + "*" * n,
+    ],
+    ids=["string aberta", "escape inválido", "comentários abertos", "asteriscos"],
+)
+def test_custo_linear(ruspy, make):
+    small = min(cost_per_byte(ruspy, make(2_000)) for _ in range(3))
+    large = min(cost_per_byte(ruspy, make(16_000)) for _ in range(3))
+    # Um lexer quadrático teria custo por byte 8 vezes maior
+    assert large < 3 * small
@@ -0,0 +1,90 @@
+"""
+# perf-tail
+
+Chamadas em posição de cauda.
+
+* Recursões em cauda de funções fn e anônimas, inclusive com return f(...),
+  usam uma quantidade constante da pilha do Python nos mecanismos closure,
+  vm e python.
+* Recursão mútua também.
+* break dentro da função chamada por return f(...) no corpo de um laço
+  continua interrompendo o laço.
+"""
+import sys
+
+import pytest
+
+ENGINES = ["closure", "vm", "python"]
+
+LISTAS = """
+fn build(n, acc) { if n == 0 { acc } else { build(n - 1, cons(n, acc)) } }
+fn len(lst, n) { if lst == null { return n }; return len(tail(lst), n + 1) }
+fn even(n) { if n == 0 { true } else { odd(n - 1) } }
+fn odd(n) { n != 0 && even(n - 1) }
+"""
+
+
+@pytest.fixture
+def pair(ruspy):
+    return (ruspy.PATH / "exemplos" / "pair.rpy").read_text() + LISTAS
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_listas_longas(ruspy, pair, engine):
+    n = sys.getrecursionlimit() * 5
+    mod = ruspy._eval_or_exec(pair, True, engine)
+    lst = mod["reverse"](mod["build"](n, None))
+    assert mod["head"](lst) == n
+    assert mod["len"](lst, 0) == n
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_recursão_mútua(ruspy, pair, engine):
+    mod = ruspy._eval_or_exec(pair, True, engine)
+    n = sys.getrecursionlimit() * 5
+    assert mod["even"](n) is True
+    assert mod["odd"](n) is False
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_funções_anônimas(ruspy, engine):
+    src = "count = |n, acc| (if n == 0 { acc } else { count(n - 1, acc + 1) }); count(10000, 0)"
+    assert ruspy._eval_or_exec(src, engine=engine) == 10000
+
+
+@pytest.mark.parametrize(
+    "src, value",
+    [
+        ("stop = |x| ({ if x > 2 { break } }); f = |n| ({ for i in 0..n { return stop(i) }; 1 }); "
+         "g = |n| ({ s = 0; for i in 0..n { s = s + 1; f(i) }; s }); g(5)", 5),
+        ("stop = |x| ({ if x > 2 { break }; x }); s = 0; for i in 0..10 { s = s + stop(i) }; s", 3),
+        ("f = |x| println(x); f(1)", None),
+        ("f = |a, b| a - b; g = |x| f(x); g(1)", TypeError),
+    ],
+)
+@pytest.mark.parametrize("engine", ENGINES)
+def test_mesma_semântica(ruspy, engine, src, value):
+    if value is TypeError:
+        # As funções do mecanismo python usam as mensagens do próprio Python
+        match = None if engine == "python" else r"<lambda>\(\) espera 2 argumento\(s\), recebeu 1"
+        with pytest.raises(TypeError, match=match):
+            ruspy._eval_or_exec(src, engine=engine)
+    else:
+        assert ruspy._eval_or_exec(src, engine=engine) == ruspy._eval_or_exec(src, engine="tree") == value
+
+
+def test_instrução_tail_call(ruspy):
+    mod = ruspy.BytecodeCompiler().compile(ruspy.ast_mod.parse("fn f(n) { if n { f(n - 1) } else { g(n) } }"))
+    code = mod.consts[0]
+    ops = [ruspy.OP_NAMES[op] for op in code.ops[::2]]
+    assert ops.count("TAIL_CALL") == 2
+    assert "CALL" not in ops
+
+
+def test_redefinição_no_mecanismo_python(ruspy):
+    mod = ruspy._eval_or_exec("fn count(n, acc) { if n == 0 { acc } else { count(n - 1, acc + 1) } }", True, "python")
+    count = mod["count"]
+    assert count(10000, 0) == 10000
+    # A chamada em cauda procura o nome no módulo a cada chamada
+    count.__globals__["count"] = lambda n, acc: -acc
+    assert count(5, 0) == -1
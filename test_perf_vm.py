@@ -0,0 +1,90 @@
+"""
+# perf-vm
+
+Máquina virtual de pilha.
+
+* O compilador gera objetos de código com vetor de instruções, constantes,
+  nomes e saltos.
+* A máquina virtual produz os mesmos resultados que o transformer (veja
+  também o teste diferencial em test_perf_pycompile.py).
+* Objetos de código podem ser serializados e executados depois.
+* A máquina virtual conta as instruções executadas.
+"""
+import contextlib
+import io
+from array import array
+
+import pytest
+
+
+def compile_src(ruspy, src, is_exec=False):
+    grammar = ruspy.ast_mod if is_exec else ruspy.ast_expr
+    return ruspy.BytecodeCompiler().compile(grammar.parse(src))
+
+
+def run_main(ruspy, code):
+    out = io.StringIO()
+    with contextlib.redirect_stdout(out):
+        ruspy.VirtualMachine().run(code, ruspy.new_env())["main"]()
+    return out.getvalue()
+
+
+def test_objeto_de_código(ruspy):
+    code = compile_src(ruspy, "x = 40; x + 2")
+    assert isinstance(code.ops, array)
+    assert [ruspy.OP_NAMES[op] for op in code.ops[::2]] == ["CONST", "STORE", "LOAD", "CONST", "BINARY", "RETURN"]
+    assert code.names == ["x"]
+    assert ruspy.VirtualMachine().run(code, ruspy.new_env()) == 42
+
+
+def test_saltos(ruspy):
+    code = compile_src(ruspy, "if x { 1 } else { 2 }")
+    jumps = [(pc, code.ops[pc + 1]) for pc in range(0, len(code.ops), 2) if "JUMP" in ruspy.OP_NAMES[code.ops[pc]]]
+    assert jumps
+    assert all(0 <= target <= len(code.ops) and target % 2 == 0 for _, target in jumps)
+    for x, value in [("true", 1), ("false", 2)]:
+        assert ruspy.VirtualMachine().run(code, ruspy.new_env().new_child({"x": x == "true"})) == value
+
+
+@pytest.mark.parametrize(
+    "src, value",
+    [
+        ("s = 0; for i in 0..10 { if i == 5 { continue }; if i == 8 { break }; s = s + i }; s", 23),
+        ("s = 0; i = 0; while i < 10 { i = i + 1; s = s + 1 + (if i > 3 { break } else { 0 }) }; s", 3),
+        ("stop = |x| ({ if x > 2 { break } }); n = 0; for i in 0..10 { stop(i); n = n + 1 }; n", 3),
+        ("f = |x| ({ for i in 0..x { if i == 3 { return i * 10 } }; x }); f(2) + f(9)", 32),
+    ],
+)
+def test_laços(ruspy, src, value):
+    assert ruspy._eval_or_exec(src, engine="vm") == value
+    assert ruspy._eval_or_exec(src, engine="tree") == value
+
+
+def test_break_de_função_chamada(ruspy):
+    code = compile_src(ruspy, "stop = |x| ({ if x > 2 { break } }); for i in 0..10 { stop(i) }")
+    assert len(code.handlers) == 1
+    lambd = next(c for c in code.consts if isinstance(c, ruspy.CodeObject))
+    assert ruspy.OP_BREAK in lambd.ops[::2]
+
+
+@pytest.mark.parametrize("name", ["fib", "pair"])
+def test_serialização(ruspy, name):
+    src = (ruspy.PATH / "exemplos" / f"{name}.rpy").read_text()
+    code = compile_src(ruspy, src, is_exec=True)
+    data = code.tobytes()
+    loaded = ruspy.CodeObject.frombytes(data)
+    assert loaded.dis() == code.dis()
+    assert run_main(ruspy, loaded) == run_main(ruspy, code)
+
+    fn, args = code.__reduce__()
+    assert fn(*args).dis() == code.dis()
+
+    with pytest.raises(ValueError):
+        ruspy.CodeObject.frombytes(b"lixo" + data)
+
+
+def test_conta_instruções(ruspy):
+    code = compile_src(ruspy, "s = 0; for i in 0..100 { s = s + i }; s")
+    vm = ruspy.VirtualMachine()
+    assert vm.run(code, ruspy.new_env()) == 4950
+    assert vm.instructions > 100 * 6